@@ -4,5 +4,5 @@ from .models import UserProfile
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
-    list_display = ("user", "role")
+    list_display = ("user", "role", "zones", "window_capacity", "active_load")
     list_filter = ("role",)
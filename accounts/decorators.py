@@ -0,0 +1,37 @@
+from functools import wraps
+
+from django.contrib.auth.decorators import login_required
+from django.shortcuts import redirect
+from .middleware import MANAGER
+
+
+def is_manager(request):
+    """Managers y superusuarios administran el panel."""
+    return request.user.is_superuser or request.role == MANAGER
+
+
+def redirect_roles(*roles, to="orders:my_orders"):
+    """Vistas de tienda: los usuarios con alguno de ``roles`` se redirigen a ``to``."""
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.role in roles:
+                return redirect(to)
+            return view(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def manager_required(view):
+    """Exige sesión y rol manager (o superusuario); al resto lo envía a sus pedidos."""
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not is_manager(request):
+            return redirect("orders:my_orders")
+        return view(request, *args, **kwargs)
+
+    return login_required(wrapper)
@@ -0,0 +1,33 @@
+"""
+Rol del usuario de la petición.
+
+``RoleMiddleware`` deja en ``request.role`` el rol del perfil ("cliente",
+"manager", "repartidor") o None para anónimos y usuarios sin perfil. Se
+resuelve de forma perezosa: las peticiones que no lo consultan no cargan el
+usuario.
+"""
+from django.core.exceptions import ObjectDoesNotExist
+from django.utils.functional import SimpleLazyObject
+
+MANAGER = "manager"
+RIDER = "repartidor"
+CUSTOMER = "cliente"
+STAFF_ROLES = (MANAGER, RIDER)
+
+
+def resolve_role(user):
+    if not user.is_authenticated:
+        return None
+    try:
+        return user.profile.role
+    except ObjectDoesNotExist:
+        return None
+
+
+class RoleMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.role = SimpleLazyObject(lambda: resolve_role(request.user))
+        return self.get_response(request)
@@ -0,0 +1,34 @@
+# Generated by Django 5.0 on 2026-10-18 12:28
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_active_load(apps, schema_editor):
+    UserProfile = apps.get_model("accounts", "UserProfile")
+    Delivery = apps.get_model("orders", "Delivery")
+    loads = (
+        Delivery.objects.filter(rider__isnull=False)
+        .exclude(status="entregada")
+        .values("rider_id")
+        .annotate(load=Count("id"))
+    )
+    for row in loads:
+        UserProfile.objects.filter(user_id=row["rider_id"]).update(active_load=row["load"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('orders', '0012_order_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='active_load',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_active_load, migrations.RunPython.noop),
+    ]
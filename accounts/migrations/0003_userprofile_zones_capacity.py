@@ -0,0 +1,23 @@
+# Generated by Django 5.0 on 2026-10-18 12:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_userprofile_active_load'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='window_capacity',
+            field=models.PositiveSmallIntegerField(default=6),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='zones',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0 on 2026-10-18 12:40
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_unread_notifications(apps, schema_editor):
+    UserProfile = apps.get_model("accounts", "UserProfile")
+    DeliveryNotification = apps.get_model("orders", "DeliveryNotification")
+    unread = (
+        DeliveryNotification.objects.filter(read=False)
+        .values("recipient_id")
+        .annotate(count=Count("id"))
+    )
+    for row in unread:
+        UserProfile.objects.filter(user_id=row["recipient_id"]).update(unread_notifications=row["count"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_userprofile_zones_capacity'),
+        ('orders', '0014_shared_notification_messages'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='unread_notifications',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_unread_notifications, migrations.RunPython.noop),
+    ]
@@ -10,6 +10,17 @@ class UserProfile(models.Model):
     )
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="profile")
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default="cliente")
+    # Repartidores: entregas asignadas aún no entregadas (mantenido por orders.assignment)
+    active_load = models.PositiveIntegerField(default=0, editable=False)
+    # Repartidores: ciudades o prefijos de código postal que cubre, separados por comas (vacío = todas)
+    zones = models.CharField(max_length=255, blank=True)
+    # Repartidores: máximo de entregas en una misma fecha y franja horaria
+    window_capacity = models.PositiveSmallIntegerField(default=6)
+    # Notificaciones sin leer (mantenido por orders: señales y DeliveryNotificationService.mark_read)
+    unread_notifications = models.PositiveIntegerField(default=0, editable=False)
+
+    def zone_list(self):
+        return [zone.strip().casefold() for zone in self.zones.split(",") if zone.strip()]
 
     def __str__(self) -> str:
         return f"{self.user.username} ({self.role})"
@@ -1,3 +1,66 @@
+from django.contrib.auth import BACKEND_SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
-# Create your tests here.
+from .models import UserProfile
+
+
+class RoleResolutionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = {}
+        for role in ("cliente", "manager", "repartidor"):
+            user = User.objects.create_user(role, password="x")
+            UserProfile.objects.update_or_create(user=user, defaults={"role": role})
+            cls.users[role] = user
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, role, url):
+        self.client.force_login(self.users[role])
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        return response, ctx.captured_queries
+
+    def test_profile_is_loaded_with_the_user(self):
+        for role, url in [
+            ("cliente", reverse("catalog:product_list")),
+            ("cliente", reverse("cart:detail")),
+            ("manager", reverse("orders:panel")),
+            ("repartidor", reverse("orders:my_orders")),
+        ]:
+            with self.subTest(role=role, url=url):
+                response, queries = self.get(role, url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.wsgi_request.role, role)
+                profile_queries = [q for q in queries if q["sql"].startswith('SELECT "accounts_userprofile"')]
+                self.assertEqual(profile_queries, [])
+
+    def test_role_redirects_cost_only_session_and_user(self):
+        for role, url, target in [
+            ("repartidor", reverse("catalog:product_list"), reverse("orders:my_orders")),
+            ("manager", reverse("cart:detail"), reverse("orders:my_orders")),
+            ("manager", reverse("home"), reverse("orders:panel")),
+            ("cliente", reverse("orders:panel"), reverse("orders:my_orders")),
+        ]:
+            with self.subTest(role=role, url=url):
+                response, queries = self.get(role, url)
+                self.assertRedirects(response, target, fetch_redirect_response=False)
+                self.assertEqual(len(queries), 2)
+
+    def test_superuser_is_treated_as_manager(self):
+        admin = User.objects.create_superuser("admin", password="x")
+        self.client.force_login(admin)
+        self.assertEqual(self.client.get(reverse("orders:panel")).status_code, 200)
+        self.assertRedirects(self.client.get(reverse("home")), reverse("orders:panel"), fetch_redirect_response=False)
+
+    def test_sessions_from_the_default_backend_stay_valid(self):
+        self.client.force_login(self.users["repartidor"], backend="django.contrib.auth.backends.ModelBackend")
+        self.assertEqual(self.client.session[BACKEND_SESSION_KEY], "django.contrib.auth.backends.ModelBackend")
+        response = self.client.get(reverse("catalog:product_list"))
+        self.assertRedirects(response, reverse("orders:my_orders"), fetch_redirect_response=False)
@@ -69,5 +69,5 @@ def manage_roles(request):
             messages.error(request, "Usuario no encontrado")
         return redirect("accounts:manage_roles")
 
-    users = User.objects.all().order_by("username")
+    users = User.objects.select_related("profile").order_by("username")
     return render(request, "accounts/manage_roles.html", {"users": users, "roles": ["manager", "cliente", "repartidor"]})
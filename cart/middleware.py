@@ -0,0 +1,13 @@
+from .storage import get_cart_storage
+
+
+class CartMiddleware:
+    """Expone el carrito como ``request.cart`` (ver cart/storage.py)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.cart = get_cart_storage(request)
+        response = self.get_response(request)
+        return request.cart.process_response(response)
@@ -0,0 +1,55 @@
+"""
+Hidratación del carrito: de ``{product_id: {"quantity": n}}`` a líneas con
+producto, cantidad y total, con una sola consulta (``in_bulk``) sea cual sea
+el número de líneas.
+"""
+from decimal import Decimal
+
+from django.contrib import messages
+from catalog.models import Product
+
+
+def hydrate_cart(cart):
+    """
+    Devuelve ``(items, total, missing)``: ``items`` son dicts con product,
+    quantity y line_total en el orden del carrito; ``missing`` son las claves
+    cuyo producto ya no existe (o con datos inválidos).
+    """
+    quantities = {}
+    missing = []
+    for key, item in cart.items():
+        try:
+            quantities[int(key)] = int(item.get("quantity", 1))
+        except (AttributeError, TypeError, ValueError):
+            missing.append(key)
+
+    products = Product.objects.select_related("category").in_bulk(quantities)
+    items = []
+    total = Decimal("0")
+    for product_id, quantity in quantities.items():
+        product = products.get(product_id)
+        if product is None:
+            missing.append(str(product_id))
+            continue
+        if quantity < 1:
+            continue
+        line_total = product.price * quantity
+        total += line_total
+        items.append({"product": product, "quantity": quantity, "line_total": line_total})
+    return items, total, missing
+
+
+def load_cart(request):
+    """
+    Hidrata el carrito del visitante (``request.cart``). Los productos que desaparecieron del
+    catálogo se quitan del carrito con un aviso en lugar de romper la vista.
+    Devuelve ``(items, total, removed)`` con el número de líneas quitadas.
+    """
+    cart = request.cart.load()
+    items, total, missing = hydrate_cart(cart)
+    if missing:
+        for key in missing:
+            cart.pop(key, None)
+        request.cart.save(cart)
+        messages.warning(request, "Algunos productos de tu carrito ya no están disponibles y se quitaron.")
+    return items, total, len(missing)
@@ -0,0 +1,14 @@
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.dispatch import receiver
+
+
+@receiver(user_logged_out)
+def discard_cart_on_logout(sender, request, **kwargs):
+    if request is not None and hasattr(request, "cart"):
+        request.cart.discard()
+
+
+@receiver(user_logged_in)
+def rotate_cart_on_login(sender, request, **kwargs):
+    if request is not None and hasattr(request, "cart"):
+        request.cart.rotate()
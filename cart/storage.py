@@ -0,0 +1,188 @@
+"""
+Almacenamiento del carrito.
+
+El carrito es un dict ``{product_id: {"quantity": n}}``; dónde vive lo
+decide ``settings.CART_STORAGE``:
+
+* ``SessionCartStorage``: en la sesión (comportamiento original; cada cambio
+  reescribe la fila de la sesión en la base de datos).
+* ``SignedCookieCartStorage``: en una cookie firmada; no toca el servidor,
+  pensado para visitantes anónimos (límite de ~4 KB).
+* ``CacheCartStorage``: en la caché ``carts`` bajo un id aleatorio guardado en
+  cookie firmada (LocMem en local, Redis en producción).
+
+``CartMiddleware`` expone el backend como ``request.cart`` y le deja escribir
+sus cookies en la respuesta. Las cookies sobreviven a ``logout()``, así que
+``cart/signals.py`` descarta el carrito al cerrar sesión y lo cambia de id al
+iniciarla: en un navegador compartido nadie ve el carrito del anterior.
+"""
+import secrets
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+COOKIE_MAX_AGE = 60 * 60 * 24 * 30
+
+
+class BaseCartStorage:
+    def __init__(self, request):
+        self.request = request
+
+    def load(self):
+        raise NotImplementedError
+
+    def save(self, cart):
+        raise NotImplementedError
+
+    def clear(self):
+        self.save({})
+
+    def discard(self):
+        """Olvida el carrito al cerrar sesión."""
+        self.clear()
+
+    def rotate(self):
+        """Al iniciar sesión: conserva el carrito visible bajo un identificador nuevo."""
+
+    def process_response(self, response):
+        return response
+
+
+class SessionCartStorage(BaseCartStorage):
+    def load(self):
+        return self.request.session.get("cart", {})
+
+    def save(self, cart):
+        self.request.session["cart"] = cart
+        self.request.session.modified = True
+
+    def discard(self):
+        # logout() ya vació la sesión
+        pass
+
+
+class _CookieMixin:
+    cookie_name = None
+    salt = None
+
+    def _read_cookie(self):
+        return self.request.get_signed_cookie(self.cookie_name, default=None, salt=self.salt, max_age=COOKIE_MAX_AGE)
+
+    def _write_cookie(self, response, value):
+        response.set_signed_cookie(
+            self.cookie_name,
+            value,
+            salt=self.salt,
+            max_age=COOKIE_MAX_AGE,
+            httponly=True,
+            samesite="Lax",
+            secure=self.request.is_secure(),
+        )
+
+
+class SignedCookieCartStorage(_CookieMixin, BaseCartStorage):
+    cookie_name = "cart"
+    salt = "cart.storage.cookie"
+
+    def __init__(self, request):
+        super().__init__(request)
+        self._changed = None
+
+    def load(self):
+        if self._changed is not None:
+            return self._changed
+        raw = self._read_cookie()
+        if raw is None:
+            return {}
+        try:
+            return signing.loads(raw, salt=self.salt)
+        except signing.BadSignature:
+            return {}
+
+    def save(self, cart):
+        self._changed = cart
+
+    def process_response(self, response):
+        if self._changed is None:
+            return response
+        if self._changed:
+            self._write_cookie(response, signing.dumps(self._changed, salt=self.salt, compress=True))
+        else:
+            response.delete_cookie(self.cookie_name, samesite="Lax")
+        return response
+
+
+class CacheCartStorage(_CookieMixin, BaseCartStorage):
+    cookie_name = "cart_id"
+    salt = "cart.storage.cache"
+
+    def __init__(self, request):
+        super().__init__(request)
+        self.cache = caches[getattr(settings, "CART_CACHE_ALIAS", "carts")]
+        self.cart_id = self._read_cookie()
+        self._new_id = False
+        self._deleted = False
+
+    def _key(self):
+        return f"cart:{self.cart_id}"
+
+    def _owner(self):
+        user = getattr(self.request, "user", None)
+        return user.pk if user is not None and user.is_authenticated else None
+
+    def load(self):
+        if not self.cart_id:
+            return {}
+        entry = self.cache.get(self._key())
+        if isinstance(entry, dict):
+            # Formato anterior, sin dueño
+            return entry
+        if entry is None:
+            return {}
+        owner, cart = entry
+        # El carrito de un usuario no se muestra a nadie más con la misma cookie
+        if owner is not None and owner != self._owner():
+            return {}
+        return cart
+
+    def save(self, cart):
+        if not self.cart_id:
+            # El id se crea con el primer cambio: quien solo navega no ocupa caché
+            self.cart_id = secrets.token_urlsafe(24)
+            self._new_id = True
+        self.cache.set(self._key(), (self._owner(), cart), COOKIE_MAX_AGE)
+
+    def clear(self):
+        if self.cart_id:
+            self.cache.delete(self._key())
+
+    def discard(self):
+        self.clear()
+        self.cart_id = None
+        self._new_id = False
+        self._deleted = True
+
+    def rotate(self):
+        if not self.cart_id:
+            return
+        cart = self.load()
+        self.cache.delete(self._key())
+        self.cart_id = None
+        if cart:
+            self.save(cart)
+        else:
+            self._deleted = True
+
+    def process_response(self, response):
+        if self._new_id:
+            self._write_cookie(response, self.cart_id)
+        elif self._deleted:
+            response.delete_cookie(self.cookie_name, samesite="Lax")
+        return response
+
+
+def get_cart_storage(request):
+    storage_class = import_string(getattr(settings, "CART_STORAGE", "cart.storage.SessionCartStorage"))
+    return storage_class(request)
@@ -1,3 +1,89 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from django.db import connection
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog.models import Category, Product
+
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "cart-tests-default"},
+    "carts": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "cart-tests-carts"},
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CartStorageTests(TestCase):
+    backends = (
+        "cart.storage.SessionCartStorage",
+        "cart.storage.SignedCookieCartStorage",
+        "cart.storage.CacheCartStorage",
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Zapatos")
+        cls.tenis = Product.objects.create(category=category, name="Tenis", price=Decimal("50.00"), stock=10)
+        cls.botas = Product.objects.create(category=category, name="Botas", price=Decimal("90.00"), stock=10)
+
+    def cart(self):
+        response = self.client.get(reverse("cart:detail"))
+        return {item["product"].name: item["quantity"] for item in response.context["items"]}
+
+    def test_backends_keep_the_cart_between_requests(self):
+        for backend in self.backends:
+            with self.subTest(backend=backend), self.settings(CART_STORAGE=backend):
+                self.client.cookies.clear()
+                self.client.post(reverse("cart:add", args=[self.tenis.id]), {"quantity": 2})
+                self.client.post(reverse("cart:add", args=[self.botas.id]))
+                self.client.post(reverse("cart:add", args=[self.tenis.id]))
+                self.assertEqual(self.cart(), {"Tenis": 3, "Botas": 1})
+                self.client.post(reverse("cart:update", args=[self.botas.id]), {"quantity": 4})
+                self.client.get(reverse("cart:remove", args=[self.tenis.id]))
+                self.assertEqual(self.cart(), {"Botas": 4})
+
+    def test_cookie_and_cache_mutations_skip_the_session_table(self):
+        for backend in self.backends[1:]:
+            with self.subTest(backend=backend), self.settings(CART_STORAGE=backend):
+                self.client.cookies.clear()
+                with CaptureQueriesContext(connection) as ctx:
+                    self.client.post(reverse("cart:add", args=[self.tenis.id]))
+                self.assertFalse(any("django_session" in q["sql"] for q in ctx.captured_queries))
+
+    def test_tampered_cookie_is_ignored(self):
+        with self.settings(CART_STORAGE="cart.storage.SignedCookieCartStorage"):
+            self.client.post(reverse("cart:add", args=[self.tenis.id]))
+            self.client.cookies["cart"] = self.client.cookies["cart"].value[:-2] + "xx"
+            self.assertEqual(self.cart(), {})
+
+    def test_shared_browser_does_not_leak_the_cart_between_users(self):
+        User.objects.create_user("ana", password="x")
+        User.objects.create_user("beto", password="x")
+        for backend in self.backends:
+            with self.subTest(backend=backend), self.settings(CART_STORAGE=backend):
+                self.client.cookies.clear()
+                self.client.post(reverse("cart:add", args=[self.botas.id]))
+                self.client.post(reverse("accounts:login"), {"username": "ana", "password": "x"})
+                # El carrito anónimo pasa a la cuenta que inicia sesión
+                self.assertEqual(self.cart(), {"Botas": 1})
+                self.client.post(reverse("cart:add", args=[self.tenis.id]))
+                self.client.get(reverse("accounts:logout"))
+                self.assertEqual(self.cart(), {})
+                self.client.post(reverse("accounts:login"), {"username": "beto", "password": "x"})
+                self.assertEqual(self.cart(), {})
+                self.client.get(reverse("accounts:logout"))
+
+    def test_login_as_another_user_without_logout_starts_an_empty_cart(self):
+        User.objects.create_user("ana", password="x")
+        User.objects.create_user("beto", password="x")
+        with self.settings(CART_STORAGE="cart.storage.CacheCartStorage"):
+            self.client.post(reverse("accounts:login"), {"username": "ana", "password": "x"})
+            self.client.post(reverse("cart:add", args=[self.tenis.id]))
+            cookie = self.client.cookies["cart_id"].value
+            self.client.post(reverse("accounts:login"), {"username": "beto", "password": "x"})
+            self.assertEqual(self.cart(), {})
+            # Aunque se reponga la cookie vieja, el carrito es de otra cuenta
+            self.client.cookies["cart_id"] = cookie
+            self.assertEqual(self.cart(), {})
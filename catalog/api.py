@@ -0,0 +1,132 @@
+"""
+API JSON de solo lectura del catálogo (``/shop/api/products/``).
+
+Las respuestas se arman con ``.values()`` (sin instanciar modelos) y se
+serializan con orjson. ETag y Last-Modified salen de la fila
+``CatalogVersion`` (cambia con borrados, categorías y altas) y de
+``max(updated_at)`` de los productos (cambia también con el stock), leídos en
+cada petición con una sola consulta: la fila por clave primaria y el máximo
+desde el final del índice ``product_updated_idx``, sin recorrerlo. No se
+cachea en el proceso, así que todos los workers responden con el mismo ETag
+en cuanto cambia el catálogo, y una petición condicional sin cambios
+responde 304 sin leer ningún producto.
+"""
+import hashlib
+
+import orjson
+from django.db.models import DateTimeField
+from django.db.models.expressions import RawSQL
+from django.http import Http404, HttpResponse
+from django.urls import reverse
+from django.views.decorators.http import condition, require_safe
+
+from .cache import catalog_version
+from .models import CatalogVersion, Product
+from .pagination import PAGE_SIZE, KeysetPaginator, cursor_querystring
+from .search import search_products
+from .templatetags.product_tags import resolve_image_fields
+
+MAX_LIMIT = 100
+LIST_FIELDS = (
+    "id", "slug", "name", "price", "stock", "category__slug", "category__name",
+    "image", "image_variants", "updated_at",
+)
+DETAIL_FIELDS = LIST_FIELDS + ("description", "created_at")
+
+
+def catalog_stamp(request):
+    """``version``, ``updated_at`` (de la versión) y ``products_updated_at``; una consulta por petición."""
+    if not hasattr(request, "_catalog_stamp"):
+        # MAX a secas: el motor lo resuelve con una búsqueda en el índice
+        newest = RawSQL(f'SELECT MAX("updated_at") FROM "{Product._meta.db_table}"', (), output_field=DateTimeField())
+        rows = CatalogVersion.objects.filter(pk=1).values("version", "updated_at").annotate(products_updated_at=newest)
+        stamp = rows.first()
+        if stamp is None:
+            catalog_version()  # crea la fila
+            stamp = rows.first()
+        request._catalog_stamp = stamp
+    return request._catalog_stamp
+
+
+def _etag(request, *args, **kwargs):
+    stamp = catalog_stamp(request)
+    return hashlib.md5(f"{stamp['version']}:{stamp['products_updated_at']}".encode()).hexdigest()
+
+
+def _last_modified(request, *args, **kwargs):
+    stamp = catalog_stamp(request)
+    return max(filter(None, (stamp["updated_at"], stamp["products_updated_at"])))
+
+
+def _json_default(value):
+    # Decimal (precio) como cadena para no perder precisión
+    return str(value)
+
+
+def json_response(data):
+    return HttpResponse(orjson.dumps(data, default=_json_default), content_type="application/json")
+
+
+def _serialize(request, row):
+    image = resolve_image_fields(row["id"], row["updated_at"], row["name"], row["image"], row["image_variants"])
+    data = {
+        "id": row["id"],
+        "slug": row["slug"],
+        "name": row["name"],
+        "price": row["price"],
+        "stock": row["stock"],
+        "category": {"slug": row["category__slug"], "name": row["category__name"]},
+        "image": request.build_absolute_uri(image) if image else None,
+        "url": request.build_absolute_uri(reverse("catalog:product_detail", args=[row["slug"]])),
+        "updated_at": row["updated_at"],
+    }
+    if "description" in row:
+        data["description"] = row["description"]
+        data["created_at"] = row["created_at"]
+    return data
+
+
+def _limit(value):
+    try:
+        return max(1, min(int(value), MAX_LIMIT))
+    except (TypeError, ValueError):
+        return PAGE_SIZE
+
+
+@require_safe
+@condition(etag_func=_etag, last_modified_func=_last_modified)
+def product_list(request):
+    """Listado paginado por cursor; filtros opcionales ``q``, ``category`` y ``limit``."""
+    query = " ".join(request.GET.get("q", "").split())
+    category_slug = request.GET.get("category")
+    limit = _limit(request.GET.get("limit"))
+    filters = {key: value for key, value in (("q", query), ("category", category_slug)) if value}
+    if limit != PAGE_SIZE:
+        filters["limit"] = limit
+
+    products = Product.objects.all()
+    ordering = ("-created_at", "id")
+    fields = LIST_FIELDS + ("created_at",)
+    if query:
+        products = search_products(products, query)
+        ordering = ("-search_rank",) + ordering
+        fields += ("search_rank",)
+    if category_slug:
+        products = products.filter(category__slug=category_slug)
+
+    page = KeysetPaginator(products.values(*fields), ordering, per_page=limit).page(request.GET.get("cursor"))
+    base = request.build_absolute_uri(request.path)
+    return json_response({
+        "results": [_serialize(request, row) for row in page],
+        "next": f"{base}?{cursor_querystring(filters, page.next_cursor)}" if page.has_next else None,
+        "previous": f"{base}?{cursor_querystring(filters, page.previous_cursor)}" if page.has_previous else None,
+    })
+
+
+@require_safe
+@condition(etag_func=_etag, last_modified_func=_last_modified)
+def product_detail(request, slug: str):
+    row = Product.objects.filter(slug=slug).values(*DETAIL_FIELDS).first()
+    if row is None:
+        raise Http404("Producto no encontrado")
+    return json_response(_serialize(request, row))
@@ -0,0 +1,82 @@
+"""
+Caché de fragmentos HTML del catálogo.
+
+Los fragmentos se guardan bajo un sello de versión del catálogo
+(``CatalogVersion``, una fila en la base de datos: todos los workers y los
+comandos de gestión comparten el mismo aunque la caché sea LocMem por
+proceso). Cualquier escritura sobre Product/Category incrementa el sello, de
+modo que las claves antiguas dejan de leerse y caducan solas por TTL; no hace
+falta borrar entradas una a una. Los cambios de stock solo lo incrementan
+cuando cambia lo que muestran los fragmentos (ver ``ProductQuerySet.add_stock``).
+
+Los fragmentos contienen formularios (agregar al carrito), así que se
+renderizan con un marcador en lugar del token CSRF y el token real del
+usuario se sustituye al servirlos.
+"""
+import hashlib
+import json
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.middleware.csrf import get_token
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+
+FRAGMENT_TIMEOUT = 60 * 10
+CSRF_PLACEHOLDER = "__catalog_csrf_token__"
+
+
+def _create_version():
+    from .models import CatalogVersion
+
+    # Valor inicial basado en el tiempo: si la fila se pierde (base de datos
+    # nueva) nunca se reutiliza una versión con fragmentos aún en caché.
+    return CatalogVersion.objects.get_or_create(pk=1, defaults={"version": int(time.time() * 1000)})[0]
+
+
+def catalog_version():
+    from .models import CatalogVersion
+
+    try:
+        return CatalogVersion.objects.values_list("version", flat=True).get(pk=1)
+    except CatalogVersion.DoesNotExist:
+        return _create_version().version
+
+
+def bump_catalog_version():
+    from .models import CatalogVersion
+
+    if not CatalogVersion.objects.filter(pk=1).update(version=F("version") + 1, updated_at=timezone.now()):
+        _create_version()
+
+
+def bump_catalog_version_on_commit():
+    """Invalida tras el commit, para no cachear datos aún no confirmados con la versión nueva."""
+    transaction.on_commit(bump_catalog_version)
+
+
+def fragment_key(name, vary_on):
+    digest = hashlib.md5(json.dumps(vary_on, default=str).encode()).hexdigest()
+    return f"catalog:fragment:{catalog_version()}:{name}:{digest}"
+
+
+def cached_value(name, vary_on, compute):
+    """Valor de ``compute()`` cacheado bajo la versión actual del catálogo."""
+    key = fragment_key(name, vary_on)
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, FRAGMENT_TIMEOUT)
+    return value
+
+
+def cached_fragment(request, name, vary_on, render):
+    """
+    Devuelve el HTML del fragmento ``name`` para los parámetros ``vary_on``.
+    ``render`` solo se invoca si no hay entrada vigente; debe renderizar con
+    ``csrf_token=CSRF_PLACEHOLDER`` en el contexto.
+    """
+    html = cached_value(name, vary_on, render)
+    return mark_safe(html.replace(CSRF_PLACEHOLDER, get_token(request)))
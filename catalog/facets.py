@@ -0,0 +1,100 @@
+"""
+Facetas del listado: productos por categoría e histograma de precios.
+
+Salen de una sola consulta agrupada por categoría sobre los productos que
+coinciden con la búsqueda, con un ``COUNT(*) FILTER (...)`` por tramo de
+precio y otro para el rango de precio activo. Cada faceta ignora su propio
+filtro (facetado disyuntivo):
+
+* el conteo por categoría respeta búsqueda y rango de precio;
+* el histograma respeta búsqueda y categoría seleccionada.
+"""
+from decimal import Decimal, InvalidOperation
+from urllib.parse import urlencode
+
+from django.db.models import Count, Q
+
+# Límites de los tramos de precio; el último tramo no tiene tope
+PRICE_EDGES = (Decimal("0"), Decimal("25"), Decimal("50"), Decimal("100"), Decimal("200"))
+CENT = Decimal("0.01")
+
+
+def parse_price(value):
+    """Precio del querystring normalizado a 2 decimales; None si está vacío o no es válido."""
+    try:
+        price = Decimal(value).quantize(CENT)
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+    return price if price.is_finite() and price >= 0 else None
+
+
+def price_buckets():
+    """Pares (desde, hasta) con ``hasta`` exclusivo (None en el último)."""
+    return list(zip(PRICE_EDGES, PRICE_EDGES[1:] + (None,)))
+
+
+def _bucket_filter(low, high):
+    condition = Q(price__gte=low)
+    if high is not None:
+        condition &= Q(price__lt=high)
+    return condition
+
+
+def facet_counts(queryset, filters):
+    """
+    ``queryset`` debe llevar solo el filtro de búsqueda; ``filters`` son los
+    filtros normalizados del listado (q, category, min, max).
+    """
+    in_range = Q()
+    if "min" in filters:
+        in_range &= Q(price__gte=filters["min"])
+    if "max" in filters:
+        in_range &= Q(price__lte=filters["max"])
+    buckets = price_buckets()
+    aggregates = {f"bucket_{i}": Count("id", filter=_bucket_filter(low, high)) for i, (low, high) in enumerate(buckets)}
+    aggregates["in_range"] = Count("id", filter=in_range) if in_range else Count("id")
+
+    rows = list(
+        queryset.order_by()
+        .values("category__slug", "category__name")
+        .annotate(**aggregates)
+        .order_by("category__name")
+    )
+
+    selected = filters.get("category")
+    categories = [
+        {
+            "slug": row["category__slug"],
+            "name": row["category__name"],
+            "count": row["in_range"],
+            "selected": row["category__slug"] == selected,
+        }
+        for row in rows
+    ]
+    histogram_rows = [row for row in rows if not selected or row["category__slug"] == selected]
+    counts = [sum(row[f"bucket_{i}"] for row in histogram_rows) for i in range(len(buckets))]
+    tallest = max(counts, default=0) or 1
+
+    price_facets = []
+    for (low, high), count in zip(buckets, counts):
+        bounds = {"min": str(low.quantize(CENT))}
+        if high is not None:
+            # max es inclusivo en el filtro: el tramo termina un céntimo antes
+            bounds["max"] = str(high - CENT)
+        querystring = {key: value for key, value in filters.items() if key not in {"min", "max"}}
+        querystring.update(bounds)
+        price_facets.append({
+            "low": low,
+            "high": high,
+            "count": count,
+            "percent": round(100 * count / tallest),
+            "query": urlencode({key: str(value) for key, value in querystring.items()}),
+            "selected": all(str(filters.get(key)) == value for key, value in bounds.items())
+            and ("max" in filters) == ("max" in bounds),
+        })
+
+    return {
+        "categories": categories,
+        "total": sum(category["count"] for category in categories),
+        "price_buckets": price_facets,
+    }
@@ -0,0 +1,83 @@
+"""
+Derivados responsive de ``Product.image``.
+
+Por cada imagen subida se generan miniaturas de ancho fijo en WebP y JPEG,
+guardadas junto al original con nombres por hash de contenido
+(``products/<hash>-320w.webp``). Dos productos con la misma imagen comparten
+derivados, y un derivado ya existente no se vuelve a generar.
+"""
+import hashlib
+import logging
+import posixpath
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVE_WIDTHS = (320, 640, 960)
+FORMATS = {
+    "webp": {"format": "WEBP", "quality": 80, "method": 4},
+    "jpg": {"format": "JPEG", "quality": 82, "optimize": True, "progressive": True},
+}
+
+
+def derivative_name(source_name, content_hash, width, extension):
+    return posixpath.join(posixpath.dirname(source_name), f"{content_hash}-{width}w.{extension}")
+
+
+def _encode(image, extension):
+    options = dict(FORMATS[extension])
+    if extension == "jpg" and image.mode != "RGB":
+        # JPEG no admite transparencia: componer sobre fondo blanco
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        rgba = image.convert("RGBA")
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        image = background
+    buffer = BytesIO()
+    image.save(buffer, **options)
+    return buffer.getvalue()
+
+
+def generate_derivatives(image_field):
+    """
+    Genera los derivados de ``image_field`` (un FieldFile ya guardado).
+    Devuelve la descripción que se persiste en ``Product.image_variants``
+    (sin anchos si la imagen no se puede leer, para no reintentar en cada save).
+    """
+    storage = image_field.storage
+    try:
+        with storage.open(image_field.name, "rb") as source:
+            content = source.read()
+        content_hash = hashlib.sha256(content).hexdigest()[:16]
+        image = Image.open(BytesIO(content))
+        image.load()
+    except (OSError, UnidentifiedImageError):
+        logger.warning("No se pudieron generar derivados para %s", image_field.name, exc_info=True)
+        return {"source": image_field.name}
+
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA")
+
+    widths = [width for width in DERIVATIVE_WIDTHS if width < image.width]
+    for width in widths:
+        height = max(1, round(image.height * width / image.width))
+        resized = None
+        for extension in FORMATS:
+            name = derivative_name(image_field.name, content_hash, width, extension)
+            if storage.exists(name):
+                continue
+            if resized is None:
+                resized = image.resize((width, height), Image.LANCZOS)
+            storage.save(name, ContentFile(_encode(resized, extension)))
+
+    return {"source": image_field.name, "hash": content_hash, "widths": widths, "width": image.width}
+
+
+def variant_srcset(storage, source_name, content_hash, widths, extension):
+    """``srcset`` con los derivados de ``extension`` ("webp" o "jpg"); cadena vacía si no hay."""
+    return ", ".join(
+        f"{storage.url(derivative_name(source_name, content_hash, width, extension))} {width}w"
+        for width in widths
+    )
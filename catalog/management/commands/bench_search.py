@@ -0,0 +1,73 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from catalog.models import Category, Product
+from catalog.search import search_products
+
+
+WORDS = [
+    "tenis", "urban", "botas", "trekking", "aroma", "nocturno", "cítrico", "fresh",
+    "proteína", "whey", "caseína", "vainilla", "chocolate", "running", "cuero",
+    "deportivo", "fragancia", "loción", "montaña", "noche", "ligero", "resistente",
+]
+# Términos comunes (coinciden con gran parte del catálogo), una referencia selectiva y un término sin resultados
+QUERIES = ["tenis", "proteina whey", "aroma nocturno", "ref777", "zzz inexistente"]
+
+
+class Command(BaseCommand):
+    help = "Mide la latencia de la búsqueda de productos con catálogos grandes (los datos se revierten al final)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size", type=int, default=100_000, help="Tamaño final del catálogo")
+        parser.add_argument("--steps", type=int, default=4, help="Puntos de medición intermedios")
+        parser.add_argument("--repeat", type=int, default=20, help="Repeticiones por consulta")
+        parser.add_argument("--batch", type=int, default=5_000)
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        size, steps = options["size"], options["steps"]
+        checkpoints = [size * (i + 1) // steps for i in range(steps)]
+
+        with transaction.atomic():
+            category, _ = Category.objects.get_or_create(name="Benchmark")
+            created = 0
+            for checkpoint in checkpoints:
+                while created < checkpoint:
+                    count = min(options["batch"], checkpoint - created)
+                    Product.objects.bulk_create(
+                        [
+                            Product(
+                                category=category,
+                                name=" ".join(rng.sample(WORDS, 3)).title(),
+                                slug=f"bench-{created + i}",
+                                description=" ".join(rng.choices(WORDS, k=12)) + f" ref{created + i}",
+                                price=Decimal(rng.randint(500, 20000)) / 100,
+                                stock=rng.randint(0, 100),
+                            )
+                            for i in range(count)
+                        ],
+                        batch_size=options["batch"],
+                    )
+                    created += count
+                self._measure(checkpoint, options["repeat"])
+            # No dejar los productos sintéticos en la base de datos
+            transaction.set_rollback(True)
+
+    def _measure(self, catalog_size, repeat):
+        base = Product.objects.select_related("category")
+        self.stdout.write(f"{catalog_size} productos")
+        for query in QUERIES:
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                # Misma forma que la primera página del listado
+                list(search_products(base, query).order_by("-search_rank", "-created_at")[:24])
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            self.stdout.write(
+                f"  {query!r:<20} p50={statistics.median(timings):7.2f} ms  max={timings[-1]:7.2f} ms"
+            )
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+from catalog.recommendations import TOP_K, build_recommendations
+
+
+class Command(BaseCommand):
+    help = "Actualiza las recomendaciones 'comprados juntos' con los pedidos nuevos"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--k", type=int, default=TOP_K, help="Vecinos guardados por producto")
+        parser.add_argument("--full", action="store_true", help="Recalcular desde cero (p. ej. tras borrar pedidos)")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        run = build_recommendations(k=options["k"], full=options["full"])
+        self.stdout.write(self.style.SUCCESS(
+            f"{run.orders_processed} pedidos nuevos, {run.products_updated} productos actualizados "
+            f"(hasta el pedido #{run.last_order_id}) en {time.perf_counter() - started:.2f}s"
+        ))
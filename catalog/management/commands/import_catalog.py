@@ -0,0 +1,206 @@
+import csv
+import hashlib
+import json
+import posixpath
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from pathlib import Path
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.fields.files import FieldFile
+from django.utils.text import slugify
+from catalog.images import generate_derivatives
+from catalog.models import Category, Product
+
+
+PRODUCT_FIELDS = ["name", "category", "price", "stock", "description", "updated_at"]
+IMAGE_FIELDS = ["image", "image_variants"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa productos desde CSV o JSONL (streaming, upsert por slug en lotes). "
+        "Columnas: name, category, price, stock, description, slug (opcional), image (ruta opcional)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Archivo .csv o .jsonl ('-' para stdin)")
+        parser.add_argument("--format", choices=["csv", "jsonl"], help="Por defecto según la extensión")
+        parser.add_argument("--batch", type=int, default=1_000)
+        parser.add_argument("--images-dir", default=".", help="Base de las rutas relativas de la columna image")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+        self.images_dir = Path(options["images_dir"])
+        self.image_field = Product._meta.get_field("image")
+        self.category_ids = {}
+        self._remember_categories(Category.objects.all())
+        # hash de contenido -> (nombre en storage, image_variants); evita releer/recodificar duplicados
+        self.images = {}
+        self.stats = {"rows": 0, "skipped": 0, "images_stored": 0, "images_reused": 0}
+
+        started = time.perf_counter()
+        try:
+            stream = sys.stdin if path == "-" else open(path, encoding="utf-8", newline="")
+        except OSError as exc:
+            raise CommandError(f"No se pudo abrir {path}: {exc}")
+        try:
+            rows = self._read(stream, fmt)
+            while batch := list(islice(rows, options["batch"])):
+                self._import_batch(batch)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"  {self.stats['rows']} filas ({self.stats['rows'] / elapsed:.0f} filas/s)", ending="\r"
+                )
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Importadas {self.stats['rows']} filas en {elapsed:.2f}s "
+            f"({self.stats['rows'] / max(elapsed, 1e-9):.0f} filas/s); "
+            f"{self.stats['skipped']} omitidas; imágenes: {self.stats['images_stored']} nuevas, "
+            f"{self.stats['images_reused']} reutilizadas"
+        ))
+
+    def _read(self, stream, fmt):
+        """Genera (número de línea, fila) sin cargar el archivo entero."""
+        if fmt == "csv":
+            reader = csv.DictReader(stream)
+            for row in reader:
+                yield reader.line_num, row
+            return
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except json.JSONDecodeError as exc:
+                self._skip(line_number, f"JSON inválido ({exc.msg})")
+
+    def _warn(self, line_number, message):
+        self.stderr.write(self.style.WARNING(f"  Línea {line_number}: {message}"))
+
+    def _skip(self, line_number, reason):
+        self.stats["skipped"] += 1
+        self._warn(line_number, f"omitida, {reason}")
+
+    def _parse(self, line_number, row):
+        name = (row.get("name") or "").strip()
+        category = (row.get("category") or "").strip()
+        if not name or not slugify(category):
+            self._skip(line_number, "faltan name o category")
+            return None
+        try:
+            price = Decimal(str(row.get("price"))).quantize(Decimal("0.01"))
+            stock = int(row.get("stock") or 0)
+        except (InvalidOperation, TypeError, ValueError):
+            self._skip(line_number, "price o stock inválidos")
+            return None
+        if not price.is_finite() or price < 0 or stock < 0:
+            self._skip(line_number, "price o stock negativos")
+            return None
+        slug = slugify(row.get("slug") or name)
+        if not slug:
+            self._skip(line_number, "no se pudo derivar el slug")
+            return None
+        return {
+            "slug": slug,
+            "name": name[:200],
+            "category": category,
+            "price": price,
+            "stock": stock,
+            "description": row.get("description") or "",
+            "image": (row.get("image") or "").strip(),
+            "line": line_number,
+        }
+
+    def _remember_categories(self, queryset):
+        # Una categoría se reconoce por su slug o por su nombre exacto
+        for category_id, name, slug in queryset.values_list("id", "name", "slug"):
+            self.category_ids[slug] = self.category_ids[name] = category_id
+
+    def _category_id(self, name):
+        return self.category_ids.get(slugify(name)) or self.category_ids.get(name)
+
+    def _create_categories(self, names):
+        missing = {slugify(name): name for name in names if self._category_id(name) is None}
+        if missing:
+            Category.objects.bulk_create(
+                [Category(name=name, slug=slug) for slug, name in missing.items()], ignore_conflicts=True
+            )
+            self._remember_categories(
+                Category.objects.filter(Q(slug__in=missing) | Q(name__in=missing.values()))
+            )
+
+    def _store_image(self, line_number, path):
+        """Guarda la imagen con nombre por hash de contenido; devuelve (nombre, variants) o None."""
+        source = Path(path) if Path(path).is_absolute() else self.images_dir / path
+        try:
+            content = source.read_bytes()
+        except OSError:
+            self._warn(line_number, f"imagen no encontrada: {path} (el producto se importa sin cambiar su imagen)")
+            return None
+        content_hash = hashlib.sha256(content).hexdigest()[:16]
+        if content_hash in self.images:
+            self.stats["images_reused"] += 1
+            return self.images[content_hash]
+
+        storage = self.image_field.storage
+        name = posixpath.join(self.image_field.upload_to, f"{content_hash}{source.suffix.lower()}")
+        if storage.exists(name):
+            self.stats["images_reused"] += 1
+        else:
+            name = storage.save(name, ContentFile(content))
+            self.stats["images_stored"] += 1
+        # bulk_create no pasa por Product.save(): generar aquí las miniaturas
+        variants = generate_derivatives(FieldFile(None, self.image_field, name))
+        self.images[content_hash] = (name, variants)
+        return self.images[content_hash]
+
+    def _import_batch(self, batch):
+        parsed = {}
+        for line_number, row in batch:
+            if not isinstance(row, dict):
+                self._skip(line_number, "la fila no es un objeto")
+                continue
+            item = self._parse(line_number, row)
+            if item is not None:
+                # Un slug repetido en el lote: gana la última fila (un upsert no puede tocar la misma fila dos veces)
+                parsed[item["slug"]] = item
+        if not parsed:
+            return
+
+        self._create_categories({item["category"] for item in parsed.values()})
+        with_image, without_image = [], []
+        for item in parsed.values():
+            product = Product(
+                slug=item["slug"],
+                name=item["name"],
+                category_id=self._category_id(item["category"]),
+                price=item["price"],
+                stock=item["stock"],
+                description=item["description"],
+            )
+            stored = self._store_image(item["line"], item["image"]) if item["image"] else None
+            if stored:
+                product.image, product.image_variants = stored
+                with_image.append(product)
+            else:
+                without_image.append(product)
+
+        with transaction.atomic():
+            # Sin imagen en la fila no se toca la imagen existente del producto
+            for products, fields in ((with_image, PRODUCT_FIELDS + IMAGE_FIELDS), (without_image, PRODUCT_FIELDS)):
+                if products:
+                    Product.objects.bulk_create(
+                        products, update_conflicts=True, unique_fields=["slug"], update_fields=fields
+                    )
+        self.stats["rows"] += len(parsed)
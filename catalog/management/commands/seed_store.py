@@ -72,10 +72,15 @@ class Command(BaseCommand):
                     
                     if image_path.exists():
                         with open(image_path, 'rb') as img_file:
+                            # save=True dispara Product.save(), que genera las miniaturas
                             prod.image.save(image_filename, File(img_file), save=True)
                         self.stdout.write(self.style.SUCCESS(f"  → Image assigned to {prod.name}"))
                     else:
                         self.stdout.write(self.style.WARNING(f"  ⚠ Image not found: {image_filename}"))
+                elif prod.image and prod.image_variants.get("source") != prod.image.name:
+                    # Imagen previa sin miniaturas: generar derivados WebP/JPEG
+                    prod.refresh_image_variants()
+                    self.stdout.write(self.style.SUCCESS(f"  → Thumbnails generated for {prod.name}"))
                 
                 created += 1
             self.stdout.write(self.style.SUCCESS(f"Seeded/updated {created} products for {category.name}"))
@@ -0,0 +1,54 @@
+# Índice de búsqueda de productos: tsvector + GIN + trigramas en PostgreSQL,
+# tabla virtual FTS5 sincronizada por triggers en SQLite.
+
+from django.db import migrations
+
+from catalog.search_schema import SQLITE_FTS_DROP, SQLITE_FTS_REBUILD, SQLITE_FTS_TABLE, SQLITE_FTS_TRIGGERS
+
+
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    ALTER TABLE catalog_product ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('spanish'::regconfig, coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('spanish'::regconfig, coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX catalog_product_search_vector_gin ON catalog_product USING GIN (search_vector)",
+    "CREATE INDEX catalog_product_name_trgm ON catalog_product USING GIN (name gin_trgm_ops)",
+]
+
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS catalog_product_name_trgm",
+    "DROP INDEX IF EXISTS catalog_product_search_vector_gin",
+    "ALTER TABLE catalog_product DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_FORWARD = [SQLITE_FTS_TABLE, *SQLITE_FTS_TRIGGERS, SQLITE_FTS_REBUILD]
+
+SQLITE_REVERSE = list(SQLITE_FTS_DROP)
+
+
+def _run(schema_editor, statements_by_vendor):
+    for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def create_search_index(apps, schema_editor):
+    _run(schema_editor, {"postgresql": POSTGRES_FORWARD, "sqlite": SQLITE_FORWARD})
+
+
+def drop_search_index(apps, schema_editor):
+    _run(schema_editor, {"postgresql": POSTGRES_REVERSE, "sqlite": SQLITE_REVERSE})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
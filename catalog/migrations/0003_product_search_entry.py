@@ -0,0 +1,38 @@
+# Generated by Django 5.0 on 2026-10-18 12:09
+
+import catalog.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def configure_rank(apps, schema_editor):
+    # La columna ``rank`` de FTS5 usa bm25() con más peso para el nombre
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute(
+            "INSERT INTO catalog_product_fts(catalog_product_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)')"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0002_product_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchEntry',
+            fields=[
+                ('product', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='catalog.product')),
+                ('name', models.TextField()),
+                ('description', models.TextField()),
+                ('document', catalog.models.FTS5MatchField(db_column='catalog_product_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'catalog_product_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(configure_rank, migrations.RunPython.noop),
+    ]
@@ -1,11 +1,79 @@
 from django.db import models
+from django.db.models import F
+from django.utils import timezone
 from django.utils.text import slugify
+from .cache import bump_catalog_version_on_commit
+from .images import generate_derivatives
+
+# Por debajo de este stock el listado muestra "Últimas unidades"
+LOW_STOCK = 10
+
+
+class CatalogQuerySet(models.QuerySet):
+    """
+    Las escrituras masivas no emiten post_save/post_delete; invalidan la
+    caché de fragmentos del catálogo explícitamente. ``update()`` tampoco
+    aplica ``auto_now``: se fija ``updated_at`` aquí para que el ETag de la
+    API (ver catalog/api.py) cambie también con el stock.
+    """
+
+    def update(self, *, invalidate=True, **kwargs):
+        if any(field.name == "updated_at" for field in self.model._meta.concrete_fields):
+            kwargs.setdefault("updated_at", timezone.now())
+        rows = super().update(**kwargs)
+        if rows and invalidate:
+            bump_catalog_version_on_commit()
+        return rows
+
+    def bulk_create(self, objs, *args, **kwargs):
+        created = super().bulk_create(objs, *args, **kwargs)
+        if created:
+            bump_catalog_version_on_commit()
+        return created
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        rows = super().bulk_update(objs, fields, *args, **kwargs)
+        if rows:
+            bump_catalog_version_on_commit()
+        return rows
+
+
+class ProductQuerySet(CatalogQuerySet):
+    def add_stock(self, product_id, quantity, **conditions):
+        """
+        Suma ``quantity`` (negativa para descontar) al stock de ``product_id``
+        con un UPDATE atómico, si además se cumplen ``conditions``. Devuelve
+        las filas tocadas.
+
+        Los fragmentos cacheados solo muestran si quedan pocas unidades, así
+        que un checkout no invalida todo el catálogo: la versión solo sube si
+        el producto cruzó ``LOW_STOCK``.
+        """
+        rows = self.filter(pk=product_id, **conditions).update(stock=F("stock") + quantity, invalidate=False)
+        # Solo si cruzó el umbral queda el stock nuevo entre LOW_STOCK y LOW_STOCK + quantity
+        low, high = sorted((LOW_STOCK, LOW_STOCK + quantity))
+        if rows and quantity and self.filter(pk=product_id, stock__gte=low, stock__lt=high).exists():
+            bump_catalog_version_on_commit()
+        return rows
+
+
+class CatalogVersion(models.Model):
+    """
+    Sello de versión del catálogo (una sola fila, ver catalog/cache.py). Vive
+    en la base de datos para que todos los workers y los comandos de gestión
+    vean el mismo aunque la caché sea local a cada proceso.
+    """
+
+    version = models.PositiveBigIntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
 
 
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     slug = models.SlugField(max_length=120, unique=True, blank=True)
 
+    objects = CatalogQuerySet.as_manager()
+
     class Meta:
         verbose_name_plural = "Categories"
 
@@ -26,19 +94,112 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField(default=0)
     image = models.ImageField(upload_to="products/", blank=True, null=True)
+    # Miniaturas WebP/JPEG generadas a partir de image (ver catalog/images.py)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProductQuerySet.as_manager()
+
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # Orden del listado y clave del cursor de paginación
+            models.Index(fields=["-created_at", "id"], name="product_created_id_idx"),
+            # max(updated_at) del ETag de la API sin recorrer la tabla
+            models.Index(fields=["updated_at"], name="product_updated_idx"),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
         super().save(*args, **kwargs)
+        # Regenerar derivados solo cuando la imagen cambió
+        if (self.image.name or "") != self.image_variants.get("source", ""):
+            self.refresh_image_variants()
+
+    @property
+    def is_low_stock(self):
+        return self.stock < LOW_STOCK
+
+    def refresh_image_variants(self):
+        self.image_variants = generate_derivatives(self.image) if self.image else {}
+        self.updated_at = timezone.now()
+        Product.objects.filter(pk=self.pk).update(image_variants=self.image_variants, updated_at=self.updated_at)
 
     def __str__(self) -> str:
         return self.name
-from django.db import models
 
-# Create your models here.
+
+class FTS5MatchField(models.TextField):
+    """Columna oculta de FTS5 con el nombre de la tabla; admite el lookup ``match``."""
+
+
+@FTS5MatchField.register_lookup
+class FTS5Match(models.Lookup):
+    lookup_name = "match"
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} MATCH {rhs}", lhs_params + rhs_params
+
+
+class ProductSearchEntry(models.Model):
+    """
+    Vista de solo lectura sobre la tabla virtual FTS5 de productos (solo SQLite).
+    La tabla y sus triggers se crean en la migración 0002_product_search_index.
+    """
+    product = models.OneToOneField(
+        Product, primary_key=True, db_column="rowid", on_delete=models.DO_NOTHING, related_name="search_entry"
+    )
+    name = models.TextField()
+    description = models.TextField()
+    document = FTS5MatchField(db_column="catalog_product_fts")
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = "catalog_product_fts"
+
+
+class ProductCoPurchase(models.Model):
+    """
+    Matriz de co-ocurrencia (dispersa) de productos en pedidos, acumulada por
+    el job build_recommendations. La diagonal (product == other) guarda en
+    cuántos pedidos aparece cada producto.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="co_purchases")
+    other = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["product", "other"], name="unique_co_purchase_pair"),
+        ]
+
+
+class ProductRecommendation(models.Model):
+    """Top-k de productos comprados juntos, precalculado para product_detail"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="recommendations")
+    recommended = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField()
+    position = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ["product", "position"]
+        constraints = [
+            models.UniqueConstraint(fields=["product", "position"], name="unique_recommendation_position"),
+        ]
+
+
+class RecommendationRun(models.Model):
+    """Marca de agua del job incremental: último pedido incorporado a la matriz"""
+    last_order_id = models.BigIntegerField(default=0)
+    orders_processed = models.PositiveIntegerField(default=0)
+    products_updated = models.PositiveIntegerField(default=0)
+    full_rebuild = models.BooleanField(default=False)
+    finished_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-finished_at"]
@@ -0,0 +1,129 @@
+"""
+Paginación por cursor (keyset) para listados grandes.
+
+En lugar de OFFSET/COUNT, cada página se pide con los valores de ordenación
+de la última (o primera) fila vista: ``WHERE (created_at, id) < (...)``.
+El coste de una página profunda es el mismo que el de la primera y solo se
+leen ``per_page + 1`` filas para saber si hay más resultados.
+"""
+import base64
+import datetime
+import json
+from decimal import Decimal
+from urllib.parse import urlencode
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+PAGE_SIZE = 24
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    Pagina ``queryset`` según ``ordering`` (p. ej. ``("-created_at", "id")``).
+    La última clave debe ser única para que el orden sea total.
+    Las claves pueden ser campos del modelo o anotaciones del queryset.
+    """
+
+    def __init__(self, queryset, ordering, per_page=PAGE_SIZE):
+        self.queryset = queryset
+        self.keys = [(key.lstrip("-"), key.startswith("-")) for key in ordering]
+        self.per_page = per_page
+
+    def page(self, cursor=None):
+        direction, values = self._decode(cursor)
+        backwards = direction == "p"
+        queryset = self.queryset.order_by(*self._ordering(reverse=backwards))
+        if values is not None:
+            queryset = queryset.filter(self._after(values, reverse=backwards))
+        rows = list(queryset[: self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[: self.per_page]
+        if backwards:
+            rows.reverse()
+        if not rows:
+            return KeysetPage(rows)
+        if backwards:
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+        return KeysetPage(
+            rows,
+            next_cursor=self._encode("n", rows[-1]) if has_next else None,
+            previous_cursor=self._encode("p", rows[0]) if has_previous else None,
+        )
+
+    def _ordering(self, reverse=False):
+        return [f"{'-' if descending != reverse else ''}{name}" for name, descending in self.keys]
+
+    def _after(self, values, reverse=False):
+        # (a, b, c) > (x, y, z)  ==  a > x  OR  (a = x AND b > y)  OR  (a = x AND b = y AND c > z)
+        condition = Q()
+        for index, (name, descending) in enumerate(self.keys):
+            lookup = "lt" if descending != reverse else "gt"
+            equal = {prefix: values[i] for i, (prefix, _) in enumerate(self.keys[:index])}
+            condition |= Q(**equal, **{f"{name}__{lookup}": values[index]})
+        return condition
+
+    def _encode(self, direction, row):
+        # Filas de modelo o diccionarios de ``.values()``
+        get = row.__getitem__ if isinstance(row, dict) else lambda name: getattr(row, name)
+        values = [_json_value(get(name)) for name, _ in self.keys]
+        payload = json.dumps([direction, values], separators=(",", ":"))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+    def _decode(self, cursor):
+        """Devuelve (dirección, valores); un cursor inválido equivale a la primera página."""
+        if not cursor:
+            return "n", None
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            direction, raw_values = json.loads(base64.urlsafe_b64decode(padded))
+            if direction not in {"n", "p"} or len(raw_values) != len(self.keys):
+                return "n", None
+            return direction, [self._to_python(name, value) for (name, _), value in zip(self.keys, raw_values)]
+        except (ValueError, TypeError, ValidationError):
+            return "n", None
+
+    def _to_python(self, name, value):
+        try:
+            field = self.queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # Anotación (p. ej. ``search_rank``): el valor JSON ya es nativo
+            return value
+        return field.to_python(value)
+
+
+def _json_value(value):
+    # isoformat() conserva los microsegundos (DjangoJSONEncoder los trunca a ms)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def cursor_querystring(filters, cursor):
+    """Querystring con los filtros activos y el cursor indicado."""
+    return urlencode({**filters, "cursor": cursor})
@@ -0,0 +1,174 @@
+"""
+Recomendaciones "comprados juntos" para la ficha de producto.
+
+El job (``manage.py build_recommendations``) arma una matriz dispersa
+pedidos × productos con los pedidos nuevos y acumula ``C = Mᵀ·M`` en
+``ProductCoPurchase``: ``C[a, b]`` es el número de pedidos que contienen a la
+vez ``a`` y ``b`` y la diagonal ``C[a, a]`` los pedidos que contienen ``a``.
+Con eso se guarda, por producto, su top-k de vecinos ordenado por similitud
+coseno ``C[a, b] / sqrt(C[a, a] · C[b, b])`` en ``ProductRecommendation``.
+
+Es incremental: ``RecommendationRun`` guarda el último pedido incorporado y
+cada ejecución solo suma los pedidos posteriores y recalcula el top-k de los
+productos cuyos conteos cambiaron (y el de sus vecinos, cuya similitud con
+ellos también cambia). Se cuentan todos los pedidos, pagados o no: el pago
+llega después de crear el pedido y rompería la marca de agua por id.
+Borrar pedidos no resta conteos; para eso está ``--full``.
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from scipy import sparse
+
+from .cache import bump_catalog_version_on_commit
+from .models import ProductCoPurchase, ProductRecommendation, RecommendationRun
+
+TOP_K = 8
+BATCH_SIZE = 500
+# Margen para no saltarse pedidos de transacciones que aún no confirmaron
+SETTLE_DELAY = timedelta(minutes=1)
+
+
+def co_occurrence(rows):
+    """
+    ``rows`` son pares (order_id, product_id). Devuelve (product_ids, matriz
+    COO simétrica de co-ocurrencias indexada por posición en product_ids).
+    """
+    pairs = np.array(rows, dtype=np.int64).reshape(-1, 2)
+    _, order_index = np.unique(pairs[:, 0], return_inverse=True)
+    product_ids, product_index = np.unique(pairs[:, 1], return_inverse=True)
+    # Binaria: la cantidad comprada no cuenta, solo la presencia en el pedido
+    matrix = sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.int64), (order_index, product_index)),
+        shape=(order_index.max() + 1, len(product_ids)),
+    )
+    matrix.data[:] = 1
+    return product_ids, (matrix.T @ matrix).tocoo()
+
+
+def _merge_counts(product_ids, counts):
+    """Suma los conteos nuevos a ``ProductCoPurchase`` (upsert por par)."""
+    delta = {
+        (int(product_ids[a]), int(product_ids[b])): int(n)
+        for a, b, n in zip(counts.row, counts.col, counts.data)
+    }
+    affected = [int(product_id) for product_id in product_ids]
+    for start in range(0, len(affected), BATCH_SIZE):
+        chunk = affected[start : start + BATCH_SIZE]
+        existing = ProductCoPurchase.objects.filter(product_id__in=chunk).values_list("product_id", "other_id", "orders")
+        for product_id, other_id, orders in existing:
+            if (product_id, other_id) in delta:
+                delta[product_id, other_id] += orders
+    ProductCoPurchase.objects.bulk_create(
+        [ProductCoPurchase(product_id=a, other_id=b, orders=n) for (a, b), n in delta.items()],
+        batch_size=BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=["product", "other"],
+        update_fields=["orders"],
+    )
+    return affected
+
+
+def _top_neighbours(pairs, diagonal, k):
+    """
+    ``pairs``: array (n, 3) de (product_id, other_id, orders) sin diagonal.
+    Devuelve filas (product_id, other_id, score, position) con las k mejores por producto.
+    """
+    product, other, together = pairs[:, 0], pairs[:, 1], pairs[:, 2].astype(float)
+    score = together / np.sqrt(diagonal[product] * diagonal[other])
+    # Orden: producto, score descendente y id del vecino para desempatar
+    order = np.lexsort((other, -score, product))
+    product, other, score = product[order], other[order], score[order]
+    _, starts, inverse = np.unique(product, return_index=True, return_inverse=True)
+    position = np.arange(len(product)) - starts[inverse]
+    keep = position < k
+    return zip(product[keep].tolist(), other[keep].tolist(), score[keep].tolist(), position[keep].tolist())
+
+
+def _rebuild_top_k(product_ids, k):
+    diagonal_rows = np.array(
+        list(ProductCoPurchase.objects.filter(product_id=F("other_id")).values_list("product_id", "orders")),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    diagonal = np.zeros(int(diagonal_rows[:, 0].max(initial=0)) + 1)
+    diagonal[diagonal_rows[:, 0]] = diagonal_rows[:, 1]
+
+    for start in range(0, len(product_ids), BATCH_SIZE):
+        chunk = product_ids[start : start + BATCH_SIZE]
+        pairs = np.array(
+            list(
+                ProductCoPurchase.objects.filter(product_id__in=chunk)
+                .exclude(product_id=F("other_id"))
+                .values_list("product_id", "other_id", "orders")
+            ),
+            dtype=np.int64,
+        ).reshape(-1, 3)
+        ProductRecommendation.objects.filter(product_id__in=chunk).delete()
+        ProductRecommendation.objects.bulk_create(
+            [
+                ProductRecommendation(product_id=a, recommended_id=b, score=score, position=position)
+                for a, b, score, position in _top_neighbours(pairs, diagonal, k)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+
+
+@transaction.atomic
+def build_recommendations(k=TOP_K, full=False):
+    """Incorpora los pedidos nuevos y recalcula las recomendaciones afectadas."""
+    from orders.models import Order, OrderItem
+
+    last_run = RecommendationRun.objects.first()
+    watermark = 0 if full or last_run is None else last_run.last_order_id
+    if full:
+        ProductCoPurchase.objects.all().delete()
+        ProductRecommendation.objects.all().delete()
+
+    last_order_id = (
+        Order.objects.filter(id__gt=watermark, created_at__lte=timezone.now() - SETTLE_DELAY)
+        .order_by("-id")
+        .values_list("id", flat=True)
+        .first()
+    )
+    rows = []
+    if last_order_id is not None:
+        rows = list(
+            OrderItem.objects.filter(order_id__gt=watermark, order_id__lte=last_order_id)
+            .values_list("order_id", "product_id")
+            .distinct()
+        )
+
+    updated = []
+    if rows:
+        product_ids, counts = co_occurrence(rows)
+        affected = _merge_counts(product_ids, counts)
+        # Cambia C[b, b] de los productos afectados: también la similitud de sus vecinos
+        neighbours = set()
+        for start in range(0, len(affected), BATCH_SIZE):
+            neighbours.update(
+                ProductCoPurchase.objects.filter(other_id__in=affected[start : start + BATCH_SIZE])
+                .values_list("product_id", flat=True)
+            )
+        updated = sorted(neighbours.union(affected))
+        _rebuild_top_k(updated, k)
+        bump_catalog_version_on_commit()
+
+    return RecommendationRun.objects.create(
+        last_order_id=last_order_id or watermark,
+        orders_processed=len({order_id for order_id, _ in rows}),
+        products_updated=len(updated),
+        full_rebuild=full,
+    )
+
+
+def recommended_products(product, limit=4):
+    """Productos recomendados para ``product`` (una consulta por índice (product, position))."""
+    return [
+        recommendation.recommended
+        for recommendation in ProductRecommendation.objects.filter(product=product)
+        .select_related("recommended__category")
+        .order_by("position")[:limit]
+    ]
@@ -0,0 +1,107 @@
+"""
+Búsqueda indexada de productos.
+
+- PostgreSQL: columna ``search_vector`` (tsvector generada, índice GIN) más
+  similitud por trigramas sobre ``name`` (pg_trgm). El filtro usa ``@@`` y el
+  operador ``%`` (umbral ``pg_trgm.similarity_threshold``, fijado al abrir la
+  conexión), que sirven sus índices GIN combinados con un BitmapOr;
+  ``similarity()`` solo se calcula para ordenar.
+- SQLite: tabla virtual FTS5 ``catalog_product_fts`` (modelo no gestionado
+  ``ProductSearchEntry``) sincronizada por triggers.
+- Otros motores: fallback a ``icontains``.
+
+El índice se crea en la migración ``0002_product_search_index`` con el SQL
+de ``search_schema``.
+"""
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, ExpressionWrapper, F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .search_schema import FTS_TABLE, SQLITE_FTS_TRIGGERS
+
+SEARCH_CONFIG = "spanish"
+TRIGRAM_THRESHOLD = 0.3
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _fts5_query(query):
+    """Convierte texto libre en una consulta FTS5 segura (prefijos con AND implícito)."""
+    tokens = _TOKEN_RE.findall(query)
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def _postgres_search(queryset, query):
+    table = queryset.model._meta.db_table
+    # similarity(...) > x no usa índices; "name % texto" sí (gin_trgm_ops)
+    matches = RawSQL(
+        f'"{table}"."search_vector" @@ websearch_to_tsquery(%s, %s) '
+        f'OR "{table}"."name" %% %s',
+        (SEARCH_CONFIG, query, query),
+        output_field=BooleanField(),
+    )
+    rank = RawSQL(
+        f'GREATEST(ts_rank("{table}"."search_vector", websearch_to_tsquery(%s, %s)), '
+        f'similarity("{table}"."name", %s))',
+        (SEARCH_CONFIG, query, query),
+        output_field=FloatField(),
+    )
+    return queryset.filter(matches).annotate(search_rank=rank)
+
+
+def _sqlite_search(queryset, query):
+    match = _fts5_query(query)
+    if not match:
+        return queryset.annotate(search_rank=Value(0.0)).none()
+    # JOIN por rowid con la tabla FTS5 (ProductSearchEntry). ``rank`` es bm25()
+    # con los pesos configurados en la migración: menor cuanto más relevante,
+    # por eso se niega para ordenar de forma descendente.
+    return queryset.filter(search_entry__document__match=match).annotate(
+        search_rank=ExpressionWrapper(-F("search_entry__rank"), output_field=FloatField())
+    )
+
+
+def _fallback_search(queryset, query):
+    return queryset.filter(
+        Q(name__icontains=query) | Q(description__icontains=query)
+    ).annotate(search_rank=Value(0.0))
+
+
+def search_products(queryset, query):
+    """
+    Filtra ``queryset`` por ``query`` usando el índice de texto del motor actual.
+    Anota ``search_rank`` (mayor = más relevante) para ordenar por relevancia.
+    """
+    vendor = connections[queryset.db].vendor
+    if vendor == "postgresql":
+        return _postgres_search(queryset, query)
+    if vendor == "sqlite":
+        return _sqlite_search(queryset, query)
+    return _fallback_search(queryset, query)
+
+
+def set_trigram_threshold(connection):
+    """Umbral del operador ``%`` de pg_trgm para esta conexión."""
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT set_config('pg_trgm.similarity_threshold', %s, false)", [str(TRIGRAM_THRESHOLD)])
+
+
+def ensure_sqlite_triggers(connection):
+    """
+    Reinstala los triggers FTS5 si la tabla virtual existe: el schema editor
+    de SQLite reconstruye catalog_product (y pierde sus triggers) en algunos ALTER.
+    """
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE]
+        )
+        if cursor.fetchone() is None:
+            return
+        for statement in SQLITE_FTS_TRIGGERS:
+            cursor.execute(statement)
@@ -0,0 +1,29 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate, post_save, post_delete
+from django.dispatch import receiver
+from django.db import connections
+from .cache import bump_catalog_version_on_commit
+from .models import Category, Product
+from .search import ensure_sqlite_triggers, set_trigram_threshold
+
+
+@receiver(post_migrate)
+def restore_search_triggers(sender, using="default", **kwargs):
+    """Reinstala los triggers FTS5 que SQLite pierde al reconstruir catalog_product"""
+    if sender.name != "catalog":
+        return
+    ensure_sqlite_triggers(connections[using])
+
+
+@receiver(connection_created)
+def configure_search(sender, connection, **kwargs):
+    set_trigram_threshold(connection)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_catalog_cache(sender, **kwargs):
+    """Cualquier cambio en el catálogo invalida los fragmentos HTML cacheados"""
+    bump_catalog_version_on_commit()
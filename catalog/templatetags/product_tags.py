@@ -1,5 +1,10 @@
+import re
+from functools import lru_cache
+
 from django import template
+from django.core.files.storage import default_storage
 from django.templatetags.static import static
+from catalog.images import variant_srcset
 
 register = template.Library()
 
@@ -41,32 +46,76 @@ PRODUCT_KEYWORD_MAP = {
 }
 
 
-@register.simple_tag
-def product_image(product):
+# Matcher compilado: un solo recorrido del nombre encuentra todas las palabras
+# clave (lookahead para admitir solapamientos); gana la primera del mapa,
+# igual que el antiguo bucle sobre PRODUCT_KEYWORD_MAP.
+_KEYWORD_PRIORITY = {keyword: index for index, keyword in enumerate(PRODUCT_KEYWORD_MAP)}
+_KEYWORD_RE = re.compile("(?=(" + "|".join(re.escape(keyword) for keyword in PRODUCT_KEYWORD_MAP) + "))")
+
+
+def _keyword_image(name):
+    matches = _KEYWORD_RE.findall(name.lower())
+    if not matches:
+        return None
+    return PRODUCT_KEYWORD_MAP[min(matches, key=_KEYWORD_PRIORITY.__getitem__)]
+
+
+class ProductImageURL(str):
     """
-    Retorna la URL de la imagen estática para un producto.
+    URL de la imagen (se renderiza como cadena) con los ``srcset`` de sus
+    derivados: ``{{ img_url.srcset }}`` (JPEG) y ``{{ img_url.webp_srcset }}``.
+    """
+    srcset = ""
+    webp_srcset = ""
+
+
+@lru_cache(maxsize=2048)
+def _resolve_image_url(product_id, updated_at, name, image_name, variants):
+    # updated_at cambia en cada save(), así que una imagen o nombre nuevos
+    # generan otra clave; las entradas viejas salen por LRU.
+    if image_name:
+        url = ProductImageURL(default_storage.url(image_name))
+        if variants:
+            content_hash, widths, original_width = variants
+            url.srcset = variant_srcset(default_storage, image_name, content_hash, widths, "jpg")
+            url.webp_srcset = variant_srcset(default_storage, image_name, content_hash, widths, "webp")
+            if original_width:
+                # El original sigue disponible para pantallas anchas / alta densidad
+                url.srcset += f", {url} {original_width}w"
+        return url
+    if name in PRODUCT_IMAGE_MAP:
+        return ProductImageURL(static(PRODUCT_IMAGE_MAP[name]))
+    image_path = _keyword_image(name)
+    return ProductImageURL(static(image_path)) if image_path else None
+
+
+def resolve_product_image(product):
+    """
+    Retorna la URL de la imagen de un producto o None.
     Prioridad:
-    1. Si el producto tiene image cargada en la BD, usar esa
+    1. Si el producto tiene image cargada en la BD, usar esa (con sus derivados)
     2. Buscar en el mapeo por nombre exacto
     3. Buscar por palabras clave en el nombre
-    4. Retornar None (el template mostrará el placeholder)
     """
-    # Si el producto tiene imagen en la BD, usarla
-    if product.image:
-        return product.image.url
-    
-    # Buscar por nombre exacto
-    if product.name in PRODUCT_IMAGE_MAP:
-        return static(PRODUCT_IMAGE_MAP[product.name])
-    
-    # Buscar por palabras clave
-    product_name_lower = product.name.lower()
-    for keyword, image_path in PRODUCT_KEYWORD_MAP.items():
-        if keyword in product_name_lower:
-            return static(image_path)
-    
-    # No se encontró imagen
-    return None
+    return resolve_image_fields(product.pk, product.updated_at, product.name, product.image.name, product.image_variants)
+
+
+def resolve_image_fields(product_id, updated_at, name, image_name, variants):
+    """Igual que ``resolve_product_image`` a partir de los valores de columna (p. ej. de ``.values()``)."""
+    image_name = image_name or ""
+    derived = None
+    if image_name and variants.get("source") == image_name and variants.get("widths"):
+        derived = (variants["hash"], tuple(variants["widths"]), variants.get("width"))
+    return _resolve_image_url(product_id, updated_at, name, image_name, derived)
+
+
+@register.simple_tag
+def product_image(product):
+    """
+    Retorna la URL de la imagen estática para un producto
+    (None si no hay: el template mostrará el placeholder).
+    """
+    return resolve_product_image(product)
 
 
 @register.simple_tag
@@ -74,19 +123,4 @@ def product_has_image(product):
     """
     Verifica si un producto tiene imagen (BD o estática)
     """
-    # Si tiene imagen en BD
-    if product.image:
-        return True
-    
-    # Si está en el mapeo por nombre
-    if product.name in PRODUCT_IMAGE_MAP:
-        return True
-    
-    # Si coincide con keywords
-    product_name_lower = product.name.lower()
-    for keyword in PRODUCT_KEYWORD_MAP.keys():
-        if keyword in product_name_lower:
-            return True
-    
-    return False
-
+    return resolve_product_image(product) is not None
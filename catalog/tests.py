@@ -1,3 +1,534 @@
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .cache import catalog_version
+from .models import Category, Product
+from .pagination import KeysetPaginator
+from .search import search_products
+
+
+class ProductSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="Proteinas")
+        cls.whey = Product.objects.create(
+            category=cls.category, name="Whey Protein 1kg", price=Decimal("35.00"),
+            description="Proteína de suero sabor vainilla.",
+        )
+        cls.casein = Product.objects.create(
+            category=cls.category, name="Caseína 1kg", price=Decimal("39.90"),
+            description="Proteína de absorción lenta para la noche.",
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, query):
+        return list(search_products(Product.objects.all(), query).order_by("-search_rank"))
+
+    def test_ignores_accents_and_matches_prefixes(self):
+        self.assertEqual(self.search("caseina"), [self.casein])
+        self.assertEqual(set(self.search("prot")), {self.whey, self.casein})
+
+    def test_ranks_name_matches_first(self):
+        self.assertEqual(self.search("whey proteina")[0], self.whey)
+
+    def test_index_follows_updates_and_deletes(self):
+        self.whey.name = "Aislado Premium"
+        self.whey.save()
+        self.assertEqual(self.search("whey"), [])
+        self.assertEqual(self.search("aislado"), [self.whey])
+        self.casein.delete()
+        self.assertEqual(self.search("caseina"), [])
+
+    def test_punctuation_only_query_returns_nothing(self):
+        self.assertEqual(self.search('"*()'), [])
+
+    def test_product_list_uses_search(self):
+        response = self.client.get(reverse("catalog:product_list"), {"q": "caseina"})
+        self.assertEqual(list(response.context["products"]), [self.casein])
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        shoes = Category.objects.create(name="Zapatos")
+        perfumes = Category.objects.create(name="Lociones")
+        for i in range(25):
+            Product.objects.create(
+                category=shoes if i % 2 else perfumes, name=f"Producto {i}", price=Decimal(10 + i)
+            )
+        cls.expected = list(Product.objects.order_by("-created_at", "id"))
+
+    def setUp(self):
+        cache.clear()
+
+    def walk(self, queryset, per_page=4):
+        paginator = KeysetPaginator(queryset, ("-created_at", "id"), per_page=per_page)
+        page = paginator.page()
+        seen = list(page)
+        while page.has_next:
+            page = paginator.page(page.next_cursor)
+            seen.extend(page)
+        return seen, paginator, page
+
+    def test_forward_walk_visits_every_row_once(self):
+        seen, _, _ = self.walk(Product.objects.all())
+        self.assertEqual(seen, self.expected)
+
+    def test_previous_cursor_returns_preceding_page(self):
+        paginator = KeysetPaginator(Product.objects.all(), ("-created_at", "id"), per_page=4)
+        first = paginator.page()
+        second = paginator.page(first.next_cursor)
+        self.assertEqual(list(paginator.page(second.previous_cursor)), list(first))
+        self.assertFalse(paginator.page(second.previous_cursor).has_previous)
+
+    def test_combines_with_filters(self):
+        queryset = Product.objects.filter(category__slug="zapatos", price__gte=20)
+        seen, _, _ = self.walk(queryset)
+        self.assertEqual(seen, [p for p in self.expected if p.category.slug == "zapatos" and p.price >= 20])
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        paginator = KeysetPaginator(Product.objects.all(), ("-created_at", "id"), per_page=4)
+        self.assertEqual(list(paginator.page("no-es-un-cursor")), self.expected[:4])
+
+    def test_deep_page_uses_no_offset_or_count(self):
+        _, paginator, last = self.walk(Product.objects.all())
+        with CaptureQueriesContext(connection) as ctx:
+            list(paginator.page(last.previous_cursor))
+        self.assertEqual(len(ctx.captured_queries), 1)
+        sql = ctx.captured_queries[0]["sql"].upper()
+        self.assertNotIn("OFFSET", sql)
+        self.assertNotIn("COUNT(", sql)
+
+    def test_product_list_pages_search_results(self):
+        response = self.client.get(reverse("catalog:product_list"), {"q": "producto"})
+        self.assertEqual(len(response.context["products"]), 24)
+        response = self.client.get(reverse("catalog:product_list") + "?" + response.context["next_query"])
+        self.assertEqual(len(response.context["products"]), 1)
+        self.assertFalse(response.context["page"].has_next)
+
+
+class CatalogFragmentCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="Zapatos")
+        cls.product = Product.objects.create(category=cls.category, name="Tenis Urban Pro", price=Decimal("79.99"))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cached_grid_skips_product_queries(self):
+        url = reverse("catalog:product_list")
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertContains(response, "Tenis Urban Pro")
+        self.assertFalse(any("catalog_product" in q["sql"] for q in ctx.captured_queries))
+
+    def test_cached_grid_uses_current_csrf_token(self):
+        response = self.client.get(reverse("catalog:product_list"))
+        self.assertNotContains(response, "__catalog_csrf_token__")
+        self.assertContains(response, 'name="csrfmiddlewaretoken"')
+
+    def test_product_save_invalidates_grid(self):
+        url = reverse("catalog:product_list")
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = "Tenis Urban Max"
+            self.product.save()
+        self.assertContains(self.client.get(url), "Tenis Urban Max")
+
+    def test_bulk_update_and_category_rename_bump_version(self):
+        for write in (
+            lambda: Product.objects.filter(pk=self.product.pk).update(price=Decimal("10.00")),
+            lambda: Category.objects.filter(pk=self.category.pk).update(name="Calzado"),
+        ):
+            before = catalog_version()
+            with self.captureOnCommitCallbacks(execute=True):
+                write()
+            self.assertGreater(catalog_version(), before)
+
+    def test_version_is_shared_between_processes(self):
+        before = catalog_version()
+        # Otro proceso no comparte la caché LocMem de este
+        cache.clear()
+        self.assertEqual(catalog_version(), before)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=self.product.pk).update(price=Decimal("12.00"))
+        self.assertGreater(catalog_version(), before)
+
+    def test_stock_changes_only_invalidate_when_crossing_low_stock(self):
+        from orders.stock import _give_back, _take
+
+        Product.objects.filter(pk=self.product.pk).update(stock=12)
+        for write, bumped in (
+            (lambda: _take(self.product.id, 1), False),
+            (lambda: _take(self.product.id, 2), True),
+            (lambda: _take(self.product.id, 5), False),
+            (lambda: _give_back({self.product.id: 6}), True),
+        ):
+            before = catalog_version()
+            with self.captureOnCommitCallbacks(execute=True):
+                write()
+            self.assertEqual(catalog_version() > before, bumped)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 10)
+
+
+class ProductImageTagTests(TestCase):
+    def test_keyword_matcher_keeps_map_priority(self):
+        from .templatetags.product_tags import PRODUCT_KEYWORD_MAP, _keyword_image
+
+        def legacy(name):
+            for keyword, image_path in PRODUCT_KEYWORD_MAP.items():
+                if keyword in name.lower():
+                    return image_path
+            return None
+
+        for name in ["Zapatos de bota", "Botas Trekking", "Loción Cítrica Fresh", "Caseína Whey", "Sin imagen"]:
+            self.assertEqual(_keyword_image(name), legacy(name), name)
+
+    def test_tags_resolve_once_per_product_version(self):
+        from .templatetags.product_tags import _resolve_image_url, product_has_image, product_image
+
+        category = Category.objects.create(name="Lociones")
+        product = Product.objects.create(category=category, name="Aroma Nocturno", price=Decimal("59.00"))
+        _resolve_image_url.cache_clear()
+        self.assertTrue(product_image(product).endswith("products/aromanocturno.png"))
+        self.assertTrue(product_has_image(product))
+        self.assertEqual(_resolve_image_url.cache_info().misses, 1)
+
+        product.name = "Perfume genérico"
+        product.save()
+        self.assertIsNone(product_image(product))
+        self.assertFalse(product_has_image(product))
+
+
+class ProductImageDerivativeTests(TestCase):
+    def setUp(self):
+        import shutil
+        import tempfile
+
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        override = self.settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.category = Category.objects.create(name="Zapatos")
+
+    def upload(self, name, size=(1200, 900)):
+        from io import BytesIO
+
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from PIL import Image
+
+        buffer = BytesIO()
+        Image.new("RGBA", size, (1, 201, 255, 128)).save(buffer, format="PNG")
+        return Product.objects.create(
+            category=self.category, name=name, price=Decimal("10.00"),
+            image=SimpleUploadedFile(f"{name}.png", buffer.getvalue(), content_type="image/png"),
+        )
+
+    def test_upload_generates_hashed_webp_and_jpeg_thumbnails(self):
+        from .images import derivative_name
+        from .templatetags.product_tags import product_image
+
+        product = self.upload("tenis")
+        variants = product.image_variants
+        self.assertEqual(variants["widths"], [320, 640, 960])
+        for width in variants["widths"]:
+            for extension in ("webp", "jpg"):
+                name = derivative_name(product.image.name, variants["hash"], width, extension)
+                self.assertTrue(product.image.storage.exists(name), name)
+        url = product_image(product)
+        self.assertIn("320w", url.webp_srcset)
+        self.assertIn(".jpg 640w", url.srcset)
+        self.assertTrue(url.srcset.endswith(f"{product.image.url} 1200w"))
+
+    def test_small_images_are_not_upscaled(self):
+        from .templatetags.product_tags import product_image
+
+        product = self.upload("mini", size=(200, 200))
+        self.assertEqual(product.image_variants["widths"], [])
+        self.assertEqual(product_image(product).srcset, "")
+
+
+class ProductRecommendationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Proteinas")
+        cls.whey, cls.casein, cls.shaker, cls.bar = (
+            Product.objects.create(category=category, name=name, price=Decimal("10.00"))
+            for name in ("Whey", "Caseína", "Shaker", "Barra")
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def order(self, *products):
+        from datetime import timedelta
+
+        from django.utils import timezone
+        from orders.models import Order, OrderItem
+
+        order = Order.objects.create(full_name="Ana", email="ana@example.com", address="Calle 1", city="X", postal_code="1")
+        for product in products:
+            OrderItem.objects.create(order=order, product=product, price=product.price)
+        # Fuera del margen de asentamiento del job
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(hours=1))
+        return order
+
+    def test_ranks_neighbours_by_normalized_co_occurrence(self):
+        from .recommendations import build_recommendations, recommended_products
+
+        self.order(self.whey, self.shaker)
+        self.order(self.whey, self.shaker)
+        self.order(self.whey, self.casein)
+        for _ in range(3):
+            self.order(self.casein)
+        build_recommendations()
+        self.assertEqual(recommended_products(self.whey), [self.shaker, self.casein])
+        self.assertEqual(recommended_products(self.bar), [])
+
+    def test_incremental_run_matches_full_rebuild(self):
+        from .models import ProductRecommendation
+        from .recommendations import build_recommendations
+
+        def snapshot():
+            return list(ProductRecommendation.objects.values_list("product", "recommended", "score", "position"))
+
+        self.order(self.whey, self.shaker)
+        first = build_recommendations()
+        self.order(self.whey, self.casein, self.bar)
+        self.order(self.shaker, self.bar)
+        second = build_recommendations()
+        self.assertEqual(second.orders_processed, 2)
+        self.assertGreater(second.last_order_id, first.last_order_id)
+        incremental = snapshot()
+        build_recommendations(full=True)
+        self.assertEqual(snapshot(), incremental)
+        self.assertEqual(build_recommendations().orders_processed, 0)
+
+    def test_product_detail_serves_recommendations_with_one_query(self):
+        from .recommendations import build_recommendations
+
+        self.order(self.whey, self.bar)
+        build_recommendations()
+        url = reverse("catalog:product_detail", args=[self.whey.slug])
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertContains(response, "Barra")
+        self.assertNotContains(response, "Shaker")
+        recommendation_queries = [q for q in ctx.captured_queries if "catalog_productrecommendation" in q["sql"]]
+        self.assertEqual(len(recommendation_queries), 1)
+
+
+class CatalogFacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        shoes = Category.objects.create(name="Zapatos")
+        perfumes = Category.objects.create(name="Lociones")
+        for name, category, price in [
+            ("Tenis Urban Pro", shoes, "79.99"),
+            ("Botas Trekking X", shoes, "129.90"),
+            ("Tenis Running", shoes, "45.00"),
+            ("Aroma Nocturno", perfumes, "59.00"),
+            ("Cítrico Fresh", perfumes, "20.00"),
+        ]:
+            Product.objects.create(category=category, name=name, price=Decimal(price))
+
+    def setUp(self):
+        cache.clear()
+
+    def facets(self, **params):
+        return self.client.get(reverse("catalog:product_list"), params).context["facets"]
+
+    def test_counts_are_disjunctive(self):
+        facets = self.facets(category="zapatos", min="50")
+        # Categorías: respetan el rango de precio, no la categoría elegida
+        self.assertEqual(
+            [(c["slug"], c["count"], c["selected"]) for c in facets["categories"]],
+            [("lociones", 1, False), ("zapatos", 2, True)],
+        )
+        # Histograma: respeta la categoría, no el rango de precio
+        self.assertEqual([b["count"] for b in facets["price_buckets"]], [0, 1, 1, 1, 0])
+
+    def test_counts_follow_search(self):
+        facets = self.facets(q="tenis")
+        self.assertEqual([(c["slug"], c["count"]) for c in facets["categories"]], [("zapatos", 2)])
+        self.assertEqual(facets["total"], 2)
+
+    def test_bucket_links_filter_to_the_bucket(self):
+        bucket = self.facets(q="tenis")["price_buckets"][2]
+        response = self.client.get(reverse("catalog:product_list") + "?" + bucket["query"])
+        self.assertEqual([p.name for p in response.context["products"]], ["Tenis Urban Pro"])
+        self.assertTrue(response.context["facets"]["price_buckets"][2]["selected"])
+
+    def test_single_aggregate_query_cached_per_normalized_filters(self):
+        url = reverse("catalog:product_list")
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url, {"min": "50"})
+        self.assertEqual(sum("GROUP BY" in q["sql"] for q in ctx.captured_queries), 1)
+        self.assertFalse(any('FROM "catalog_category"' in q["sql"] for q in ctx.captured_queries))
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url, {"min": "50.00", "max": "no-es-precio"})
+        # Solo se lee el sello de versión compartido
+        self.assertTrue(all('FROM "catalog_catalogversion"' in q["sql"] for q in ctx.captured_queries))
+
+
+class CatalogApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Zapatos")
+        cls.products = [
+            Product.objects.create(category=category, name=f"Tenis {i}", price=Decimal("79.99"), stock=i)
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_list_pages_with_compact_fields(self):
+        url = reverse("catalog:api_product_list")
+        response = self.client.get(url, {"limit": 3})
+        self.assertEqual(response["Content-Type"], "application/json")
+        data = response.json()
+        self.assertEqual([p["slug"] for p in data["results"]], [p.slug for p in reversed(self.products)][:3])
+        first = data["results"][0]
+        self.assertEqual(first["price"], "79.99")
+        self.assertEqual(first["category"], {"slug": "zapatos", "name": "Zapatos"})
+        self.assertNotIn("description", first)
+        self.assertIsNone(data["previous"])
+        rest = self.client.get(data["next"]).json()
+        self.assertEqual(len(rest["results"]), 2)
+        self.assertIsNone(rest["next"])
+
+    def test_detail_and_missing_slug(self):
+        product = self.products[0]
+        data = self.client.get(reverse("catalog:api_product_detail", args=[product.slug])).json()
+        self.assertEqual((data["id"], data["stock"]), (product.id, 0))
+        self.assertIn("description", data)
+        self.assertEqual(self.client.get(reverse("catalog:api_product_detail", args=["no-existe"])).status_code, 404)
+
+    def test_unchanged_catalog_returns_304_with_one_query(self):
+        url = reverse("catalog:api_product_list")
+        response = self.client.get(url)
+        self.assertIn("Last-Modified", response)
+        etag = response["ETag"]
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_stamp_is_not_cached_per_process(self):
+        # Sin ejecutar on_commit, la versión de la caché local no cambia: como
+        # cuando escribe otro worker o un comando de gestión
+        url = reverse("catalog:api_product_list")
+        etag = self.client.get(url)["ETag"]
+        Product.objects.filter(pk=self.products[2].pk).update(stock=7)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_changes_on_update_and_delete(self):
+        url = reverse("catalog:api_product_list")
+        etags = [self.client.get(url)["ETag"]]
+        for write in (lambda: self.products[0].save(), lambda: self.products[1].delete()):
+            with self.captureOnCommitCallbacks(execute=True):
+                write()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etags[-1])
+            self.assertEqual(response.status_code, 200)
+            etags.append(response["ETag"])
+        self.assertEqual(len(set(etags)), 3)
+
+    def test_etag_follows_stock_changes(self):
+        from orders.stock import _give_back, _take
+
+        url = reverse("catalog:api_product_detail", args=[self.products[4].slug])
+        response = self.client.get(url)
+        etags = [response["ETag"]]
+        for write in (lambda: _take(self.products[4].id, 3), lambda: _give_back({self.products[4].id: 1})):
+            with self.captureOnCommitCallbacks(execute=True):
+                write()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etags[-1])
+            self.assertEqual(response.status_code, 200)
+            etags.append(response["ETag"])
+        self.assertEqual(response.json()["stock"], 2)
+        self.assertEqual(len(set(etags)), 3)
+
+
+class ImportCatalogCommandTests(TestCase):
+    def setUp(self):
+        import shutil
+        import tempfile
+
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        override = self.settings(MEDIA_ROOT=f"{self.tmp}/media")
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def write(self, name, content):
+        from pathlib import Path
+
+        path = Path(self.tmp) / name
+        path.write_text(content, encoding="utf-8")
+        return str(path)
+
+    def run_import(self, path, **options):
+        from io import StringIO
+
+        from django.core.management import call_command
+
+        out, err = StringIO(), StringIO()
+        call_command("import_catalog", path, images_dir=self.tmp, stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv_upserts_in_batches_and_reports_rate(self):
+        Category.objects.create(name="Zapatos")
+        existing = Product.objects.create(category=Category.objects.get(), name="Tenis Urban Pro", price=Decimal("1.00"))
+        csv_path = self.write("feed.csv", "name,category,price,stock,description\n" + "\n".join(
+            [f"Tenis {i},zapatos,{10 + i}.50,{i},Modelo {i}" for i in range(5)]
+            + ["Tenis Urban Pro,Zapatos,79.99,50,Actualizado", "Sin precio,Zapatos,,1,", "Crema,Cuidado Personal,12,3,"]
+        ))
+        with CaptureQueriesContext(connection) as ctx:
+            out, err = self.run_import(csv_path, batch=3)
+        self.assertIn("Importadas 7 filas", out)
+        self.assertIn("filas/s", out)
+        self.assertIn("Línea 8", err)
+        # Un INSERT ... ON CONFLICT por lote, no una consulta por fila
+        self.assertEqual(sum("ON CONFLICT" in q["sql"] for q in ctx.captured_queries if "catalog_product" in q["sql"]), 3)
+        existing.refresh_from_db()
+        self.assertEqual((existing.price, existing.stock, existing.description), (Decimal("79.99"), 50, "Actualizado"))
+        self.assertEqual(existing.created_at, Product.objects.get(pk=existing.pk).created_at)
+        self.assertEqual(Product.objects.get(slug="tenis-3").category.name, "Zapatos")
+        self.assertEqual(Category.objects.get(slug="cuidado-personal").name, "Cuidado Personal")
+
+    def test_jsonl_dedupes_images_by_content(self):
+        from io import BytesIO
+        from pathlib import Path
+
+        from PIL import Image
 
-# Create your tests here.
+        buffer = BytesIO()
+        Image.new("RGB", (800, 600), (1, 201, 255)).save(buffer, format="PNG")
+        for name in ("a.png", "b.png"):
+            (Path(self.tmp) / name).write_bytes(buffer.getvalue())
+        jsonl_path = self.write("feed.jsonl", "\n".join([
+            '{"name": "Whey", "category": "Proteinas", "price": "35", "image": "a.png"}',
+            '{"name": "Whey Chocolate", "category": "Proteinas", "price": "36", "image": "b.png"}',
+            "no es json",
+        ]))
+        out, err = self.run_import(jsonl_path)
+        self.assertIn("imágenes: 1 nuevas, 1 reutilizadas", out)
+        self.assertIn("JSON inválido", err)
+        whey, chocolate = Product.objects.order_by("id")
+        self.assertEqual(whey.image.name, chocolate.image.name)
+        self.assertEqual(whey.image_variants["widths"], [320, 640])
+        # Reimportar sin columna de imagen conserva la imagen
+        self.run_import(self.write("prices.jsonl", '{"name": "Whey", "category": "Proteinas", "price": "30"}'))
+        whey.refresh_from_db()
+        self.assertEqual((whey.price, whey.image.name), (Decimal("30.00"), chocolate.image.name))
@@ -1,10 +1,12 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 app_name = "catalog"
 
 urlpatterns = [
     path("", views.product_list, name="product_list"),
     path("product/<slug:slug>/", views.product_detail, name="product_detail"),
+    path("api/products/", api.product_list, name="api_product_list"),
+    path("api/products/<slug:slug>/", api.product_detail, name="api_product_detail"),
 ]
 
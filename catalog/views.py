@@ -1,46 +1,88 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.db.models import Q
-from .models import Product, Category
+from django.template.loader import render_to_string
+from accounts.decorators import redirect_roles
+from accounts.middleware import STAFF_ROLES
+from .models import Product
+from .cache import CSRF_PLACEHOLDER, cached_fragment, cached_value
+from .facets import facet_counts, parse_price
+from .search import search_products
+from .recommendations import recommended_products
+from .pagination import KeysetPaginator, cursor_querystring
 
 
+# Restringir a solo clientes/anonimos
+@redirect_roles(*STAFF_ROLES)
 def product_list(request):
-    # Restringir a solo clientes/anonimos
-    if request.user.is_authenticated and hasattr(request.user, "profile") and request.user.profile.role in {"manager", "repartidor"}:
-        return redirect("orders:my_orders")
-    query = request.GET.get("q", "").strip()
+    # Filtros normalizados: la misma búsqueda o precio escritos de otra forma
+    # comparten entradas de caché, y un precio inválido se ignora
+    query = " ".join(request.GET.get("q", "").split())
     category_slug = request.GET.get("category")
-    min_price = request.GET.get("min")
-    max_price = request.GET.get("max")
+    min_price = parse_price(request.GET.get("min"))
+    max_price = parse_price(request.GET.get("max"))
+    filters = {
+        key: str(value)
+        for key, value in (("q", query), ("category", category_slug), ("min", min_price), ("max", max_price))
+        if value
+    }
 
     products = Product.objects.select_related("category").all()
+    ordering = ("-created_at", "id")
 
     if query:
-        products = products.filter(
-            Q(name__icontains=query) | Q(description__icontains=query)
-        )
+        # Índice de texto completo (FTS5 / tsvector), ordenado por relevancia
+        products = search_products(products, query)
+        ordering = ("-search_rank",) + ordering
+    # Las facetas cuentan sobre la búsqueda sin los filtros de categoría/precio
+    facets = cached_value("facets", [filters], lambda: facet_counts(products, filters))
     if category_slug:
         products = products.filter(category__slug=category_slug)
-    if min_price:
+    if min_price is not None:
         products = products.filter(price__gte=min_price)
-    if max_price:
+    if max_price is not None:
         products = products.filter(price__lte=max_price)
 
-    categories = Category.objects.all()
+    cursor = request.GET.get("cursor")
+
+    def render_grid():
+        # Paginación por cursor: sin OFFSET ni COUNT del resultado completo
+        page = KeysetPaginator(products, ordering).page(cursor)
+        return render_to_string(
+            "catalog/_product_grid.html",
+            {
+                "products": page.object_list,
+                "page": page,
+                "next_query": cursor_querystring(filters, page.next_cursor) if page.has_next else "",
+                "previous_query": cursor_querystring(filters, page.previous_cursor) if page.has_previous else "",
+                "csrf_token": CSRF_PLACEHOLDER,
+            },
+            request,
+        )
+
+    # Solo se consulta la base de datos si el fragmento no está en caché
+    grid = cached_fragment(
+        request, "product_grid", [filters, cursor], render_grid
+    )
 
     return render(
         request,
         "catalog/product_list.html",
-        {"products": products, "categories": categories, "query": query},
+        {"grid": grid, "facets": facets, "filters": filters, "query": query},
     )
 
 
+@redirect_roles(*STAFF_ROLES)
 def product_detail(request, slug: str):
-    if request.user.is_authenticated and hasattr(request.user, "profile") and request.user.profile.role in {"manager", "repartidor"}:
-        return redirect("orders:my_orders")
     product = get_object_or_404(Product, slug=slug)
-    similar = (
-        Product.objects.filter(category=product.category)
-        .exclude(id=product.id)
-        .order_by("-created_at")[:4]
-    )
-    return render(request, "catalog/product_detail.html", {"product": product, "similar": similar})
+
+    def render_similar():
+        # Comprados juntos (precalculado por build_recommendations); sin datos
+        # de pedidos se muestran los más nuevos de la misma categoría
+        similar = recommended_products(product, limit=4) or (
+            Product.objects.filter(category=product.category)
+            .exclude(id=product.id)
+            .order_by("-created_at")[:4]
+        )
+        return render_to_string("catalog/_similar_products.html", {"similar": similar}, request)
+
+    similar_html = cached_fragment(request, "similar_products", [product.id], render_similar)
+    return render(request, "catalog/product_detail.html", {"product": product, "similar_html": similar_html})
@@ -3,6 +3,11 @@ ASGI config for core project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve it with ``uvicorn core.asgi:application`` and set
+``NOTIFICATION_STREAM=1`` to enable the live notification stream
+(``orders.views.notification_stream``): each open connection is a suspended
+coroutine instead of a worker thread.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
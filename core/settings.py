@@ -58,6 +58,8 @@ MIDDLEWARE = [
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
+    "accounts.middleware.RoleMiddleware",
+    "cart.middleware.CartMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
@@ -75,6 +77,7 @@ TEMPLATES = [
                 "django.contrib.messages.context_processors.messages",
                 "django.template.context_processors.media",
                 "django.template.context_processors.static",
+                "orders.context_processors.notification_stream",
             ],
         },
     },
@@ -100,6 +103,72 @@ if database_url:
     DATABASES['default'] = dj_database_url.parse(database_url)
 
 
+# Cache
+# LocMem en desarrollo (un proceso). En producción, con varios workers,
+# REDIS_URL comparte la caché (fragmentos del catálogo) entre procesos. Sin
+# Redis cada worker cachea por su cuenta, pero el sello de versión del
+# catálogo vive en la base de datos (CatalogVersion) y lo invalida en todos.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "pri-default",
+    }
+}
+
+# Carritos (cart.storage.CacheCartStorage): LocMem en desarrollo y Redis en
+# producción (abajo). No se usa FileBasedCache: cada set() recorre y cuenta el
+# directorio entero para decidir si descarta entradas, un coste que crece con
+# los carritos guardados. En LocMem ese control es len() de un dict.
+CACHES["carts"] = {
+    "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    "LOCATION": "pri-carts",
+    "OPTIONS": {"MAX_ENTRIES": 10000},
+}
+
+redis_url = os.environ.get("REDIS_URL")
+if redis_url:
+    CACHES["default"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": redis_url,
+    }
+    CACHES["carts"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": redis_url,
+        "KEY_PREFIX": "carts",
+    }
+
+# Dónde vive el carrito: Session/SignedCookie/CacheCartStorage (cart/storage.py).
+# Con caché, añadir o quitar productos no reescribe la sesión en la base de datos.
+# Sin Redis la caché es por proceso y los workers de gunicorn no compartirían
+# carritos: entonces se usa la sesión salvo que CART_STORAGE diga otra cosa
+# (p. ej. CacheCartStorage con runserver).
+CART_STORAGE = os.environ.get(
+    "CART_STORAGE", "cart.storage.CacheCartStorage" if redis_url else "cart.storage.SessionCartStorage"
+)
+
+
+# Notificaciones en vivo (SSE): activar solo al servir con ASGI
+# (`uvicorn core.asgi:application`). Bajo WSGI cada conexión abierta ocuparía
+# un worker de gunicorn, así que por defecto las páginas no abren el stream.
+NOTIFICATION_STREAM = os.environ.get("NOTIFICATION_STREAM", "0") == "1"
+
+# Procesar el outbox (asignación tras el pago) en la propia petición, tras el
+# commit. Solo para despliegues sin `run_worker`; render.yaml lo desactiva
+# porque levanta el worker.
+OUTBOX_INLINE = os.environ.get("OUTBOX_INLINE", "1") == "1"
+
+# Minutos que un pedido sin pagar retiene su stock reservado
+STOCK_RESERVATION_MINUTES = int(os.environ.get("STOCK_RESERVATION_MINUTES", "15"))
+
+
+# El usuario de la sesión se carga con su perfil (rol) en una sola consulta.
+# ModelBackend queda para las sesiones iniciadas antes de este cambio.
+AUTHENTICATION_BACKENDS = [
+    "accounts.backends.ProfileModelBackend",
+    "django.contrib.auth.backends.ModelBackend",
+]
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -1,5 +1,7 @@
 from django.shortcuts import redirect, render
 from django.http import JsonResponse
+from accounts.decorators import is_manager
+from accounts.middleware import CUSTOMER, RIDER
 from catalog.models import Product
 
 
@@ -9,16 +11,12 @@ def health_check(request):
 
 
 def home_redirect(request):
-    user = request.user
-    if user.is_authenticated and user.is_superuser:
+    if is_manager(request):
         return redirect("orders:panel")
-    if user.is_authenticated and hasattr(user, "profile"):
-        if user.profile.role == "manager":
-            return redirect("orders:panel")
-        if user.profile.role == "repartidor":
-            return redirect("orders:my_orders")
-        if user.profile.role == "cliente":
-            return redirect("catalog:product_list")
+    if request.role == RIDER:
+        return redirect("orders:my_orders")
+    if request.role == CUSTOMER:
+        return redirect("catalog:product_list")
     
     # Para usuarios no autenticados, mostrar landing page
     featured_products = Product.objects.all()[:6]
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Generador de carga por roles contra un servidor local (asyncio + httpx).
+
+Cada usuario virtual tiene un rol y repite su recorrido hasta agotar la
+duración:
+
+* ``anonimo``: catálogo, búsqueda, ficha de producto y API JSON.
+* ``cliente``: añade al carrito, checkout, pago simulado y sus pedidos.
+* ``repartidor``: sus entregas y cambios de estado (en ruta / reprogramada).
+* ``manager``: panel, estadísticas de fallos y descarga de reportes.
+
+Usa los usuarios de ``create_test_users.py`` (credenciales en
+tests/config/test_config.py). Al terminar imprime JSON con peticiones por
+segundo, p50/p95/p99 y tasa de error por nombre de URL.
+
+Uso:
+    python create_test_users.py
+    python manage.py runserver   # y python manage.py run_worker para asignar repartidores
+    python load_test.py --users 50 --duration 60 --mix anonimo=50,cliente=30,repartidor=10,manager=10
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import sys
+import time
+from collections import defaultdict
+
+import httpx
+
+from tests.config.test_config import TestConfig
+
+DEFAULT_MIX = "anonimo=50,cliente=30,repartidor=10,manager=10"
+SEARCH_TERMS = ["proteina", "zapatos", "locion", "camiseta", "vitaminas"]
+CHECKOUT_FORM = {
+    "full_name": "Cliente Carga",
+    "email": "cliente@test.com",
+    "address": "Calle 10 # 20-30",
+    "city": "Medellín",
+    "postal_code": "050001",
+}
+
+IDEMPOTENCY_RE = re.compile(r'name="idempotency_key" value="([0-9a-f]+)"')
+DELIVERY_RE = re.compile(r"/orders/delivery/(\d+)/")
+
+
+class Stats:
+    """Latencias y errores por nombre de URL."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, name, elapsed, status):
+        self.latencies[name].append(elapsed)
+        self.statuses[name][status] += 1
+        # Las redirecciones son parte del flujo (login, checkout, pago)
+        if status == "error" or status >= 400:
+            self.errors[name] += 1
+
+    def report(self, duration):
+        endpoints = {}
+        total = errors = 0
+        for name in sorted(self.latencies):
+            values = sorted(self.latencies[name])
+            count = len(values)
+            total += count
+            errors += self.errors[name]
+            endpoints[name] = {
+                "requests": count,
+                "rps": round(count / duration, 2),
+                "error_rate": round(self.errors[name] / count, 4),
+                "p50_ms": percentile(values, 50),
+                "p95_ms": percentile(values, 95),
+                "p99_ms": percentile(values, 99),
+                "status": {str(status): n for status, n in sorted(self.statuses[name].items(), key=str)},
+            }
+        return {
+            "duration_s": round(duration, 2),
+            "requests": total,
+            "rps": round(total / duration, 2) if duration else 0,
+            "error_rate": round(errors / total, 4) if total else 0,
+            "endpoints": endpoints,
+        }
+
+
+def percentile(sorted_values, pct):
+    """Percentil por rango más cercano, en milisegundos."""
+    if not sorted_values:
+        return None
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return round(sorted_values[rank - 1] * 1000, 2)
+
+
+class VirtualUser:
+    def __init__(self, role, client, stats, rng):
+        self.role = role
+        self.client = client
+        self.stats = stats
+        self.rng = rng
+        self.products = []
+
+    async def request(self, name, method, url, **kwargs):
+        headers = kwargs.pop("headers", {})
+        if method == "POST":
+            headers["X-CSRFToken"] = self.client.cookies.get("csrftoken", "")
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, headers=headers, **kwargs)
+        except httpx.HTTPError:
+            self.stats.record(name, time.perf_counter() - started, "error")
+            return None
+        self.stats.record(name, time.perf_counter() - started, response.status_code)
+        return response
+
+    async def login(self):
+        credentials = TestConfig.TEST_USERS[self.role]
+        await self.request("accounts:login", "GET", "/accounts/login/")
+        response = await self.request(
+            "accounts:login",
+            "POST",
+            "/accounts/login/",
+            data={"username": credentials["username"], "password": credentials["password"]},
+        )
+        if response is None or response.headers.get("location", "").endswith("/accounts/login/"):
+            raise RuntimeError(f"No se pudo iniciar sesión como {credentials['username']} (¿corriste create_test_users.py?)")
+
+    async def load_products(self):
+        response = await self.request("catalog:api_product_list", "GET", "/shop/api/products/", params={"limit": 100})
+        if response is not None and response.status_code == 200:
+            self.products = [(row["id"], row["slug"]) for row in response.json()["results"] if row["stock"] > 0]
+
+    async def anonimo(self):
+        await self.request("catalog:product_list", "GET", "/shop/")
+        await self.request("catalog:product_list", "GET", "/shop/", params={"q": self.rng.choice(SEARCH_TERMS)})
+        if not self.products:
+            await self.load_products()
+        if self.products:
+            _, slug = self.rng.choice(self.products)
+            await self.request("catalog:product_detail", "GET", f"/shop/product/{slug}/")
+            await self.request("catalog:api_product_detail", "GET", f"/shop/api/products/{slug}/")
+
+    async def cliente(self):
+        if not self.products:
+            await self.load_products()
+        await self.request("catalog:product_list", "GET", "/shop/")
+        if not self.products:
+            return
+        for product_id, _ in self.rng.sample(self.products, min(len(self.products), self.rng.randint(1, 3))):
+            await self.request("cart:add", "POST", f"/cart/add/{product_id}/", data={"quantity": 1})
+        await self.request("cart:detail", "GET", "/cart/")
+        response = await self.request("orders:checkout", "GET", "/orders/checkout/")
+        match = IDEMPOTENCY_RE.search(response.text) if response is not None else None
+        form = {**CHECKOUT_FORM, "idempotency_key": match.group(1) if match else ""}
+        response = await self.request("orders:checkout", "POST", "/orders/checkout/", data=form)
+        if response is None or not response.headers.get("location", "").endswith("/payments/simulate/"):
+            return  # sin stock o carrito corregido: el recorrido termina aquí
+        await self.request("payments:simulate", "POST", "/payments/simulate/", data={"outcome": "success"})
+        response = await self.request("payments:success", "GET", "/payments/success/")
+        if response is not None and response.headers.get("location"):
+            await self.request("orders:summary", "GET", response.headers["location"])
+        await self.request("orders:my_orders", "GET", "/orders/my-orders/")
+
+    async def repartidor(self):
+        response = await self.request("orders:my_orders", "GET", "/orders/my-orders/")
+        order_ids = DELIVERY_RE.findall(response.text) if response is not None else []
+        if not order_ids:
+            return
+        order_id = self.rng.choice(order_ids)
+        url = f"/orders/delivery/{order_id}/"
+        await self.request("orders:delivery_detail", "GET", url)
+        # Estados no finales: la entrega sigue disponible para la siguiente iteración
+        action = self.rng.choice(["en_ruta", "reprogramada"])
+        await self.request("orders:delivery_detail", "POST", url, data={"action": action, "notes": "prueba de carga"})
+        await self.request("orders:notifications", "GET", "/orders/notifications/")
+
+    async def manager(self):
+        await self.request("orders:panel", "GET", "/orders/panel/")
+        await self.request("orders:panel", "GET", "/orders/panel/", params={"status": self.rng.choice(["asignada", "en_ruta", "fallida"])})
+        await self.request("orders:failure_statistics", "GET", "/orders/failure-statistics/")
+        await self.request("orders:download_report", "GET", "/orders/report/", params={"format": self.rng.choice(["excel", "pdf"])})
+
+    async def run(self, deadline, think_time):
+        if self.role != "anonimo":
+            await self.login()
+        scenario = getattr(self, self.role)
+        while time.monotonic() < deadline:
+            await scenario()
+            if think_time:
+                await asyncio.sleep(self.rng.uniform(0, 2 * think_time))
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        role, _, weight = part.partition("=")
+        role = role.strip()
+        if role not in ("anonimo", *TestConfig.TEST_USERS):
+            raise argparse.ArgumentTypeError(f"Rol desconocido: {role}")
+        mix[role] = float(weight or 1)
+    return mix
+
+
+def assign_roles(mix, users):
+    """Reparte ``users`` entre roles en proporción a los pesos (al menos uno por rol con peso)."""
+    total = sum(mix.values())
+    roles = []
+    for role, weight in mix.items():
+        if weight > 0:
+            roles += [role] * max(1, round(users * weight / total))
+    return roles
+
+
+async def main(args):
+    stats = Stats()
+    roles = assign_roles(args.mix, args.users)
+    limits = httpx.Limits(max_connections=len(roles), max_keepalive_connections=len(roles))
+    started = time.monotonic()
+    deadline = started + args.duration
+    clients = [
+        httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits, follow_redirects=False)
+        for _ in roles
+    ]
+    try:
+        users = [VirtualUser(role, client, stats, random.Random(args.seed + i)) for i, (role, client) in enumerate(zip(roles, clients))]
+        results = await asyncio.gather(*(user.run(deadline, args.think_time) for user in users), return_exceptions=True)
+    finally:
+        await asyncio.gather(*(client.aclose() for client in clients))
+    report = stats.report(time.monotonic() - started)
+    report["users"] = {role: roles.count(role) for role in args.mix}
+    failures = [str(result) for result in results if isinstance(result, Exception)]
+    if failures:
+        report["aborted_users"] = failures
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Prueba de carga por roles (tienda y entregas)")
+    parser.add_argument("--base-url", default=TestConfig.BASE_URL)
+    parser.add_argument("--users", type=int, default=20, help="Usuarios virtuales concurrentes")
+    parser.add_argument("--duration", type=float, default=30, help="Segundos de carga")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"Pesos por rol (por defecto {DEFAULT_MIX})")
+    parser.add_argument("--think-time", type=float, default=0, help="Pausa media entre recorridos (s)")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Archivo JSON de salida (por defecto stdout)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = asyncio.run(main(args))
+    data = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(data + "\n")
+    else:
+        print(data)
+    sys.exit(1 if report.get("aborted_users") else 0)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Order, OrderItem, Delivery
+from .models import Order, OrderItem, Delivery, NotificationArchive, OutboxMessage, StockReservation
 
 
 class OrderItemInline(admin.TabularInline):
@@ -21,3 +21,22 @@ class DeliveryAdmin(admin.ModelAdmin):
 from django.contrib import admin
 
 # Register your models here.
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ("id", "order", "product", "quantity", "status", "expires_at")
+    list_filter = ("status",)
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ("id", "topic", "status", "attempts", "available_at", "processed_at")
+    list_filter = ("status", "topic")
+
+
+@admin.register(NotificationArchive)
+class NotificationArchiveAdmin(admin.ModelAdmin):
+    list_display = ("id", "reason", "count", "first_sent_at", "last_sent_at", "created_at")
+    list_filter = ("reason",)
+    exclude = ("data",)
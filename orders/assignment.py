@@ -0,0 +1,304 @@
+"""
+Asignación de repartidores.
+
+Cada repartidor lleva en ``UserProfile.active_load`` cuántas entregas tiene
+asignadas sin entregar. El contador se ajusta con ``F()`` en cada cambio de
+repartidor o estado de una entrega (señales en orders/signals.py), así que
+elegir repartidor no recorre el historial de entregas.
+
+El reparto respeta:
+
+* zona: ``UserProfile.zones`` lista ciudades o prefijos de código postal; un
+  repartidor sin zonas cubre cualquiera y solo se usa si ninguno de la zona
+  tiene hueco.
+* capacidad: como mucho ``window_capacity`` entregas por fecha y franja
+  (``scheduled_date`` + ``scheduled_window``).
+* carga: entre los candidatos gana el de menor ``active_load`` (desempate por id).
+
+``AssignmentPlanner`` resuelve un lote de forma voraz: las entregas con menos
+candidatos van primero y, para cada grupo de candidatos, un montículo por
+(carga, id) da el siguiente repartidor en O(log n). Las entradas del montículo
+con una carga que ya no es la actual se descartan al sacarlas.
+"""
+import heapq
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+from accounts.middleware import RIDER
+from accounts.models import UserProfile
+
+# Estados que ya no ocupan al repartidor
+INACTIVE_STATUSES = {"entregada"}
+# Estados que el motor puede (re)asignar
+ASSIGNABLE_STATUSES = ("pendiente", "reprogramada")
+
+
+def _is_active(rider_id, status):
+    return rider_id is not None and status not in INACTIVE_STATUSES
+
+
+def apply_load_change(old_rider_id, old_status, new_rider_id, new_status):
+    """Ajusta ``active_load`` al pasar una entrega de (rider, estado) viejo a nuevo."""
+    deltas = {}
+    if _is_active(old_rider_id, old_status):
+        deltas[old_rider_id] = deltas.get(old_rider_id, 0) - 1
+    if _is_active(new_rider_id, new_status):
+        deltas[new_rider_id] = deltas.get(new_rider_id, 0) + 1
+    _apply_deltas(deltas)
+
+
+def _apply_deltas(deltas):
+    for rider_id, delta in deltas.items():
+        if delta:
+            UserProfile.objects.filter(user_id=rider_id).update(active_load=F("active_load") + delta)
+
+
+def recount_rider_loads():
+    """Recalcula todos los contadores desde las entregas (tras cambios masivos con ``update()``)."""
+    from .models import Delivery
+
+    loads = dict(
+        Delivery.objects.filter(rider__isnull=False)
+        .exclude(status__in=INACTIVE_STATUSES)
+        .values_list("rider_id")
+        .annotate(load=Count("id"))
+    )
+    with transaction.atomic():
+        for profile in UserProfile.objects.select_for_update().filter(role=RIDER):
+            load = loads.get(profile.user_id, 0)
+            if profile.active_load != load:
+                UserProfile.objects.filter(pk=profile.pk).update(active_load=load)
+    return loads
+
+
+def zone_keys(city, postal_code):
+    """Claves de zona de una dirección: la ciudad y cada prefijo del código postal."""
+    postal_code = (postal_code or "").strip().casefold()
+    keys = {postal_code[:end] for end in range(1, len(postal_code) + 1)}
+    if city and city.strip():
+        keys.add(city.strip().casefold())
+    return keys
+
+
+def _slot(delivery):
+    """Franja de capacidad de la entrega; None si no está programada."""
+    if delivery.scheduled_date is None:
+        return None
+    return delivery.scheduled_date, delivery.scheduled_window.strip()
+
+
+class AssignmentPlanner:
+    """
+    Plan de asignación en memoria para un lote. ``riders`` son perfiles de
+    repartidor; ``slot_usage`` cuenta entregas activas por
+    (rider_id, fecha, franja). ``release(delivery)`` descuenta la asignación
+    actual de una entrega que se va a replanificar.
+    """
+
+    def __init__(self, riders, slot_usage=None):
+        self.load = {profile.user_id: profile.active_load for profile in riders}
+        self.capacity = {profile.user_id: profile.window_capacity for profile in riders}
+        self.slot_usage = Counter(slot_usage or {})
+        self.by_zone = defaultdict(set)
+        generalists = []
+        for profile in riders:
+            zones = profile.zone_list()
+            for zone in zones:
+                self.by_zone[zone].add(profile.user_id)
+            if not zones:
+                generalists.append(profile.user_id)
+        self.generalists = tuple(sorted(generalists))
+        self._heaps = {}
+        self._rider_heaps = defaultdict(list)
+        self._candidates = {}
+
+    def release(self, delivery):
+        if delivery.rider_id in self.load and _is_active(delivery.rider_id, delivery.status):
+            self.load[delivery.rider_id] -= 1
+            slot = _slot(delivery)
+            if slot is not None:
+                self.slot_usage[(delivery.rider_id, *slot)] -= 1
+
+    def candidates(self, order):
+        key = (order.city, order.postal_code)
+        riders = self._candidates.get(key)
+        if riders is None:
+            riders = set()
+            for zone in zone_keys(*key):
+                riders |= self.by_zone.get(zone, set())
+            riders = self._candidates[key] = tuple(sorted(riders))
+        return riders
+
+    def _heap(self, riders):
+        heap = self._heaps.get(riders)
+        if heap is None:
+            heap = [(self.load[rider_id], rider_id) for rider_id in riders]
+            heapq.heapify(heap)
+            self._heaps[riders] = heap
+            for rider_id in riders:
+                self._rider_heaps[rider_id].append(heap)
+        return heap
+
+    def _pop_best(self, riders, slot):
+        heap = self._heap(riders)
+        full = []
+        chosen = None
+        while heap:
+            load, rider_id = heapq.heappop(heap)
+            if load != self.load[rider_id]:
+                continue  # entrada obsoleta: ya hay otra con la carga actual
+            if slot is not None and self.slot_usage[(rider_id, *slot)] >= self.capacity[rider_id]:
+                full.append((load, rider_id))
+                continue
+            chosen = rider_id
+            break
+        for entry in full:
+            heapq.heappush(heap, entry)
+        return chosen
+
+    def assign(self, delivery):
+        """Elige repartidor para ``delivery`` y lo reserva en el plan; None si nadie tiene hueco."""
+        slot = _slot(delivery)
+        rider_id = None
+        zone_riders = self.candidates(delivery.order)
+        if zone_riders:
+            rider_id = self._pop_best(zone_riders, slot)
+        if rider_id is None and self.generalists:
+            rider_id = self._pop_best(self.generalists, slot)
+        if rider_id is None:
+            return None
+        self.load[rider_id] += 1
+        if slot is not None:
+            self.slot_usage[(rider_id, *slot)] += 1
+        entry = (self.load[rider_id], rider_id)
+        for heap in self._rider_heaps[rider_id]:
+            heapq.heappush(heap, entry)
+        return rider_id
+
+    def plan(self, deliveries):
+        """
+        Asigna el lote, primero las entregas con menos repartidores de su zona.
+        Devuelve ``{delivery: rider_id o None}``.
+        """
+        def constraint(delivery):
+            zone_riders = self.candidates(delivery.order)
+            return (not zone_riders, len(zone_riders), delivery.pk or 0)
+
+        ordered = sorted(deliveries, key=constraint)
+        return {delivery: self.assign(delivery) for delivery in ordered}
+
+
+def _locked_riders():
+    # Orden fijo por usuario: los lotes concurrentes bloquean en el mismo orden
+    return list(UserProfile.objects.select_for_update().filter(role=RIDER).order_by("user_id"))
+
+
+def _slot_usage(riders, deliveries):
+    """Entregas activas por (repartidor, fecha, franja) en las fechas del lote."""
+    from .models import Delivery
+
+    dates = {delivery.scheduled_date for delivery in deliveries if delivery.scheduled_date is not None}
+    if not dates or not riders:
+        return {}
+    rows = (
+        Delivery.objects.filter(rider__isnull=False, scheduled_date__in=dates)
+        .exclude(status__in=INACTIVE_STATUSES)
+        .values_list("rider_id", "scheduled_date", "scheduled_window")
+        .annotate(count=Count("id"))
+    )
+    usage = Counter()
+    for rider_id, date, window, count in rows:
+        usage[(rider_id, date, window.strip())] += count
+    return usage
+
+
+@transaction.atomic
+def assign_delivery(delivery):
+    """
+    Asigna una entrega (pago confirmado) con ``apply_transition``: las
+    señales ajustan ``active_load`` y avisan a los coordinadores. Devuelve el
+    repartidor o None si ninguno tiene hueco o la entrega cambió entretanto
+    (queda para el siguiente ``assign_deliveries``).
+    """
+    from .transitions import apply_transition, can_transition
+
+    riders = _locked_riders()
+    planner = AssignmentPlanner(riders, _slot_usage(riders, [delivery]))
+    planner.release(delivery)
+    rider_id = planner.assign(delivery)
+    if rider_id is None or not can_transition(delivery.status, "asignada"):
+        return None
+    # Si la entrega cambió mientras se planificaba, queda para el siguiente assign_deliveries
+    if not apply_transition(delivery, "asignada", rider_id=rider_id):
+        return None
+    return delivery.rider
+
+
+@transaction.atomic
+def assign_batch(deliveries):
+    """
+    Planifica y guarda un lote; los contadores se ajustan con un UPDATE por
+    repartidor afectado. No envía notificaciones por entrega. Devuelve
+    cuántas entregas cambiaron de repartidor.
+
+    El lote se leyó sin bloquear: cada asignación es un UPDATE condicionado
+    al estado y la versión leídos, como en ``apply_transition``. Si un
+    manager, el cliente o el repartidor cambió la entrega mientras tanto, se
+    respeta su cambio y la entrega queda para la siguiente pasada.
+    """
+    from .models import Delivery
+
+    riders = _locked_riders()
+    planner = AssignmentPlanner(riders, _slot_usage(riders, deliveries))
+    for delivery in deliveries:
+        planner.release(delivery)
+    now = timezone.now()
+    deltas = Counter()
+    changed = 0
+    for delivery, rider_id in planner.plan(deliveries).items():
+        if rider_id is None or rider_id == delivery.rider_id:
+            continue
+        status = "asignada" if delivery.status == "pendiente" else delivery.status
+        updated = Delivery.objects.filter(pk=delivery.pk, status=delivery.status, version=delivery.version).update(
+            rider_id=rider_id, status=status, updated_at=now, version=F("version") + 1
+        )
+        if not updated:
+            continue
+        if _is_active(delivery.rider_id, delivery.status):
+            deltas[delivery.rider_id] -= 1
+        deltas[rider_id] += 1
+        delivery.rider_id = rider_id
+        delivery.status = status
+        delivery.updated_at = now
+        delivery.version += 1
+        changed += 1
+    _apply_deltas(deltas)
+    return changed
+
+
+def assign_deliveries(batch_size=1000, reassign=False):
+    """
+    Recorre las entregas pendientes o reprogramadas por lotes de ``batch_size``
+    (paginación por id). Sin ``reassign`` solo toca las que no tienen
+    repartidor; con él replanifica también las ya asignadas.
+    Devuelve ``(revisadas, asignadas)``.
+    """
+    from .models import Delivery
+
+    pending = Delivery.objects.filter(status__in=ASSIGNABLE_STATUSES).select_related("order").only(
+        "id", "status", "version", "rider_id", "scheduled_date", "scheduled_window", "order__city", "order__postal_code"
+    )
+    if not reassign:
+        pending = pending.filter(rider__isnull=True)
+    seen = assigned = 0
+    last_id = 0
+    while True:
+        batch = list(pending.filter(pk__gt=last_id).order_by("pk")[:batch_size])
+        if not batch:
+            break
+        last_id = batch[-1].pk
+        seen += len(batch)
+        assigned += assign_batch(batch)
+    return seen, assigned
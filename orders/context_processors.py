@@ -0,0 +1,6 @@
+from django.conf import settings
+
+
+def notification_stream(request):
+    """``notification_stream``: si las páginas abren el stream SSE (solo al servir con ASGI)."""
+    return {"notification_stream": getattr(settings, "NOTIFICATION_STREAM", False)}
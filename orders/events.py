@@ -0,0 +1,126 @@
+"""
+Notificaciones en vivo (Server-Sent Events).
+
+``orders.views.notification_stream`` mantiene abierta una respuesta
+``text/event-stream`` por pestaña; cada conexión es solo una cola pequeña y
+una corrutina dormida, sin hilo ni consulta mientras no hay eventos.
+
+Publicar va en dos pasos:
+
+* el *broker* (``settings.NOTIFICATION_BROKER``) lleva el evento a los
+  procesos que sirven conexiones. ``LocalBroker`` es el sustituto local: lo
+  entrega directamente en este proceso, que basta con un único proceso ASGI
+  (``uvicorn core.asgi:application``). Con varios procesos, o con
+  ``run_worker`` creando notificaciones, hace falta un broker compartido
+  (Redis pub/sub, LISTEN/NOTIFY) con la misma interfaz ``publish``.
+* el ``hub`` del proceso reparte el evento entre las conexiones abiertas de
+  ese usuario.
+
+Los eventos se publican al confirmar la transacción (``on_commit``): nunca
+se anuncia una notificación que luego se deshace. Si el navegador se
+reconecta, ``Last-Event-ID`` permite reenviar desde la base de datos lo que
+se perdió mientras tanto.
+"""
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.urls import reverse
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Eventos pendientes por conexión; si un cliente no lee, se descartan los nuevos
+QUEUE_SIZE = 100
+
+
+class Hub:
+    """Suscriptores del proceso por usuario. ``publish`` se puede llamar desde cualquier hilo."""
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        subscription = (asyncio.get_running_loop(), asyncio.Queue(QUEUE_SIZE))
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, user_id, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[user_id]
+
+    def connections(self, user_id=None):
+        with self._lock:
+            if user_id is not None:
+                return len(self._subscribers.get(user_id, ()))
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def publish(self, user_id, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, event)
+            except RuntimeError:
+                # El bucle de esa conexión ya se cerró
+                pass
+
+
+def _offer(queue, event):
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        logger.warning("Cola SSE llena; se descarta el evento %s", event.get("id"))
+
+
+hub = Hub()
+
+
+class LocalBroker:
+    """Sustituto local del broker entre procesos: entrega en el hub de este proceso."""
+
+    def publish(self, user_id, event):
+        hub.publish(user_id, event)
+
+
+@lru_cache
+def _load_broker(path):
+    return import_string(path)()
+
+
+def get_broker():
+    return _load_broker(getattr(settings, "NOTIFICATION_BROKER", "orders.events.LocalBroker"))
+
+
+def notification_event(notification):
+    """Datos del evento SSE de una notificación."""
+    return {
+        "id": notification.id,
+        "type": notification.notification_type,
+        "label": notification.get_notification_type_display(),
+        "message": notification.text,
+        "sent_at": notification.sent_at.isoformat(),
+        "url": reverse("orders:delivery_detail", args=[notification.delivery.order_id]),
+    }
+
+
+def publish_on_commit(notifications):
+    """Publica ``notifications`` a sus destinatarios cuando se confirme la transacción actual."""
+    events = [(notification.recipient_id, notification_event(notification)) for notification in notifications]
+
+    def send():
+        broker = get_broker()
+        for user_id, event in events:
+            broker.publish(user_id, event)
+
+    transaction.on_commit(send)
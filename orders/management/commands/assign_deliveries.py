@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+from orders.assignment import assign_deliveries
+
+
+class Command(BaseCommand):
+    help = (
+        "Asigna las entregas pendientes o reprogramadas a repartidores por zona, capacidad de la franja "
+        "y carga (por lotes; sin notificaciones por entrega)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--reassign", action="store_true", help="Replanificar también las entregas que ya tienen repartidor"
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        seen, assigned = assign_deliveries(batch_size=options["batch_size"], reassign=options["reassign"])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(f"{assigned} de {seen} entregas asignadas en {elapsed:.2f}s")
+        )
@@ -0,0 +1,83 @@
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, transaction
+from catalog.models import Category, Product
+from orders.models import Order, OrderItem
+from orders.stock import OutOfStock, reserve_stock
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide checkouts concurrentes sobre un único producto y verifica que no se vende de más "
+        "(los datos del benchmark se borran al final)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--stock", type=int, default=200, help="Stock inicial del producto")
+        parser.add_argument("--checkouts", type=int, default=500, help="Checkouts totales")
+        parser.add_argument("--workers", type=int, default=16, help="Hilos concurrentes")
+        parser.add_argument("--quantity", type=int, default=1, help="Unidades por checkout")
+
+    def handle(self, *args, **options):
+        category, category_created = Category.objects.get_or_create(name="Benchmark")
+        product = Product.objects.create(
+            category=category, name=f"Benchmark checkout {time.time_ns()}", price=Decimal("10.00"), stock=options["stock"]
+        )
+        quantity = options["quantity"]
+        results = []
+        lock = threading.Lock()
+
+        def checkout(_):
+            started = time.perf_counter()
+            try:
+                with transaction.atomic():
+                    order = Order.objects.create(
+                        full_name="Benchmark", email="bench@example.com", address="-", city="-", postal_code="-"
+                    )
+                    OrderItem.objects.create(order=order, product=product, price=product.price, quantity=quantity)
+                    reserve_stock(order, [(product, quantity)])
+                outcome = "ok"
+            except OutOfStock:
+                outcome = "sin_stock"
+            except OperationalError:
+                # SQLite: "database is locked" si la espera supera el timeout
+                outcome = "error"
+            finally:
+                connection.close()
+            with lock:
+                results.append((outcome, time.perf_counter() - started))
+
+        started = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+                list(pool.map(checkout, range(options["checkouts"])))
+            elapsed = time.perf_counter() - started
+
+            product.refresh_from_db()
+            outcomes = {name: sum(1 for outcome, _ in results if outcome == name) for name in ("ok", "sin_stock", "error")}
+            latencies = sorted(latency * 1000 for _, latency in results)
+            p50 = statistics.median(latencies)
+            p95 = latencies[int(len(latencies) * 0.95) - 1]
+            p99 = latencies[int(len(latencies) * 0.99) - 1]
+            self.stdout.write(
+                f"{options['checkouts']} checkouts / {options['workers']} hilos en {elapsed:.2f}s "
+                f"({len(results) / elapsed:.0f}/s): {outcomes['ok']} reservados, "
+                f"{outcomes['sin_stock']} sin stock, {outcomes['error']} errores"
+            )
+            self.stdout.write(f"latencia p50 {p50:.1f} ms | p95 {p95:.1f} ms | p99 {p99:.1f} ms")
+
+            expected = options["stock"] - outcomes["ok"] * quantity
+            if product.stock == expected and product.stock >= 0:
+                self.stdout.write(self.style.SUCCESS(f"Stock final {product.stock}: sin sobreventa"))
+            else:
+                self.stdout.write(self.style.ERROR(f"Stock final {product.stock}, esperado {expected}"))
+        finally:
+            Order.objects.filter(items__product=product).delete()
+            product.delete()
+            if category_created:
+                category.delete()
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from orders.retention import apply_retention
+
+
+class Command(BaseCommand):
+    help = "Archiva comprimidas y borra las notificaciones leídas antiguas y lo que supere el tope por usuario"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=90, help="Antigüedad máxima de las notificaciones leídas")
+        parser.add_argument("--per-user", type=int, default=500, help="Notificaciones vivas por usuario")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--dry-run", action="store_true", help="Solo contar, sin archivar ni borrar")
+
+    def handle(self, *args, **options):
+        result = apply_retention(
+            days=options["days"],
+            per_user=options["per_user"],
+            batch_size=options["batch_size"],
+            dry_run=options["dry_run"],
+        )
+        verb = "se retirarían" if options["dry_run"] else "archivadas"
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['antiguedad']} leídas antiguas y {result['tope']} sobre el tope {verb}"
+        ))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from orders.notification_service import DeliveryNotificationService
+
+
+class Command(BaseCommand):
+    help = "Recalcula los contadores de notificaciones sin leer (tras cambios masivos con update())"
+
+    def handle(self, *args, **options):
+        counts = DeliveryNotificationService.recount_unread()
+        self.stdout.write(self.style.SUCCESS(f"{sum(counts.values())} sin leer en {len(counts)} usuarios"))
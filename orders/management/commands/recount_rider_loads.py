@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from orders.assignment import recount_rider_loads
+
+
+class Command(BaseCommand):
+    help = "Recalcula active_load de los repartidores desde sus entregas (tras cambios masivos con update())"
+
+    def handle(self, *args, **options):
+        loads = recount_rider_loads()
+        self.stdout.write(self.style.SUCCESS(f"{sum(loads.values())} entregas activas en {len(loads)} repartidores"))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from orders.stock import release_expired_reservations
+
+
+class Command(BaseCommand):
+    help = "Devuelve al stock las reservas de pedidos no pagados que ya caducaron (programar periódicamente)"
+
+    def handle(self, *args, **options):
+        released = release_expired_reservations()
+        self.stdout.write(self.style.SUCCESS(f"{released} reservas liberadas"))
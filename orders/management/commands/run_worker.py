@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+from orders.outbox import drain
+
+
+class Command(BaseCommand):
+    help = "Procesa los mensajes del outbox (efectos secundarios del pago) por lotes, con reintentos"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--interval", type=float, default=1.0, help="Segundos de espera cuando no hay mensajes")
+        parser.add_argument("--once", action="store_true", help="Vaciar lo pendiente y salir (cron/tests)")
+
+    def handle(self, *args, **options):
+        while True:
+            done, failed = drain(options["batch_size"])
+            if done or failed:
+                self.stdout.write(f"{done} procesados, {failed} con error")
+            if options["once"]:
+                return
+            try:
+                time.sleep(options["interval"])
+            except KeyboardInterrupt:
+                return
@@ -0,0 +1,68 @@
+# Generated by Django 5.0 on 2026-10-18 12:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def share_coordinator_messages(apps, schema_editor):
+    """Los avisos a coordinadores ya copiados por destinatario pasan a un texto compartido."""
+    DeliveryNotification = apps.get_model("orders", "DeliveryNotification")
+    NotificationMessage = apps.get_model("orders", "NotificationMessage")
+    rows = (
+        DeliveryNotification.objects.filter(notification_type__startswith="coordinator_", shared__isnull=True)
+        .exclude(message="")
+        .order_by("delivery_id", "id")
+        .values_list("id", "delivery_id", "notification_type", "message", "sent_at")
+    )
+    current_delivery = None
+    shared = {}
+    for pk, delivery_id, notification_type, message, sent_at in rows.iterator(chunk_size=2000):
+        if delivery_id != current_delivery:
+            current_delivery, shared = delivery_id, {}
+        # Las copias de un mismo evento se crearon en el mismo segundo
+        key = (notification_type, message, sent_at.replace(microsecond=0))
+        if key not in shared:
+            message_obj = NotificationMessage.objects.create(
+                delivery_id=delivery_id, notification_type=notification_type, message=message
+            )
+            NotificationMessage.objects.filter(pk=message_obj.pk).update(sent_at=sent_at)
+            shared[key] = message_obj.pk
+        DeliveryNotification.objects.filter(pk=pk).update(shared_id=shared[key], message="")
+
+
+def copy_back_shared_messages(apps, schema_editor):
+    DeliveryNotification = apps.get_model("orders", "DeliveryNotification")
+    rows = DeliveryNotification.objects.filter(shared__isnull=False).values_list("id", "shared__message")
+    for pk, message in rows.iterator(chunk_size=2000):
+        DeliveryNotification.objects.filter(pk=pk).update(message=message)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0013_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='deliverynotification',
+            name='message',
+            field=models.TextField(blank=True),
+        ),
+        migrations.CreateModel(
+            name='NotificationMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('notification_type', models.CharField(max_length=35)),
+                ('message', models.TextField()),
+                ('sent_at', models.DateTimeField(auto_now_add=True)),
+                ('delivery', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shared_notifications', to='orders.delivery')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='deliverynotification',
+            name='shared',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='receipts', to='orders.notificationmessage'),
+        ),
+        migrations.RunPython(share_coordinator_messages, copy_back_shared_messages),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0 on 2026-10-18 12:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0014_shared_notification_messages'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='deliverynotification',
+            index=models.Index(fields=['recipient', '-sent_at', '-id'], name='notification_inbox_idx'),
+        ),
+    ]
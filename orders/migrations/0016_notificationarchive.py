@@ -0,0 +1,25 @@
+# Generated by Django 5.0 on 2026-10-18 12:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0015_notification_inbox_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reason', models.CharField(choices=[('antiguedad', 'Leídas antiguas'), ('tope', 'Tope por usuario')], max_length=20)),
+                ('count', models.PositiveIntegerField()),
+                ('first_sent_at', models.DateTimeField()),
+                ('last_sent_at', models.DateTimeField()),
+                ('data', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
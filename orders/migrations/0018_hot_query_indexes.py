@@ -0,0 +1,39 @@
+# Generated by Django 5.0 on 2026-10-18 12:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0017_delivery_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='delivery',
+            index=models.Index(fields=['rider', 'status'], name='delivery_rider_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='delivery',
+            index=models.Index(fields=['status', 'scheduled_date'], name='delivery_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='delivery',
+            index=models.Index(condition=models.Q(('rider__isnull', False), models.Q(('status', 'entregada'), _negated=True)), fields=['scheduled_date', 'rider', 'scheduled_window'], name='delivery_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deliveryfailurereason',
+            index=models.Index(fields=['created_at', 'reason'], name='failure_created_reason_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deliverynotification',
+            index=models.Index(fields=['recipient', 'read', '-sent_at'], name='notification_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-created_at'], name='order_user_created_idx'),
+        ),
+    ]
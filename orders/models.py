@@ -1,11 +1,88 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from catalog.models import Product
 
 
 User = get_user_model()
 
 
+class ChangeTrackingMixin:
+    """
+    Seguimiento de cambios por campo sin volver a consultar la base de datos.
+
+    ``from_db`` guarda los valores cargados (por ``attname``, p. ej.
+    ``rider_id``); ``previous(campo)`` devuelve el valor cargado y
+    ``changed_fields`` los campos modificados desde la carga o el último
+    ``save()``. Una instancia cargada se guarda con
+    ``update_fields=changed_fields`` (más los ``auto_now``): el UPDATE solo
+    escribe lo que cambió. Un campo diferido (``only()``/``defer()``) que se
+    asigna después de cargar cuenta como modificado, igual que en Django. Las
+    señales ``pre_save``/``post_save`` todavía ven los valores anteriores; se
+    actualizan al volver de ``save()``.
+    """
+    _loaded_values = {}
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            name: value for name, value in zip(field_names, values) if value is not models.DEFERRED
+        }
+        return instance
+
+    def _tracked_value(self, attname):
+        value = self.__dict__[attname]
+        # FieldFile se compara por nombre; guardar el nombre evita que una mutación in situ pase inadvertida
+        return getattr(value, "name", value) if isinstance(value, models.fields.files.FieldFile) else value
+
+    def _snapshot(self):
+        self._loaded_values = {
+            field.attname: self._tracked_value(field.attname)
+            for field in self._meta.concrete_fields
+            if field.attname in self.__dict__
+        }
+
+    def previous(self, attname):
+        """Valor del campo al cargarlo (None en instancias nuevas)."""
+        return self._loaded_values.get(attname)
+
+    @property
+    def changed_fields(self):
+        changed = set()
+        for field in self._meta.concrete_fields:
+            attname = field.attname
+            if attname not in self.__dict__:
+                continue
+            # Sin valor cargado: campo diferido asignado tras la carga
+            if attname not in self._loaded_values or self._tracked_value(attname) != self._loaded_values[attname]:
+                changed.add(attname)
+        return changed
+
+    def has_changed(self, attname):
+        return attname in self.changed_fields
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        if fields is None:
+            self._snapshot()
+            return
+        # Recarga parcial (también la de campos diferidos): solo esos campos vuelven a su valor guardado
+        loaded = dict(self._loaded_values)
+        for name in fields:
+            attname = self._meta.get_field(name).attname
+            if attname in self.__dict__:
+                loaded[attname] = self._tracked_value(attname)
+        self._loaded_values = loaded
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and self._loaded_values and not args and kwargs.get("update_fields") is None:
+            auto_now = {field.attname for field in self._meta.concrete_fields if getattr(field, "auto_now", False)}
+            kwargs["update_fields"] = self.changed_fields | auto_now
+        super().save(*args, **kwargs)
+        self._snapshot()
+
+
 class Order(models.Model):
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="orders")
     created_at = models.DateTimeField(auto_now_add=True)
@@ -17,6 +94,17 @@ class Order(models.Model):
     postal_code = models.CharField(max_length=20)
     paid = models.BooleanField(default=False)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # Clave del formulario de checkout: reintentos y dobles envíos no duplican el pedido
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "idempotency_key"], name="unique_order_idempotency_key"),
+        ]
+        indexes = [
+            # "Mis pedidos": WHERE user = ? ORDER BY created_at DESC
+            models.Index(fields=["user", "-created_at"], name="order_user_created_idx"),
+        ]
 
     def __str__(self) -> str:
         return f"Order #{self.pk}"
@@ -32,7 +120,76 @@ class OrderItem(models.Model):
         return self.price * self.quantity
 
 
-class Delivery(models.Model):
+class StockReservation(models.Model):
+    """
+    Unidades descontadas de ``Product.stock`` para un pedido aún no pagado.
+    Si el pago no llega antes de ``expires_at`` la reserva se libera y el
+    stock vuelve al producto (ver orders/stock.py).
+    """
+    ACTIVE = "activa"
+    CONFIRMED = "confirmada"
+    RELEASED = "liberada"
+    STATUS_CHOICES = (
+        (ACTIVE, "Activa"),
+        (CONFIRMED, "Confirmada"),
+        (RELEASED, "Liberada"),
+    )
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="stock_reservations")
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name="stock_reservations")
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=ACTIVE)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Barrido de reservas vencidas
+            models.Index(fields=["status", "expires_at"], name="reservation_status_expiry_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"Reserva {self.quantity} x {self.product_id} (Order {self.order_id}, {self.status})"
+
+
+class OutboxMessage(models.Model):
+    """
+    Efecto secundario pendiente, escrito en la misma transacción que el cambio
+    que lo origina (p. ej. el pago) y ejecutado después por ``run_worker``
+    (ver orders/outbox.py). Los fallos se reintentan con espera creciente
+    hasta ``outbox.MAX_ATTEMPTS``.
+    """
+    PENDING = "pendiente"
+    DONE = "procesado"
+    FAILED = "fallido"
+    STATUS_CHOICES = (
+        (PENDING, "Pendiente"),
+        (DONE, "Procesado"),
+        (FAILED, "Fallido"),
+    )
+    topic = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # El worker solo recorre lo pendiente
+            models.Index(
+                fields=["available_at", "id"],
+                condition=models.Q(status="pendiente"),
+                name="outbox_pending_idx",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.topic} #{self.pk} ({self.status})"
+
+
+class Delivery(ChangeTrackingMixin, models.Model):
     STATUS_CHOICES = (
         ("pendiente", "Pendiente"),
         ("asignada", "Asignada"),
@@ -41,6 +198,8 @@ class Delivery(models.Model):
         ("reprogramada", "Reprogramada"),
         ("entregada", "Entregada"),
     )
+    # Campos cuyos valores anteriores usan las señales (orders/signals.py)
+    TRACKED_FOR_SIGNALS = ("status", "rider_id", "scheduled_date", "scheduled_window")
     order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name="delivery")
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pendiente")
     rider = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="deliveries")
@@ -49,12 +208,36 @@ class Delivery(models.Model):
     notes = models.TextField(blank=True)
     photo = models.ImageField(upload_to="deliveries/", null=True, blank=True)
     failure_reason = models.CharField(max_length=120, blank=True)
+    # Sube con cada escritura; orders/transitions.py la usa para detectar conflictos
+    version = models.PositiveIntegerField(default=0)
     updated_at = models.DateTimeField(auto_now=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self) -> str:
         return f"Delivery #{self.pk} - Order {self.order_id} ({self.get_status_display()})"
 
+    class Meta:
+        indexes = [
+            # Entregas del repartidor, por estado
+            models.Index(fields=["rider", "status"], name="delivery_rider_status_idx"),
+            # Panel y reportes: WHERE status = ? AND scheduled_date BETWEEN ...
+            models.Index(fields=["status", "scheduled_date"], name="delivery_status_date_idx"),
+            # Entregas activas (ocupan a un repartidor): huecos por fecha y franja al asignar
+            models.Index(
+                fields=["scheduled_date", "rider", "scheduled_window"],
+                condition=models.Q(rider__isnull=False) & ~models.Q(status="entregada"),
+                name="delivery_active_idx",
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Un save() normal también invalida las versiones que otros tengan cargadas
+        if not self._state.adding and "version" in self.__dict__:
+            self.version += 1
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], "version"}
+        super().save(*args, **kwargs)
+
     @property
     def estimated_datetime(self):
         from datetime import datetime, timedelta
@@ -126,6 +309,21 @@ class DeliveryComment(models.Model):
         return f"Comment by {self.user_id or 'n/a'} on Delivery {self.delivery_id}"
 
 
+class NotificationMessage(models.Model):
+    """
+    Texto de un aviso a coordinadores, guardado una sola vez. Cada
+    coordinador recibe un ``DeliveryNotification`` delgado (sin texto propio)
+    que apunta aquí y lleva su propio estado de lectura.
+    """
+    delivery = models.ForeignKey(Delivery, on_delete=models.CASCADE, related_name="shared_notifications")
+    notification_type = models.CharField(max_length=35)
+    message = models.TextField()
+    sent_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:
+        return f"Aviso {self.notification_type} de Delivery {self.delivery_id}"
+
+
 class DeliveryNotification(models.Model):
     NOTIFICATION_TYPES = (
         ("approaching", "Aproximándose"),
@@ -145,16 +343,55 @@ class DeliveryNotification(models.Model):
     delivery = models.ForeignKey(Delivery, on_delete=models.CASCADE, related_name="notifications")
     notification_type = models.CharField(max_length=35, choices=NOTIFICATION_TYPES)
     recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name="delivery_notifications")
-    message = models.TextField()
+    # Vacío en los avisos a coordinadores: el texto está en ``shared``
+    message = models.TextField(blank=True)
+    shared = models.ForeignKey(
+        NotificationMessage, on_delete=models.CASCADE, null=True, blank=True, related_name="receipts"
+    )
     sent_at = models.DateTimeField(auto_now_add=True)
     read = models.BooleanField(default=False)
     
     class Meta:
         ordering = ["-sent_at"]
+        indexes = [
+            # Bandeja paginada por cursor: WHERE recipient = ? AND (sent_at, id) < (...)
+            models.Index(fields=["recipient", "-sent_at", "-id"], name="notification_inbox_idx"),
+            # Marcar leídas: WHERE recipient = ? AND read = false
+            models.Index(fields=["recipient", "read", "-sent_at"], name="notification_unread_idx"),
+        ]
     
     def __str__(self) -> str:
         return f"Notification {self.get_notification_type_display()} for {self.recipient.username}"
 
+    @property
+    def text(self):
+        """Texto a mostrar: el propio o el del aviso compartido (cargar con ``select_related("shared")``)."""
+        return self.shared.message if self.shared_id else self.message
+
+
+class NotificationArchive(models.Model):
+    """
+    Lote de notificaciones retiradas de ``DeliveryNotification`` por la
+    política de retención (ver orders/retention.py). ``data`` guarda las
+    filas como líneas JSON comprimidas con gzip; ``retention.archived_rows``
+    las devuelve.
+    """
+    AGE = "antiguedad"
+    CAP = "tope"
+    REASON_CHOICES = (
+        (AGE, "Leídas antiguas"),
+        (CAP, "Tope por usuario"),
+    )
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES)
+    count = models.PositiveIntegerField()
+    first_sent_at = models.DateTimeField()
+    last_sent_at = models.DateTimeField()
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:
+        return f"Archivo #{self.pk}: {self.count} notificaciones ({self.get_reason_display()})"
+
 
 class DeliveryFailureReason(models.Model):
     """Modelo para almacenar el historial de razones de fallo en entregas"""
@@ -182,6 +419,10 @@ class DeliveryFailureReason(models.Model):
     
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # Estadísticas de fallos por rango de fechas, agrupadas por razón
+            models.Index(fields=["created_at", "reason"], name="failure_created_reason_idx"),
+        ]
         verbose_name = "Razón de Fallo de Entrega"
         verbose_name_plural = "Razones de Fallo de Entregas"
     
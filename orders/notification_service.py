@@ -1,5 +1,10 @@
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Count, F, Q, Value
+from django.db.models.functions import Greatest
+from accounts.models import UserProfile
+from catalog.pagination import KeysetPaginator
+from .events import publish_on_commit
 from .models import DeliveryNotification, Delivery
 
 User = get_user_model()
@@ -109,13 +114,66 @@ class DeliveryNotificationService:
         """Obtiene las notificaciones más recientes de un usuario"""
         return DeliveryNotification.objects.filter(
             recipient=user
-        ).select_related('delivery', 'delivery__order')[:limit]
+        ).select_related('delivery', 'delivery__order', 'shared')[:limit]
+    
+    @staticmethod
+    def get_notifications_page(user, cursor=None, per_page=20):
+        """Página de notificaciones por cursor (más recientes primero), sin OFFSET ni COUNT"""
+        notifications = DeliveryNotification.objects.filter(
+            recipient=user
+        ).select_related('delivery', 'delivery__order', 'shared')
+        return KeysetPaginator(notifications, ("-sent_at", "-id"), per_page=per_page).page(cursor)
+    
+    @staticmethod
+    def get_notifications_after(user, last_id, limit=50):
+        """Notificaciones posteriores a ``last_id`` (reenvío tras reconectar el stream)"""
+        return list(DeliveryNotification.objects.filter(
+            recipient=user, id__gt=last_id
+        ).select_related('delivery', 'shared').order_by('id')[:limit])
+    
+    @staticmethod
+    def adjust_unread(user_ids, delta):
+        """Suma ``delta`` al contador de no leídas de los usuarios indicados (un UPDATE)"""
+        if not user_ids or not delta:
+            return
+        UserProfile.objects.filter(user_id__in=user_ids).update(
+            unread_notifications=Greatest(F("unread_notifications") + delta, Value(0))
+        )
+    
+    @staticmethod
+    @transaction.atomic
+    def mark_read(user, notification_ids=None):
+        """
+        Marca como leídas las notificaciones indicadas del usuario (todas si
+        ``notification_ids`` es None) con un solo UPDATE y descuenta del
+        contador las que de verdad cambiaron. Devuelve cuántas marcó.
+        """
+        unread = DeliveryNotification.objects.filter(recipient=user, read=False)
+        if notification_ids is not None:
+            unread = unread.filter(id__in=notification_ids)
+        updated = unread.update(read=True)
+        DeliveryNotificationService.adjust_unread([user.id], -updated)
+        return updated
     
     @staticmethod
     def mark_as_read(notification):
         """Marca una notificación como leída"""
+        DeliveryNotificationService.mark_read(notification.recipient, [notification.id])
         notification.read = True
-        notification.save()
+    
+    @staticmethod
+    def recount_unread():
+        """Recalcula los contadores desde las notificaciones (tras cambios masivos con ``update()``)"""
+        counts = dict(
+            DeliveryNotification.objects.filter(read=False)
+            .values_list("recipient_id")
+            .annotate(count=Count("id"))
+        )
+        with transaction.atomic():
+            UserProfile.objects.exclude(unread_notifications=0).update(unread_notifications=0)
+            for user_id, count in counts.items():
+                UserProfile.objects.filter(user_id=user_id).update(unread_notifications=count)
+        return counts
     
     @staticmethod
     def can_send_notifications(delivery):
@@ -151,27 +209,38 @@ class DeliveryNotificationService:
     @staticmethod
     def notify_coordinators(delivery, notification_type, message):
         """
-        Envía notificaciones a todos los coordinadores/managers
+        Envía notificaciones a todos los coordinadores/managers.
+        El texto se guarda una vez (NotificationMessage) y cada coordinador
+        recibe un acuse delgado; todos se insertan con un solo bulk_create.
         
         Args:
             delivery: Instancia de Delivery
             notification_type: Tipo de notificación para coordinadores
             message: Mensaje de la notificación
         """
-        from .models import DeliveryNotification
-        coordinators = DeliveryNotificationService.get_coordinators()
-        notifications = []
+        from .models import DeliveryNotification, NotificationMessage
+        coordinator_ids = list(DeliveryNotificationService.get_coordinators().values_list("id", flat=True))
+        if not coordinator_ids:
+            return []
         
-        for coordinator in coordinators:
-            notification = DeliveryNotification.objects.create(
+        shared = NotificationMessage.objects.create(
+            delivery=delivery,
+            notification_type=notification_type,
+            message=message
+        )
+        receipts = DeliveryNotification.objects.bulk_create(
+            DeliveryNotification(
                 delivery=delivery,
                 notification_type=notification_type,
-                recipient=coordinator,
-                message=message
+                recipient_id=coordinator_id,
+                shared=shared
             )
-            notifications.append(notification)
-        
-        return notifications
+            for coordinator_id in coordinator_ids
+        )
+        # bulk_create no emite post_save: el contador se sube aquí con un UPDATE
+        DeliveryNotificationService.adjust_unread(coordinator_ids, 1)
+        publish_on_commit(receipts)
+        return receipts
     
     @staticmethod
     def notify_coordinators_rescheduled(delivery, old_date=None, old_window=None, changed_by=None):
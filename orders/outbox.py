@@ -0,0 +1,110 @@
+"""
+Outbox transaccional.
+
+Las vistas no ejecutan los efectos secundarios lentos (asignar repartidor,
+señales, avisos a coordinadores): escriben un ``OutboxMessage`` en la misma
+transacción que el cambio. Si la transacción se deshace el mensaje
+desaparece con ella; si se confirma, ``python manage.py run_worker`` lo
+procesa después, sin broker.
+
+El worker toma lotes con ``SELECT ... FOR UPDATE SKIP LOCKED`` (en
+PostgreSQL varios workers no se pisan) y ejecuta cada mensaje en su propio
+savepoint: el trabajo del handler y la marca de procesado se confirman
+juntos. Un fallo se reintenta con espera exponencial hasta ``MAX_ATTEMPTS``
+y luego queda como fallido con el error guardado.
+
+Sin worker desplegado, ``settings.OUTBOX_INLINE`` procesa lo encolado en la
+misma petición justo después del commit (mismos reintentos y savepoints);
+con el worker corriendo conviene desactivarlo para que la petición no
+espere.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from .models import Delivery, OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+MAX_BACKOFF = timedelta(minutes=10)
+
+HANDLERS = {}
+
+
+def handler(topic):
+    """Registra la función que procesa los mensajes de ``topic`` (recibe el payload como kwargs)."""
+    def register(func):
+        HANDLERS[topic] = func
+        return func
+    return register
+
+
+def enqueue(topic, **payload):
+    """Encola un efecto secundario; llamar dentro de la transacción del cambio que lo origina."""
+    message = OutboxMessage.objects.create(topic=topic, payload=payload)
+    if getattr(settings, "OUTBOX_INLINE", False):
+        # robust: un fallo al procesar no rompe la respuesta; el mensaje queda para reintentos
+        transaction.on_commit(drain, robust=True)
+    return message
+
+
+def backoff(attempts):
+    return min(timedelta(seconds=2 ** attempts), MAX_BACKOFF)
+
+
+def _claim(batch_size, now):
+    pending = OutboxMessage.objects.filter(status=OutboxMessage.PENDING, available_at__lte=now).order_by("available_at", "id")
+    if connection.features.has_select_for_update_skip_locked:
+        pending = pending.select_for_update(skip_locked=True)
+    return list(pending[:batch_size])
+
+
+@transaction.atomic
+def process_batch(batch_size=100, now=None):
+    """Procesa hasta ``batch_size`` mensajes disponibles. Devuelve ``(procesados, fallidos)``."""
+    now = now or timezone.now()
+    done = failed = 0
+    for message in _claim(batch_size, now):
+        message.attempts += 1
+        try:
+            func = HANDLERS[message.topic]
+            with transaction.atomic():
+                func(**message.payload)
+        except Exception as exc:
+            logger.exception("Outbox %s #%s falló (intento %s)", message.topic, message.pk, message.attempts)
+            message.last_error = f"{type(exc).__name__}: {exc}"
+            if message.attempts >= MAX_ATTEMPTS:
+                message.status = OutboxMessage.FAILED
+            else:
+                message.available_at = now + backoff(message.attempts)
+            failed += 1
+        else:
+            message.status = OutboxMessage.DONE
+            message.processed_at = timezone.now()
+            done += 1
+        message.save(update_fields=["attempts", "status", "available_at", "last_error", "processed_at"])
+    return done, failed
+
+
+def drain(batch_size=100):
+    """Procesa lotes hasta vaciar lo disponible ahora. Devuelve ``(procesados, fallidos)``."""
+    total_done = total_failed = 0
+    while True:
+        done, failed = process_batch(batch_size)
+        total_done += done
+        total_failed += failed
+        if done + failed < batch_size:
+            return total_done, total_failed
+
+
+@handler("order.paid")
+def order_paid(order_id):
+    """Tras el pago: asignar repartidor (las señales de Delivery avisan a los coordinadores)."""
+    from .assignment import assign_delivery
+
+    delivery = Delivery.objects.select_related("order").get(order_id=order_id)
+    if delivery.rider_id is None:
+        assign_delivery(delivery)
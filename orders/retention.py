@@ -0,0 +1,123 @@
+"""
+Retención de notificaciones.
+
+La bandeja solo necesita lo reciente. ``apply_retention`` retira de
+``DeliveryNotification``:
+
+* las leídas con más de ``days`` días, y
+* lo que exceda ``per_user`` notificaciones por destinatario, empezando por
+  las más antiguas, leídas o no.
+
+Las filas se borran sin señales por fila: cada lote cuenta las no leídas por
+destinatario mientras las archiva y descuenta el contador con un UPDATE por
+cada cantidad distinta (a lo sumo uno por usuario), no uno por acuse.
+
+Cada lote se copia comprimido a ``NotificationArchive`` y se borra en la
+misma transacción, así que un fallo no pierde nada. Los lotes avanzan por id
+y cada uno se lee con ``iterator()`` directo al compresor: la memoria queda
+acotada a ``batch_size`` filas y no queda un cursor abierto mientras se
+borra. Los textos compartidos de coordinadores que se quedan sin acuses se
+borran con su último lote.
+"""
+import gzip
+import io
+import json
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from .models import DeliveryNotification, NotificationArchive, NotificationMessage
+from .notification_service import DeliveryNotificationService
+
+ARCHIVE_FIELDS = (
+    "id", "recipient_id", "delivery_id", "notification_type", "message", "shared_id", "shared__message", "sent_at", "read",
+)
+
+
+def archived_rows(archive):
+    """Filas guardadas en un ``NotificationArchive``, como diccionarios."""
+    with gzip.open(io.BytesIO(archive.data), "rt", encoding="utf-8") as fh:
+        for line in fh:
+            yield json.loads(line)
+
+
+@transaction.atomic
+def _archive_batch(candidates, after_id, reason, batch_size):
+    """Archiva y borra el siguiente lote con id > ``after_id``. Devuelve ``(cantidad, último id)``."""
+    rows = candidates.filter(id__gt=after_id).order_by("id").values(*ARCHIVE_FIELDS)[:batch_size]
+    buffer = io.BytesIO()
+    ids, shared_ids, sent = [], set(), []
+    unread = Counter()
+    with gzip.open(buffer, "wt", encoding="utf-8") as fh:
+        for row in rows.iterator(chunk_size=batch_size):
+            text = row.pop("shared__message")
+            if row["shared_id"]:
+                shared_ids.add(row["shared_id"])
+                row["message"] = text
+            fh.write(json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + "\n")
+            ids.append(row["id"])
+            sent.append(row["sent_at"])
+            if not row["read"]:
+                unread[row["recipient_id"]] += 1
+    if not ids:
+        return 0, after_id
+    NotificationArchive.objects.create(
+        reason=reason, count=len(ids), first_sent_at=min(sent), last_sent_at=max(sent), data=buffer.getvalue()
+    )
+    # Sin post_delete por fila: el contador se ajusta aquí agrupado
+    DeliveryNotification.objects.filter(pk__in=ids)._raw_delete(DeliveryNotification.objects.db)
+    users_by_count = defaultdict(list)
+    for user_id, count in unread.items():
+        users_by_count[count].append(user_id)
+    for count, user_ids in users_by_count.items():
+        DeliveryNotificationService.adjust_unread(user_ids, -count)
+    NotificationMessage.objects.filter(pk__in=shared_ids, receipts__isnull=True).delete()
+    return len(ids), ids[-1]
+
+
+def _archive(candidates, reason, batch_size):
+    total, last_id = 0, 0
+    while True:
+        count, last_id = _archive_batch(candidates, last_id, reason, batch_size)
+        total += count
+        if count < batch_size:
+            return total
+
+
+def _overflow(user_id, per_user):
+    """Notificaciones de ``user_id`` más allá de las ``per_user`` más recientes."""
+    inbox = DeliveryNotification.objects.filter(recipient_id=user_id)
+    first = inbox.order_by("-sent_at", "-id").values("id", "sent_at")[per_user:per_user + 1].first()
+    if first is None:
+        return inbox.none()
+    return inbox.filter(Q(sent_at__lt=first["sent_at"]) | Q(sent_at=first["sent_at"], id__lte=first["id"]))
+
+
+def apply_retention(days=90, per_user=500, batch_size=1000, now=None, dry_run=False):
+    """
+    Aplica la política de retención. Devuelve cuántas notificaciones retiró
+    por motivo; con ``dry_run`` solo cuenta (el tope se calcula sin descontar
+    lo que retiraría la antigüedad).
+    """
+    now = now or timezone.now()
+    old_read = DeliveryNotification.objects.filter(read=True, sent_at__lt=now - timedelta(days=days))
+    if dry_run:
+        aged = old_read.count()
+    else:
+        aged = _archive(old_read, NotificationArchive.AGE, batch_size)
+
+    # Los ids de quienes superan el tope caben en memoria; sus filas van por lotes
+    over_cap = list(
+        DeliveryNotification.objects.values("recipient_id")
+        .annotate(total=Count("id"))
+        .filter(total__gt=per_user)
+        .values_list("recipient_id", "total")
+    )
+    if dry_run:
+        capped = sum(total - per_user for _, total in over_cap)
+    else:
+        capped = sum(_archive(_overflow(user_id, per_user), NotificationArchive.CAP, batch_size) for user_id, _ in over_cap)
+    return {NotificationArchive.AGE: aged, NotificationArchive.CAP: capped}
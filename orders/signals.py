@@ -1,29 +1,41 @@
-from django.db.models.signals import pre_save, post_save
+from django.contrib.auth import get_user_model
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
-from .models import Delivery
+from .assignment import apply_load_change
+from .events import publish_on_commit
+from .models import Delivery, DeliveryNotification
 from .notification_service import DeliveryNotificationService
 
+User = get_user_model()
+
 
 @receiver(pre_save, sender=Delivery)
 def delivery_pre_save(sender, instance, **kwargs):
-    """Captura el estado anterior antes de guardar"""
-    if instance.pk:
-        try:
-            old_instance = Delivery.objects.get(pk=instance.pk)
-            instance._old_status = old_instance.status
-            instance._old_rider = old_instance.rider
-            instance._old_scheduled_date = old_instance.scheduled_date
-            instance._old_scheduled_window = old_instance.scheduled_window
-        except Delivery.DoesNotExist:
-            instance._old_status = None
-            instance._old_rider = None
-            instance._old_scheduled_date = None
-            instance._old_scheduled_window = None
-    else:
-        instance._old_status = None
-        instance._old_rider = None
-        instance._old_scheduled_date = None
-        instance._old_scheduled_window = None
+    """
+    Los valores anteriores salen del seguimiento de cambios del modelo (sin
+    consulta). Solo una instancia construida a mano con pk, que nunca se
+    cargó, necesita leerlos de la base de datos.
+    """
+    if instance.pk and not instance._loaded_values:
+        loaded = Delivery.objects.filter(pk=instance.pk).values(*Delivery.TRACKED_FOR_SIGNALS).first()
+        if loaded:
+            instance._loaded_values = loaded
+
+
+@receiver(post_save, sender=Delivery)
+def delivery_update_rider_load(sender, instance, **kwargs):
+    """Mantiene active_load de los repartidores dentro de la transacción del guardado"""
+    apply_load_change(
+        instance.previous('rider_id'),
+        instance.previous('status'),
+        instance.rider_id,
+        instance.status,
+    )
+
+
+@receiver(post_delete, sender=Delivery)
+def delivery_release_rider_load(sender, instance, **kwargs):
+    apply_load_change(instance.rider_id, instance.status, None, None)
 
 
 @receiver(post_save, sender=Delivery)
@@ -43,27 +55,48 @@ def delivery_post_save(sender, instance, created, **kwargs):
         return
     
     # Verificar si hay cambios importantes
-    old_status = getattr(instance, '_old_status', None)
-    old_rider = getattr(instance, '_old_rider', None)
-    old_date = getattr(instance, '_old_scheduled_date', None)
-    old_window = getattr(instance, '_old_scheduled_window', None)
+    changed = instance.changed_fields
+    old_status = instance.previous('status')
+    old_date = instance.previous('scheduled_date')
+    old_window = instance.previous('scheduled_window')
     
     # Detectar cambios de estado (solo si realmente cambió)
-    if old_status and old_status != instance.status:
+    if old_status and 'status' in changed:
         # Solo notificar si es un cambio automático o desde otro origen
         DeliveryNotificationService.notify_coordinators_status_changed(
             instance, old_status=old_status, changed_by=None
         )
     
-    # Detectar cambios de repartidor
-    if old_rider != instance.rider:
+    # Detectar cambios de repartidor (el anterior solo se consulta si cambió)
+    if 'rider_id' in changed:
+        old_rider_id = instance.previous('rider_id')
+        old_rider = User.objects.filter(pk=old_rider_id).first() if old_rider_id else None
         DeliveryNotificationService.notify_coordinators_rider_assigned(
             instance, old_rider=old_rider, changed_by=None
         )
     
     # Detectar cambios de fecha/hora programada
-    if old_date != instance.scheduled_date or old_window != instance.scheduled_window:
+    if 'scheduled_date' in changed or 'scheduled_window' in changed:
         DeliveryNotificationService.notify_coordinators_schedule_changed(
             instance, old_date=old_date, old_window=old_window, changed_by=None
         )
 
+
+@receiver(post_save, sender=DeliveryNotification)
+def notification_count_unread(sender, instance, created, **kwargs):
+    """Nueva notificación sin leer: sube el contador del destinatario"""
+    if created and not instance.read:
+        DeliveryNotificationService.adjust_unread([instance.recipient_id], 1)
+
+
+@receiver(post_save, sender=DeliveryNotification)
+def notification_publish(sender, instance, created, **kwargs):
+    """Nueva notificación: avisar a las conexiones SSE del destinatario al confirmar"""
+    if created:
+        publish_on_commit([instance])
+
+
+@receiver(post_delete, sender=DeliveryNotification)
+def notification_discount_unread(sender, instance, **kwargs):
+    if not instance.read:
+        DeliveryNotificationService.adjust_unread([instance.recipient_id], -1)
@@ -0,0 +1,117 @@
+"""
+Reserva de stock en el checkout.
+
+Cada línea se descuenta con un UPDATE condicional
+(``UPDATE ... SET stock = stock - n WHERE id = ? AND stock >= n``): la base
+de datos serializa los decrementos sobre la fila, así que dos checkouts
+concurrentes nunca dejan el stock en negativo ni venden de más, sin leer el
+stock antes ni bloquear la fila desde Python.
+
+Las reservas de pedidos no pagados caducan tras
+``settings.STOCK_RESERVATION_MINUTES``; al caducar (o fallar el pago) las
+unidades vuelven al producto. Si el pago llega después de la caducidad se
+intenta reservar de nuevo.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from catalog.models import Product
+from .models import StockReservation
+
+
+class OutOfStock(Exception):
+    def __init__(self, product, requested):
+        self.product = product
+        self.requested = requested
+        super().__init__(f"Stock insuficiente para {product} ({requested} solicitadas)")
+
+
+def _take(product_id, quantity):
+    """Decremento atómico; False si no hay ``quantity`` unidades disponibles."""
+    return Product.objects.add_stock(product_id, -quantity, stock__gte=quantity) == 1
+
+
+def _give_back(totals):
+    for product_id, quantity in totals.items():
+        Product.objects.add_stock(product_id, quantity)
+
+
+def reservation_expiry():
+    return timezone.now() + timedelta(minutes=settings.STOCK_RESERVATION_MINUTES)
+
+
+@transaction.atomic
+def reserve_stock(order, lines):
+    """
+    Reserva ``lines`` (pares producto, cantidad) para ``order``.
+    Lanza OutOfStock (y deshace lo ya reservado) si alguna línea no cabe.
+    """
+    wanted = Counter()
+    products = {}
+    for product, quantity in lines:
+        wanted[product.pk] += quantity
+        products[product.pk] = product
+    # Orden fijo por id: en PostgreSQL evita interbloqueos entre checkouts con los mismos productos
+    for product_id in sorted(wanted):
+        if _take(product_id, wanted[product_id]):
+            continue
+        # Antes de rechazar, devolver al stock lo retenido por reservas vencidas
+        if release_expired_reservations(product_ids=[product_id]) and _take(product_id, wanted[product_id]):
+            continue
+        raise OutOfStock(products[product_id], wanted[product_id])
+
+    expires_at = reservation_expiry()
+    return StockReservation.objects.bulk_create(
+        StockReservation(order=order, product_id=product_id, quantity=quantity, expires_at=expires_at)
+        for product_id, quantity in sorted(wanted.items())
+    )
+
+
+def _release(reservations):
+    """Libera las reservas activas indicadas; devuelve cuántas liberó."""
+    totals = Counter()
+    count = 0
+    for reservation in reservations:
+        # Transición condicional: si el pago la confirmó entretanto, no se toca
+        if StockReservation.objects.filter(pk=reservation.pk, status=StockReservation.ACTIVE).update(
+            status=StockReservation.RELEASED
+        ):
+            totals[reservation.product_id] += reservation.quantity
+            count += 1
+    _give_back(totals)
+    return count
+
+
+@transaction.atomic
+def release_expired_reservations(product_ids=None, now=None):
+    """Devuelve al stock las reservas activas vencidas. Retorna el número liberado."""
+    expired = StockReservation.objects.filter(status=StockReservation.ACTIVE, expires_at__lte=now or timezone.now())
+    if product_ids is not None:
+        expired = expired.filter(product_id__in=product_ids)
+    return _release(list(expired.only("id", "product_id", "quantity")))
+
+
+@transaction.atomic
+def release_order_reservations(order):
+    """El pago falló: el stock del pedido vuelve a estar disponible de inmediato."""
+    return _release(list(order.stock_reservations.filter(status=StockReservation.ACTIVE)))
+
+
+@transaction.atomic
+def confirm_order_reservations(order):
+    """
+    El pedido se pagó: sus reservas pasan a confirmadas. Las que ya se
+    liberaron se vuelven a tomar; lanza OutOfStock si ya no hay unidades.
+    """
+    for reservation in order.stock_reservations.select_related("product").exclude(status=StockReservation.CONFIRMED):
+        confirmed = StockReservation.objects.filter(pk=reservation.pk, status=StockReservation.ACTIVE).update(
+            status=StockReservation.CONFIRMED
+        )
+        if confirmed:
+            continue
+        if not _take(reservation.product_id, reservation.quantity):
+            raise OutOfStock(reservation.product, reservation.quantity)
+        StockReservation.objects.filter(pk=reservation.pk).update(status=StockReservation.CONFIRMED)
@@ -1,3 +1,970 @@
-from django.test import TestCase
+import asyncio
+import json
+import re
+import threading
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.middleware import RIDER
+from accounts.models import UserProfile
+from catalog.models import Category, Product
+from .events import get_broker, hub
+from .assignment import _slot_usage, assign_batch, assign_deliveries, assign_delivery, recount_rider_loads
+from .models import (
+    Delivery, DeliveryFailureReason, DeliveryNotification, NotificationArchive, NotificationMessage, Order, OutboxMessage, StockReservation,
+)
+from .notification_service import DeliveryNotificationService
+from .outbox import HANDLERS, drain, handler, process_batch
+from .retention import apply_retention, archived_rows
+from .transitions import InvalidTransition, apply_transition
+from .stock import OutOfStock, confirm_order_reservations, release_expired_reservations, reserve_stock
+
+
+CHECKOUT_FORM = {
+    "full_name": "Ana Cliente",
+    "email": "ana@example.com",
+    "address": "Calle 1",
+    "city": "Medellín",
+    "postal_code": "050001",
+}
+
+
+class StockReservationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user("ana", password="x")
+        category = Category.objects.create(name="Zapatos")
+        cls.product = Product.objects.create(category=category, name="Tenis", price=Decimal("50.00"), stock=3)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def new_order(self):
+        return Order.objects.create(user=self.user, **CHECKOUT_FORM)
+
+    def stock(self):
+        self.product.refresh_from_db()
+        return self.product.stock
+
+    def checkout(self, quantity):
+        self.client.post(reverse("cart:add", args=[self.product.id]), {"quantity": quantity})
+        return self.client.post(reverse("orders:checkout"), CHECKOUT_FORM)
+
+    def test_checkout_reserves_stock(self):
+        response = self.checkout(2)
+        self.assertRedirects(response, reverse("payments:simulate"), fetch_redirect_response=False)
+        self.assertEqual(self.stock(), 1)
+        reservation = StockReservation.objects.get()
+        self.assertEqual((reservation.quantity, reservation.status), (2, StockReservation.ACTIVE))
+
+    def test_checkout_without_stock_creates_no_order(self):
+        response = self.checkout(4)
+        self.assertRedirects(response, reverse("cart:detail"), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.stock(), 3)
+
+    def test_failed_reservation_rolls_back_earlier_lines(self):
+        other = Product.objects.create(category=self.product.category, name="Botas", price=Decimal("90"), stock=5)
+        with self.assertRaises(OutOfStock):
+            reserve_stock(self.new_order(), [(other, 2), (self.product, 9)])
+        other.refresh_from_db()
+        self.assertEqual((other.stock, self.stock()), (5, 3))
+
+    def test_expired_reservations_return_stock(self):
+        reserve_stock(self.new_order(), [(self.product, 3)])
+        self.assertEqual(release_expired_reservations(), 0)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+        # Un checkout sin stock libera primero las reservas vencidas de ese producto
+        reserve_stock(self.new_order(), [(self.product, 2)])
+        self.assertEqual(self.stock(), 1)
+        self.assertEqual(StockReservation.objects.filter(status=StockReservation.RELEASED).count(), 1)
+
+    def test_payment_after_expiry_takes_stock_again(self):
+        order = self.new_order()
+        reserve_stock(order, [(self.product, 2)])
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+        release_expired_reservations()
+        self.assertEqual(self.stock(), 3)
+        confirm_order_reservations(order)
+        self.assertEqual(self.stock(), 1)
+        self.assertEqual(order.stock_reservations.get().status, StockReservation.CONFIRMED)
+        # Confirmada no vuelve a liberarse al caducar
+        self.assertEqual(release_expired_reservations(), 0)
+
+    def test_payment_failure_releases_reservation(self):
+        self.checkout(2)
+        self.client.get(reverse("payments:failed"))
+        self.assertEqual(self.stock(), 3)
+        self.client.get(reverse("payments:success"))
+        self.assertEqual(self.stock(), 1)
+        self.assertTrue(Order.objects.get().paid)
+
+
+class CartHydrationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user("beto", password="x")
+        category = Category.objects.create(name="Proteinas")
+        cls.products = [
+            Product.objects.create(category=category, name=f"Proteína {i}", price=Decimal("10.50"), stock=50)
+            for i in range(30)
+        ]
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        for product in self.products:
+            self.client.post(reverse("cart:add", args=[product.id]), {"quantity": 2})
+
+    def test_views_load_all_lines_with_one_product_query(self):
+        for url in (reverse("cart:detail"), reverse("orders:checkout")):
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as ctx:
+                    response = self.client.get(url)
+                self.assertEqual(response.context["total"], Decimal("630.00"))
+                self.assertEqual(len(response.context["items"]), 30)
+                product_queries = [q for q in ctx.captured_queries if 'FROM "catalog_product"' in q["sql"]]
+                self.assertEqual(len(product_queries), 1)
+
+    def test_vanished_products_are_dropped_with_a_warning(self):
+        gone = self.products[0]
+        Product.objects.filter(pk=gone.pk).delete()
+        response = self.client.post(reverse("orders:checkout"), CHECKOUT_FORM)
+        # Primero se muestra el carrito corregido; no se crea el pedido a ciegas
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Order.objects.exists())
+        self.assertContains(response, "ya no están disponibles")
+        self.assertNotIn(gone, [item["product"] for item in self.client.get(reverse("cart:detail")).context["items"]])
+        response = self.client.post(reverse("orders:checkout"), CHECKOUT_FORM)
+        self.assertEqual(Order.objects.get().total_amount, Decimal("609.00"))
+
+
+class IdempotentCheckoutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user("carla", password="x")
+        category = Category.objects.create(name="Lociones")
+        cls.products = [
+            Product.objects.create(category=category, name=f"Loción {i}", price=Decimal("12.25"), stock=10)
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        for product in self.products:
+            self.client.post(reverse("cart:add", args=[product.id]), {"quantity": 2})
+        self.form = {**CHECKOUT_FORM, "idempotency_key": self.client.get(reverse("orders:checkout")).context["idempotency_key"]}
+
+    def test_items_are_inserted_in_one_statement_with_total_up_front(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(reverse("orders:checkout"), self.form)
+        inserts = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith("INSERT")]
+        self.assertEqual(sum('"orders_orderitem"' in sql for sql in inserts), 1)
+        self.assertFalse(any(q["sql"].startswith('UPDATE "orders_order"') for q in ctx.captured_queries))
+        order = Order.objects.get()
+        self.assertEqual((order.total_amount, order.items.count()), (Decimal("122.50"), 5))
+
+    def test_double_submit_returns_the_existing_order(self):
+        first = self.client.post(reverse("orders:checkout"), self.form)
+        second = self.client.post(reverse("orders:checkout"), self.form)
+        self.assertEqual(first.url, second.url)
+        order = Order.objects.get()
+        self.assertEqual(self.client.session["last_order_id"], order.id)
+        # El stock se reservó una sola vez
+        self.assertEqual(StockReservation.objects.filter(order=order).count(), 5)
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).stock, 8)
+
+    def test_retry_after_payment_goes_to_the_summary(self):
+        self.client.post(reverse("orders:checkout"), self.form)
+        order = Order.objects.get()
+        Order.objects.filter(pk=order.pk).update(paid=True)
+        response = self.client.post(reverse("orders:checkout"), self.form)
+        self.assertRedirects(response, reverse("orders:summary", args=[order.id]), fetch_redirect_response=False)
+
+    def test_new_checkout_page_means_new_order(self):
+        self.client.post(reverse("orders:checkout"), self.form)
+        self.client.post(reverse("cart:add", args=[self.products[0].id]))
+        form = {**CHECKOUT_FORM, "idempotency_key": self.client.get(reverse("orders:checkout")).context["idempotency_key"]}
+        self.client.post(reverse("orders:checkout"), form)
+        self.assertEqual(Order.objects.count(), 2)
+
+
+class RiderLoadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.customer = User.objects.create_user("dora", password="x")
+        cls.riders = []
+        for name in ("rafa", "rita", "rosa"):
+            rider = User.objects.create_user(name, password="x")
+            UserProfile.objects.update_or_create(user=rider, defaults={"role": RIDER})
+            cls.riders.append(rider)
+
+    def new_delivery(self, **kwargs):
+        order = Order.objects.create(user=self.customer, **CHECKOUT_FORM)
+        return Delivery.objects.create(order=order, **kwargs)
+
+    def loads(self):
+        return list(UserProfile.objects.filter(role=RIDER).order_by("user_id").values_list("active_load", flat=True))
+
+    def test_counters_follow_assignment_and_status(self):
+        delivery = self.new_delivery(rider=self.riders[0], status="asignada")
+        self.assertEqual(self.loads(), [1, 0, 0])
+        delivery.rider = self.riders[1]
+        delivery.save()
+        self.assertEqual(self.loads(), [0, 1, 0])
+        delivery.status = "en_ruta"
+        delivery.save()
+        self.assertEqual(self.loads(), [0, 1, 0])
+        delivery.status = "entregada"
+        delivery.save()
+        self.assertEqual(self.loads(), [0, 0, 0])
+        self.new_delivery(rider=self.riders[2]).delete()
+        self.assertEqual(self.loads(), [0, 0, 0])
+
+    def test_least_loaded_rider_is_chosen(self):
+        self.new_delivery(rider=self.riders[0], status="asignada")
+        self.new_delivery(rider=self.riders[1], status="en_ruta")
+        self.new_delivery(rider=self.riders[1], status="entregada")
+        self.assertEqual(assign_delivery(self.new_delivery()), self.riders[2])
+        # Empate: gana el de menor id
+        self.assertEqual(assign_delivery(self.new_delivery()), self.riders[0])
+        self.assertEqual(self.loads(), [2, 1, 1])
+
+    def test_recount_fixes_drift_from_bulk_updates(self):
+        self.new_delivery(rider=self.riders[0], status="asignada")
+        Delivery.objects.update(status="entregada")
+        self.assertEqual(self.loads(), [1, 0, 0])
+        recount_rider_loads()
+        self.assertEqual(self.loads(), [0, 0, 0])
+
+    def test_payment_assignment_does_not_scan_deliveries(self):
+        for _ in range(5):
+            self.new_delivery(rider=self.riders[0], status="asignada")
+        order = Order.objects.create(user=self.customer, **CHECKOUT_FORM)
+        self.client.force_login(self.customer)
+        session = self.client.session
+        session["last_order_id"] = order.id
+        session.save()
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse("payments:success"))
+            drain()
+        self.assertEqual(order.delivery.rider, self.riders[1])
+        self.assertFalse(any('"orders_delivery"' in q["sql"] and "COUNT(" in q["sql"] for q in ctx.captured_queries))
+
+
+class AssignmentEngineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.customer = User.objects.create_user("eva", password="x")
+        cls.north = cls.rider("nico", zones="050, Bello", window_capacity=2)
+        cls.south = cls.rider("sara", zones="Envigado", window_capacity=2)
+        cls.anywhere = cls.rider("toni", window_capacity=1)
+
+    @classmethod
+    def rider(cls, username, **profile):
+        user = get_user_model().objects.create_user(username, password="x")
+        UserProfile.objects.update_or_create(user=user, defaults={"role": RIDER, **profile})
+        return user
+
+    def new_delivery(self, city="Medellín", postal_code="050001", **kwargs):
+        order = Order.objects.create(user=self.customer, **{**CHECKOUT_FORM, "city": city, "postal_code": postal_code})
+        return Delivery.objects.create(order=order, **kwargs)
+
+    def test_zone_riders_go_first(self):
+        self.assertEqual(assign_delivery(self.new_delivery()), self.north)
+        self.assertEqual(assign_delivery(self.new_delivery(city="envigado", postal_code="055420")), self.south)
+        # Sin repartidor de la zona se usa uno sin zonas
+        self.assertEqual(assign_delivery(self.new_delivery(city="Cali", postal_code="760001")), self.anywhere)
+
+    def test_window_capacity_overflows_to_generalists(self):
+        date = timezone.localdate()
+        slot = {"scheduled_date": date, "scheduled_window": "14:00-16:00"}
+        riders = [assign_delivery(self.new_delivery(**slot)) for _ in range(4)]
+        self.assertEqual(riders, [self.north, self.north, self.anywhere, None])
+        # Otra franja del mismo día vuelve a tener hueco
+        self.assertEqual(assign_delivery(self.new_delivery(scheduled_date=date, scheduled_window="16:00-18:00")), self.north)
+
+    def test_batch_assignment_balances_load(self):
+        for _ in range(6):
+            self.new_delivery()
+        for _ in range(2):
+            self.new_delivery(city="Envigado", postal_code="055420")
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(assign_deliveries(batch_size=5), (8, 8))
+        self.assertLess(len(ctx.captured_queries), 25)
+        counts = Counter(Delivery.objects.values_list("rider__username", flat=True))
+        self.assertEqual(counts, {"nico": 6, "sara": 2})
+        self.assertEqual(set(Delivery.objects.values_list("status", flat=True)), {"asignada"})
+        loads = dict(UserProfile.objects.filter(role=RIDER).values_list("user__username", "active_load"))
+        self.assertEqual(loads, {"nico": 6, "sara": 2, "toni": 0})
+        # Sin --reassign no se toca lo ya asignado
+        self.assertEqual(assign_deliveries(), (0, 0))
+
+    def test_batch_skips_deliveries_changed_after_the_read(self):
+        first, second = self.new_delivery(), self.new_delivery()
+        batch = list(Delivery.objects.filter(pk__in=[first.pk, second.pk]).select_related("order").order_by("pk"))
+        # Un manager asigna la primera a mano mientras el planificador trabaja
+        self.assertTrue(apply_transition(Delivery.objects.get(pk=first.pk), "asignada", rider_id=self.south.id))
+        self.assertEqual(assign_batch(batch), 1)
+        riders = dict(Delivery.objects.values_list("pk", "rider__username"))
+        self.assertEqual(riders, {first.pk: "sara", second.pk: "nico"})
+        loads = dict(UserProfile.objects.filter(role=RIDER).values_list("user__username", "active_load"))
+        self.assertEqual(loads, {"nico": 1, "sara": 1, "toni": 0})
+        self.assertEqual(recount_rider_loads(), {self.north.id: 1, self.south.id: 1})
+
+    def test_reassign_moves_rescheduled_deliveries_out_of_full_windows(self):
+        date = timezone.localdate()
+        slot = {"scheduled_date": date, "scheduled_window": "9:00-11:00"}
+        for _ in range(3):
+            self.new_delivery(rider=self.north, status="reprogramada", **slot)
+        self.assertEqual(assign_deliveries(reassign=True), (3, 1))
+        counts = Counter(Delivery.objects.values_list("rider__username", flat=True))
+        self.assertEqual(counts, {"nico": 2, "toni": 1})
+        self.assertEqual(set(Delivery.objects.values_list("status", flat=True)), {"reprogramada"})
+        loads = dict(UserProfile.objects.filter(role=RIDER).values_list("user__username", "active_load"))
+        self.assertEqual(loads, {"nico": 2, "sara": 0, "toni": 1})
+
+
+class OutboxTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.customer = User.objects.create_user("fede", password="x")
+        cls.rider = User.objects.create_user("ramon", password="x")
+        UserProfile.objects.update_or_create(user=cls.rider, defaults={"role": RIDER})
+
+    def pay(self):
+        order = Order.objects.create(user=self.customer, **CHECKOUT_FORM)
+        self.client.force_login(self.customer)
+        session = self.client.session
+        session["last_order_id"] = order.id
+        session.save()
+        response = self.client.get(reverse("payments:success"))
+        self.assertRedirects(response, reverse("orders:summary", args=[order.id]), fetch_redirect_response=False)
+        return order
+
+    @override_settings(OUTBOX_INLINE=False)
+    def test_payment_defers_assignment_to_the_worker(self):
+        order = self.pay()
+        delivery = Delivery.objects.get(order=order)
+        self.assertIsNone(delivery.rider_id)
+        self.assertEqual(OutboxMessage.objects.get().payload, {"order_id": order.id})
+        # Volver a la página de éxito no encola otra vez
+        self.client.get(reverse("payments:success"))
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+        self.assertEqual(drain(), (1, 0))
+        delivery.refresh_from_db()
+        self.assertEqual((delivery.rider, delivery.status), (self.rider, "asignada"))
+        self.assertEqual(OutboxMessage.objects.get().status, OutboxMessage.DONE)
+        self.assertEqual(drain(), (0, 0))
+
+    @override_settings(OUTBOX_INLINE=True)
+    def test_inline_mode_assigns_after_commit_without_a_worker(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            order = self.pay()
+        delivery = Delivery.objects.get(order=order)
+        self.assertEqual((delivery.rider, delivery.status), (self.rider, "asignada"))
+        self.assertEqual(OutboxMessage.objects.get().status, OutboxMessage.DONE)
+
+    def test_failures_are_retried_with_backoff_then_given_up(self):
+        calls = []
+
+        @handler("test.flaky")
+        def flaky(**payload):
+            calls.append(payload)
+            Category.objects.create(name=f"Parcial {len(calls)}")
+            raise RuntimeError("caído")
+
+        self.addCleanup(HANDLERS.pop, "test.flaky")
+        OutboxMessage.objects.create(topic="test.flaky", payload={"n": 1})
+        now = timezone.now()
+        with self.assertLogs("orders.outbox", "ERROR"):
+            self.assertEqual(process_batch(now=now), (0, 1))
+        # El trabajo parcial del handler se deshace con su savepoint
+        self.assertFalse(Category.objects.exists())
+        message = OutboxMessage.objects.get()
+        self.assertEqual((message.attempts, message.status), (1, OutboxMessage.PENDING))
+        self.assertEqual(message.last_error, "RuntimeError: caído")
+        self.assertEqual(process_batch(now=now), (0, 0))
+        with self.assertLogs("orders.outbox", "ERROR"):
+            for _ in range(4):
+                now += timedelta(hours=1)
+                process_batch(now=now)
+        message.refresh_from_db()
+        self.assertEqual((message.attempts, message.status), (5, OutboxMessage.FAILED))
+        self.assertEqual(len(calls), 5)
+
+
+class DeliveryChangeTrackingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.customer = User.objects.create_user("gabi", password="x")
+        cls.manager = User.objects.create_user("mara", password="x")
+        UserProfile.objects.update_or_create(user=cls.manager, defaults={"role": "manager"})
+        cls.rider = User.objects.create_user("rodri", password="x")
+        UserProfile.objects.update_or_create(user=cls.rider, defaults={"role": RIDER})
+        order = Order.objects.create(user=cls.customer, **CHECKOUT_FORM)
+        cls.delivery_id = Delivery.objects.create(order=order).pk
+
+    def load(self):
+        return Delivery.objects.select_related("order").get(pk=self.delivery_id)
+
+    def test_previous_values_and_changed_fields(self):
+        delivery = self.load()
+        self.assertEqual(delivery.changed_fields, set())
+        delivery.status = "asignada"
+        delivery.rider = self.rider
+        self.assertEqual(delivery.changed_fields, {"status", "rider_id"})
+        self.assertEqual((delivery.previous("status"), delivery.previous("rider_id")), ("pendiente", None))
+        delivery.save()
+        self.assertEqual(delivery.changed_fields, set())
+        self.assertEqual(delivery.previous("status"), "asignada")
+
+    def test_save_writes_only_changed_columns_without_reselecting(self):
+        delivery = self.load()
+        delivery.status = "en_ruta"
+        with CaptureQueriesContext(connection) as ctx:
+            delivery.save()
+        delivery_sql = [q["sql"] for q in ctx.captured_queries if '"orders_delivery"' in q["sql"]]
+        self.assertEqual(len(delivery_sql), 1)
+        self.assertTrue(delivery_sql[0].startswith('UPDATE "orders_delivery" SET "status" = '))
+        self.assertNotIn('"notes"', delivery_sql[0])
+        # El aviso a coordinadores sigue saliendo de la señal
+        notification = DeliveryNotification.objects.get(recipient=self.manager)
+        self.assertEqual(notification.notification_type, "coordinator_status_changed")
+
+    def test_deferred_field_assigned_after_load_is_saved(self):
+        delivery = Delivery.objects.only("id", "status").get(pk=self.delivery_id)
+        delivery.notes = "hola"
+        self.assertEqual(delivery.changed_fields, {"notes"})
+        delivery.save()
+        self.assertEqual(self.load().notes, "hola")
+        self.assertEqual(delivery.changed_fields, set())
+
+    def test_concurrent_edits_of_other_columns_survive(self):
+        delivery = self.load()
+        Delivery.objects.filter(pk=self.delivery_id).update(notes="llamar antes")
+        delivery.status = "asignada"
+        delivery.save()
+        self.assertEqual(self.load().notes, "llamar antes")
+
+    def test_unloaded_instance_falls_back_to_a_read(self):
+        Delivery.objects.filter(pk=self.delivery_id).update(rider=self.rider, status="asignada")
+        recount_rider_loads()
+        delivery = self.load()
+        detached = Delivery(pk=delivery.pk, order_id=delivery.order_id, created_at=delivery.created_at, status="entregada", rider=self.rider)
+        detached.save()
+        self.assertEqual(UserProfile.objects.get(user=self.rider).active_load, 0)
+
+
+class CoordinatorNotificationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        customer = User.objects.create_user("hugo", password="x")
+        cls.managers = []
+        for i in range(5):
+            manager = User.objects.create_user(f"coord{i}", password="x")
+            UserProfile.objects.update_or_create(user=manager, defaults={"role": "manager"})
+            cls.managers.append(manager)
+        cls.delivery = Delivery.objects.create(order=Order.objects.create(user=customer, **CHECKOUT_FORM))
+
+    def test_alert_text_is_stored_once_with_one_receipt_insert(self):
+        with CaptureQueriesContext(connection) as ctx:
+            receipts = DeliveryNotificationService.notify_coordinators(self.delivery, "coordinator_status_changed", "Texto largo\n" * 20)
+        self.assertEqual(len(receipts), 5)
+        inserts = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith("INSERT")]
+        self.assertEqual(len(inserts), 2)
+        self.assertEqual(NotificationMessage.objects.count(), 1)
+        self.assertEqual(set(DeliveryNotification.objects.values_list("message", flat=True)), {""})
+
+    def test_inbox_shows_shared_text_with_a_constant_query_count(self):
+        for i in range(10):
+            DeliveryNotificationService.notify_coordinators(self.delivery, "coordinator_status_changed", f"Aviso {i}")
+        self.client.force_login(self.managers[0])
+        with self.assertNumQueries(3):
+            # sesión, usuario con perfil y una consulta para notificaciones con entrega, pedido y texto
+            response = self.client.get(reverse("orders:notifications"))
+        self.assertContains(response, "Aviso 9")
+        self.assertEqual(len(response.context["notifications"]), 10)
+        # Leer es por destinatario
+        notification = response.context["notifications"][0]
+        self.client.post(reverse("orders:notifications"), {"notification_id": notification.id})
+        self.assertEqual(DeliveryNotification.objects.filter(shared=notification.shared, read=True).count(), 1)
+
+
+class UnreadNotificationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.customer = User.objects.create_user("ines", password="x")
+        UserProfile.objects.update_or_create(user=cls.customer, defaults={"role": "cliente"})
+        cls.delivery = Delivery.objects.create(order=Order.objects.create(user=cls.customer, **CHECKOUT_FORM))
+        cls.notifications = [
+            DeliveryNotification.objects.create(
+                delivery=cls.delivery, notification_type="approaching", recipient=cls.customer, message=f"Aviso {i}"
+            )
+            for i in range(25)
+        ]
+
+    def setUp(self):
+        self.client.force_login(self.customer)
+
+    def unread(self):
+        return UserProfile.objects.get(user=self.customer).unread_notifications
+
+    def test_counter_follows_creation_reads_and_deletes(self):
+        self.assertEqual(self.unread(), 25)
+        self.client.post(reverse("orders:notifications"), {"notification_id": self.notifications[0].id})
+        # Repetir no descuenta dos veces
+        self.client.post(reverse("orders:notifications"), {"notification_id": self.notifications[0].id})
+        self.assertEqual(self.unread(), 24)
+        selected = [n.id for n in self.notifications[:5]]
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(reverse("orders:notifications"), {"action": "selected", "notification_ids": selected})
+        self.assertEqual(sum(q["sql"].startswith('UPDATE "orders_deliverynotification"') for q in ctx.captured_queries), 1)
+        self.assertEqual(self.unread(), 20)
+        self.notifications[-1].delete()
+        self.assertEqual(self.unread(), 19)
+        self.client.post(reverse("orders:notifications"), {"action": "all"})
+        self.assertEqual(self.unread(), 0)
+        self.assertFalse(DeliveryNotification.objects.filter(read=False).exists())
+
+    def test_pages_follow_the_cursor(self):
+        first = self.client.get(reverse("orders:notifications"))
+        self.assertEqual([n.message for n in first.context["notifications"]][:2], ["Aviso 24", "Aviso 23"])
+        self.assertTrue(first.context["page"].has_next)
+        second = self.client.get(reverse("orders:notifications") + "?" + first.context["next_query"])
+        self.assertEqual([n.message for n in second.context["notifications"]], [f"Aviso {i}" for i in range(4, -1, -1)])
+        # Marcar desde la segunda página vuelve a la misma página
+        response = self.client.post(reverse("orders:notifications") + "?" + first.context["next_query"], {"action": "all"})
+        self.assertEqual(response.url, reverse("orders:notifications") + "?" + first.context["next_query"])
+
+    def test_header_badge_needs_no_extra_query(self):
+        with self.assertNumQueries(2):
+            # sesión y usuario con perfil: el contador ya viene con el perfil
+            response = self.client.get(reverse("cart:detail"))
+        self.assertContains(response, '<span class="badge bg-danger rounded-pill js-unread-badge">25</span>', html=True)
+
+    def test_coordinator_receipts_raise_every_counter_at_once(self):
+        managers = []
+        for i in range(3):
+            manager = get_user_model().objects.create_user(f"jefe{i}", password="x")
+            UserProfile.objects.update_or_create(user=manager, defaults={"role": "manager"})
+            managers.append(manager)
+        DeliveryNotificationService.notify_coordinators(self.delivery, "coordinator_status_changed", "Cambio")
+        counts = UserProfile.objects.filter(user__in=managers).values_list("unread_notifications", flat=True)
+        self.assertEqual(list(counts), [1, 1, 1])
+
+
+class RecordingBroker:
+    def __init__(self):
+        self.events = []
+
+    def publish(self, user_id, event):
+        self.events.append((user_id, event))
+
+
+class NotificationStreamTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.customer = User.objects.create_user("julia", password="x")
+        UserProfile.objects.update_or_create(user=cls.customer, defaults={"role": "cliente"})
+        cls.delivery = Delivery.objects.create(order=Order.objects.create(user=cls.customer, **CHECKOUT_FORM))
+
+    def notify(self, text):
+        return DeliveryNotification.objects.create(
+            delivery=self.delivery, notification_type="approaching", recipient=self.customer, message=text
+        )
+
+    async def test_publish_from_another_thread_reaches_every_connection_of_the_user(self):
+        first, second = hub.subscribe(self.customer.id), hub.subscribe(self.customer.id)
+        other = hub.subscribe(self.customer.id + 1000)
+        try:
+            publisher = threading.Thread(target=hub.publish, args=(self.customer.id, {"id": 1}))
+            publisher.start()
+            publisher.join()
+            for _, queue in (first, second):
+                self.assertEqual(await asyncio.wait_for(queue.get(), 1), {"id": 1})
+            self.assertTrue(other[1].empty())
+        finally:
+            for subscription in (first, second):
+                hub.unsubscribe(self.customer.id, subscription)
+            hub.unsubscribe(self.customer.id + 1000, other)
+        self.assertEqual(hub.connections(self.customer.id), 0)
+
+    @override_settings(NOTIFICATION_BROKER="orders.tests.RecordingBroker")
+    def test_notifications_are_published_only_after_commit(self):
+        manager = get_user_model().objects.create_user("karla", password="x")
+        UserProfile.objects.update_or_create(user=manager, defaults={"role": "manager"})
+        broker = get_broker()
+        broker.events.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            notification = self.notify("En camino")
+            DeliveryNotificationService.notify_coordinators(self.delivery, "coordinator_status_changed", "Cambio")
+            self.assertEqual(broker.events, [])
+        self.assertEqual(
+            [(user_id, event["message"]) for user_id, event in broker.events],
+            [(self.customer.id, "En camino"), (manager.id, "Cambio")],
+        )
+        event = broker.events[0][1]
+        self.assertEqual(event["id"], notification.id)
+        self.assertEqual(event["url"], reverse("orders:delivery_detail", args=[self.delivery.order_id]))
+
+    async def test_stream_replays_missed_notifications_then_pushes_new_ones(self):
+        seen = await sync_to_async(self.notify)("Vieja")
+        missed = await sync_to_async(self.notify)("Perdida")
+        await self.async_client.aforce_login(self.customer)
+        response = await self.async_client.get(reverse("orders:notification_stream"), headers={"Last-Event-ID": str(seen.id)})
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        chunks = aiter(response.streaming_content)
+        self.assertEqual(await anext(chunks), b"retry: 5000\n\n")
+        replayed = (await anext(chunks)).decode()
+        self.assertTrue(replayed.startswith(f"id: {missed.id}\nevent: notification\n"))
+        self.assertEqual(json.loads(replayed.split("data: ", 1)[1])["message"], "Perdida")
+        hub.publish(self.customer.id, {"id": missed.id + 1})
+        self.assertIn(f"id: {missed.id + 1}\n", (await anext(chunks)).decode())
+        await chunks.aclose()
+
+    def test_stream_requires_login_and_asgi(self):
+        self.assertEqual(self.client.get(reverse("orders:notification_stream")).status_code, 401)
+        self.client.force_login(self.customer)
+        # Bajo WSGI no se abre la conexión larga
+        self.assertEqual(self.client.get(reverse("orders:notification_stream")).status_code, 204)
+
+    def test_pages_open_the_stream_only_when_enabled(self):
+        self.client.force_login(self.customer)
+        url = reverse("orders:notifications")
+        self.assertNotContains(self.client.get(url), "EventSource(")
+        with self.settings(NOTIFICATION_STREAM=True):
+            self.assertContains(self.client.get(url), "EventSource(")
+
+
+class NotificationRetentionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.customer = User.objects.create_user("lucia", password="x")
+        UserProfile.objects.update_or_create(user=cls.customer, defaults={"role": "cliente"})
+        cls.manager = User.objects.create_user("mario", password="x")
+        UserProfile.objects.update_or_create(user=cls.manager, defaults={"role": "manager"})
+        cls.delivery = Delivery.objects.create(order=Order.objects.create(user=cls.customer, **CHECKOUT_FORM))
+
+    def notify(self, text, days_ago, read=False):
+        notification = DeliveryNotification.objects.create(
+            delivery=self.delivery, notification_type="approaching", recipient=self.customer, message=text, read=read
+        )
+        DeliveryNotification.objects.filter(pk=notification.pk).update(sent_at=timezone.now() - timedelta(days=days_ago))
+        return notification
+
+    def unread(self):
+        return UserProfile.objects.get(user=self.customer).unread_notifications
+
+    def test_old_read_notifications_are_archived_in_batches_and_deleted(self):
+        for i in range(5):
+            self.notify(f"Vieja {i}", days_ago=100, read=True)
+        recent = self.notify("Reciente", days_ago=1, read=True)
+        old_unread = self.notify("Sin leer", days_ago=100)
+        result = apply_retention(days=90, batch_size=2)
+        self.assertEqual(result, {"antiguedad": 5, "tope": 0})
+        self.assertEqual(set(DeliveryNotification.objects.values_list("id", flat=True)), {recent.id, old_unread.id})
+        archives = NotificationArchive.objects.order_by("id")
+        self.assertEqual([archive.count for archive in archives], [2, 2, 1])
+        rows = [row for archive in archives for row in archived_rows(archive)]
+        self.assertEqual([row["message"] for row in rows], [f"Vieja {i}" for i in range(5)])
+        self.assertEqual(rows[0]["recipient_id"], self.customer.id)
+        self.assertEqual(self.unread(), 1)
+
+    def test_per_user_cap_keeps_the_newest_and_discounts_unread(self):
+        for i in range(6):
+            self.notify(f"Aviso {i}", days_ago=10 - i)
+        self.assertEqual(self.unread(), 6)
+        self.assertEqual(apply_retention(per_user=4, dry_run=True), {"antiguedad": 0, "tope": 2})
+        self.assertFalse(NotificationArchive.objects.exists())
+        result = apply_retention(per_user=4)
+        self.assertEqual(result["tope"], 2)
+        kept = DeliveryNotification.objects.order_by("sent_at").values_list("message", flat=True)
+        self.assertEqual(list(kept), ["Aviso 2", "Aviso 3", "Aviso 4", "Aviso 5"])
+        self.assertEqual(self.unread(), 4)
+        self.assertEqual(NotificationArchive.objects.get().reason, NotificationArchive.CAP)
+
+    def test_purge_discounts_unread_with_one_update_per_user(self):
+        for i in range(8):
+            self.notify(f"Aviso {i}", days_ago=20 - i)
+        for i in range(5):
+            notification = DeliveryNotification.objects.create(
+                delivery=self.delivery, notification_type="approaching", recipient=self.manager, message=f"Coord {i}"
+            )
+            DeliveryNotification.objects.filter(pk=notification.pk).update(sent_at=timezone.now() - timedelta(days=20 - i))
+        with CaptureQueriesContext(connection) as queries:
+            result = apply_retention(per_user=2)
+        self.assertEqual(result["tope"], 9)
+        self.assertEqual(self.unread(), 2)
+        self.assertEqual(UserProfile.objects.get(user=self.manager).unread_notifications, 2)
+        table = UserProfile._meta.db_table
+        counter_updates = [q["sql"] for q in queries.captured_queries if q["sql"].startswith(f'UPDATE "{table}"')]
+        self.assertEqual(len(counter_updates), 2)
+
+    def test_shared_coordinator_text_is_archived_and_removed_with_its_last_receipt(self):
+        receipt, = DeliveryNotificationService.notify_coordinators(self.delivery, "coordinator_status_changed", "Cambio largo")
+        DeliveryNotification.objects.filter(pk=receipt.pk).update(read=True, sent_at=timezone.now() - timedelta(days=200))
+        apply_retention(days=90)
+        row, = archived_rows(NotificationArchive.objects.get())
+        self.assertEqual(row["message"], "Cambio largo")
+        self.assertFalse(NotificationMessage.objects.exists())
+
+
+class DeliveryTransitionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.customer = User.objects.create_user("nora", password="x")
+        cls.manager = User.objects.create_user("oscar", password="x")
+        UserProfile.objects.update_or_create(user=cls.manager, defaults={"role": "manager"})
+        cls.riders = []
+        for name in ("pablo", "paula"):
+            rider = User.objects.create_user(name, password="x")
+            UserProfile.objects.update_or_create(user=rider, defaults={"role": RIDER})
+            cls.riders.append(rider)
+
+    def setUp(self):
+        order = Order.objects.create(user=self.customer, **CHECKOUT_FORM)
+        self.delivery = Delivery.objects.create(order=order, rider=self.riders[0], status="asignada")
+
+    def loads(self):
+        return list(UserProfile.objects.filter(role=RIDER).order_by("user_id").values_list("active_load", flat=True))
+
+    def test_transition_is_one_conditional_update_and_keeps_signals(self):
+        from django.db.models.signals import pre_save
+
+        delivery = Delivery.objects.get(pk=self.delivery.pk)
+        sent = []
+
+        def record(sender, update_fields, **kwargs):
+            sent.append(update_fields)
+
+        pre_save.connect(record, sender=Delivery)
+        self.addCleanup(pre_save.disconnect, record, sender=Delivery)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertTrue(apply_transition(delivery, "en_ruta", notes="Saliendo"))
+        self.assertEqual(sent, [{"status", "updated_at", "version", "notes"}])
+        updates = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith('UPDATE "orders_delivery"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"version" = ', updates[0].split("WHERE")[1])
+        self.assertNotIn("FOR UPDATE", " ".join(q["sql"] for q in ctx.captured_queries))
+        stored = Delivery.objects.get(pk=delivery.pk)
+        self.assertEqual((stored.status, stored.notes, stored.version), ("en_ruta", "Saliendo", delivery.version))
+        self.assertEqual(delivery.changed_fields, set())
+        # post_save sigue ajustando la carga de los repartidores
+        self.assertTrue(apply_transition(delivery, "entregada"))
+        self.assertEqual(self.loads(), [0, 0])
+
+    def test_stale_copy_gets_a_conflict_instead_of_overwriting(self):
+        rider_copy = Delivery.objects.get(pk=self.delivery.pk)
+        manager_copy = Delivery.objects.get(pk=self.delivery.pk)
+        self.assertTrue(apply_transition(manager_copy, "asignada", rider_id=self.riders[1].id))
+        self.assertFalse(apply_transition(rider_copy, "entregada"))
+        # La copia perdedora queda recargada con el cambio ganador
+        self.assertEqual(rider_copy.rider_id, self.riders[1].id)
+        stored = Delivery.objects.get(pk=self.delivery.pk)
+        self.assertEqual((stored.status, stored.rider_id), ("asignada", self.riders[1].id))
+        self.assertEqual(self.loads(), [0, 1])
+
+    def test_conflict_does_not_write_the_uploaded_photo(self):
+        import os
+        import shutil
+        import tempfile
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        stale = Delivery.objects.get(pk=self.delivery.pk)
+        self.assertTrue(apply_transition(Delivery.objects.get(pk=self.delivery.pk), "en_ruta"))
+        with self.settings(MEDIA_ROOT=media_root):
+            photo = SimpleUploadedFile("puerta.jpg", b"jpeg", content_type="image/jpeg")
+            self.assertFalse(apply_transition(stale, "entregada", photo=photo))
+            self.assertEqual([files for _, _, files in os.walk(media_root) if files], [])
+            photo = SimpleUploadedFile("puerta.jpg", b"jpeg", content_type="image/jpeg")
+            self.assertTrue(apply_transition(stale, "entregada", photo=photo))
+            stored = Delivery.objects.get(pk=self.delivery.pk)
+            self.assertTrue(stored.photo.name.startswith("deliveries/"))
+            self.assertTrue(os.path.exists(os.path.join(media_root, stored.photo.name)))
+
+    def test_plain_save_also_invalidates_loaded_versions(self):
+        stale = Delivery.objects.get(pk=self.delivery.pk)
+        fresh = Delivery.objects.get(pk=self.delivery.pk)
+        fresh.notes = "Portería"
+        fresh.save()
+        self.assertFalse(apply_transition(stale, "en_ruta"))
+
+    def test_transitions_not_declared_are_rejected(self):
+        Delivery.objects.filter(pk=self.delivery.pk).update(status="entregada")
+        delivery = Delivery.objects.get(pk=self.delivery.pk)
+        with self.assertRaises(InvalidTransition):
+            apply_transition(delivery, "en_ruta")
+
+    def test_rider_posting_a_stale_form_sees_the_conflict(self):
+        url = reverse("orders:delivery_detail", args=[self.delivery.order_id])
+        self.client.force_login(self.riders[0])
+        form_version = self.client.get(url).context["delivery"].version
+        self.client.force_login(self.manager)
+        self.client.post(url, {"action": "assign", "rider_id": self.riders[1].id, "version": form_version})
+        self.client.force_login(self.riders[0])
+        response = self.client.post(url, {"action": "entregada", "version": form_version}, follow=True)
+        self.assertContains(response, "Otra persona modificó esta entrega")
+        stored = Delivery.objects.get(pk=self.delivery.pk)
+        self.assertEqual((stored.status, stored.rider_id), ("asignada", self.riders[1].id))
+
+    def test_customer_can_reschedule_a_failed_delivery(self):
+        Delivery.objects.filter(pk=self.delivery.pk).update(status="fallida")
+        self.client.force_login(self.customer)
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        self.client.post(
+            reverse("orders:delivery_detail", args=[self.delivery.order_id]),
+            {"action": "reschedule", "scheduled_date": tomorrow.isoformat()},
+        )
+        stored = Delivery.objects.get(pk=self.delivery.pk)
+        self.assertEqual((stored.status, stored.scheduled_date, stored.scheduled_window), ("reprogramada", tomorrow, ""))
+        self.assertEqual(stored.events.get().status_before, "fallida")
+
+
+class QueryPlanTests(TestCase):
+    """
+    Ejecuta las vistas, captura sus SELECT y pide el plan a la base de datos
+    (EXPLAIN QUERY PLAN en SQLite, EXPLAIN en PostgreSQL con ``enable_seqscan``
+    apagado para que tablas de prueba pequeñas no escondan un índice que
+    falta). Falla si alguna consulta recorre una tabla o un índice entero.
+    """
+    SQLITE_FULL_SCAN = re.compile(r"\bSCAN (?!CONSTANT ROW)(\w+)(.*)")
+    POSTGRES_FULL_SCAN = re.compile(r"Seq Scan on (\w+)()")
+    # Únicas consultas que recorren un índice entero a propósito: etiqueta -> (fragmento de su SQL, tabla)
+    ALLOWED_INDEX_SCANS = {
+        "entregas con múltiples fallos, de siempre": (
+            'GROUP BY "orders_deliveryfailurereason"."delivery_id"', "orders_deliveryfailurereason",
+        ),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.customer = User.objects.create_user("quique", password="x")
+        UserProfile.objects.update_or_create(user=cls.customer, defaults={"role": "cliente"})
+        cls.rider = User.objects.create_user("ramon", password="x")
+        UserProfile.objects.update_or_create(user=cls.rider, defaults={"role": RIDER})
+        cls.manager = User.objects.create_user("sara", password="x")
+        UserProfile.objects.update_or_create(user=cls.manager, defaults={"role": "manager"})
+        today = timezone.localdate()
+        for i, status in enumerate(["asignada", "en_ruta", "fallida", "entregada"]):
+            order = Order.objects.create(user=cls.customer, **CHECKOUT_FORM)
+            delivery = Delivery.objects.create(order=order, rider=cls.rider, status=status, scheduled_date=today + timedelta(days=i))
+            DeliveryNotification.objects.create(
+                delivery=delivery, notification_type="approaching", recipient=cls.customer, message=f"Aviso {i}"
+            )
+            if status == "fallida":
+                for attempt in (1, 2):
+                    DeliveryFailureReason.objects.create(
+                        delivery=delivery, reason="cliente_no_responde", reported_by=cls.rider, attempt_number=attempt
+                    )
+        cls.order = order
+
+    def setUp(self):
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def full_scans(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute(f"EXPLAIN {sql}")
+                return self._scanned(sql, self.POSTGRES_FULL_SCAN, "\n".join(row[0] for row in cursor.fetchall()))
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            return self._scanned(sql, self.SQLITE_FULL_SCAN, "\n".join(row[-1] for row in cursor.fetchall()))
+
+    def _scanned(self, sql, pattern, plan):
+        allowed = {table for marker, table in self.ALLOWED_INDEX_SCANS.values() if marker in sql}
+        return [
+            table
+            for table, rest in pattern.findall(plan)
+            if not (table in allowed and rest.startswith(" USING COVERING INDEX"))
+        ]
+
+    def assertQuerysetUsesIndexes(self, queryset):
+        pattern = self.POSTGRES_FULL_SCAN if connection.vendor == "postgresql" else self.SQLITE_FULL_SCAN
+        self.assertEqual([table for table, _ in pattern.findall(queryset.explain())], [])
+
+    def assertViewUsesIndexes(self, user, url):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        selects = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith("SELECT")]
+        self.assertTrue(selects)
+        for sql in selects:
+            with self.subTest(sql=sql):
+                self.assertEqual(self.full_scans(sql), [])
+        return response
+
+    def test_rider_orders(self):
+        self.assertViewUsesIndexes(self.rider, reverse("orders:my_orders"))
+
+    def test_customer_orders(self):
+        self.assertViewUsesIndexes(self.customer, reverse("orders:my_orders"))
+
+    def test_notifications(self):
+        self.assertViewUsesIndexes(self.customer, reverse("orders:notifications"))
+
+    def test_delivery_detail(self):
+        self.assertViewUsesIndexes(self.rider, reverse("orders:delivery_detail", args=[self.order.id]))
+
+    def test_manager_panel_by_status(self):
+        self.assertViewUsesIndexes(self.manager, reverse("orders:panel") + "?status=fallida")
+
+    def test_failure_statistics_by_date(self):
+        since = (timezone.localdate() - timedelta(days=30)).isoformat()
+        response = self.assertViewUsesIndexes(self.manager, reverse("orders:failure_statistics") + f"?date_from={since}")
+        repeated, = response.context["deliveries_with_multiple_failures"]
+        self.assertEqual(repeated.failure_count, 2)
+
+    def test_multiple_failures_ignore_the_date_filter(self):
+        since = (timezone.localdate() + timedelta(days=1)).isoformat()
+        response = self.assertViewUsesIndexes(self.manager, reverse("orders:failure_statistics") + f"?date_from={since}")
+        self.assertEqual(response.context["total_failures"], 0)
+        repeated, = response.context["deliveries_with_multiple_failures"]
+        self.assertEqual(repeated.failure_count, 2)
+
+    def test_catalog_api_conditional_get(self):
+        url = reverse("catalog:api_product_list")
+        etag = self.client.get(url)["ETag"]
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        for sql in [q["sql"] for q in ctx.captured_queries]:
+            with self.subTest(sql=sql):
+                self.assertEqual(self.full_scans(sql), [])
+
+    def test_queries_outside_views(self):
+        today = timezone.localdate()
+        deliveries = list(Delivery.objects.filter(rider=self.rider))
+        riders = list(UserProfile.objects.filter(role=RIDER))
+        with CaptureQueriesContext(connection) as ctx:
+            _slot_usage(riders, deliveries)
+        for sql in [q["sql"] for q in ctx.captured_queries]:
+            with self.subTest(sql=sql):
+                self.assertEqual(self.full_scans(sql), [])
+        # Marcar leídas
+        self.assertQuerysetUsesIndexes(DeliveryNotification.objects.filter(recipient=self.customer, read=False))
+        # Reporte por estado y rango de fechas programadas
+        self.assertQuerysetUsesIndexes(
+            Delivery.objects.filter(status="fallida", scheduled_date__gte=today, scheduled_date__lte=today + timedelta(days=7))
+        )
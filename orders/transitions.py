@@ -0,0 +1,107 @@
+"""
+Máquina de estados de ``Delivery`` con concurrencia optimista.
+
+``TRANSITIONS`` declara una sola vez a qué estados se puede pasar desde
+cada uno. ``apply_transition`` escribe el cambio con un único
+``UPDATE ... WHERE id = ? AND status = ? AND version = ?``: si otra
+petición cambió la entrega desde que se cargó (un repartidor la marca
+entregada mientras un manager la reasigna), el UPDATE no toca ninguna fila
+y el llamador recibe un conflicto en lugar de pisar el cambio ajeno. No se
+bloquea la fila: bajo contención nadie espera, el perdedor reintenta con
+datos frescos.
+
+Se emiten ``pre_save`` antes del UPDATE y ``post_save`` solo si se aplicó,
+como con ``save()``, así que las señales (carga de repartidores, avisos a
+coordinadores) siguen funcionando igual. Los archivos subidos (``photo``)
+se escriben en el storage solo después de que el UPDATE tocó la fila: un
+conflicto no deja archivos huérfanos.
+"""
+from django.db import models, router, transaction
+from django.db.models import F
+from django.db.models.signals import post_save, pre_save
+from django.utils import timezone
+from .models import Delivery
+
+TRANSITIONS = {
+    "pendiente": {"asignada", "reprogramada"},
+    "asignada": {"asignada", "en_ruta", "reprogramada", "fallida", "entregada"},
+    "en_ruta": {"asignada", "en_ruta", "reprogramada", "fallida", "entregada"},
+    "reprogramada": {"asignada", "en_ruta", "reprogramada", "fallida", "entregada"},
+    # Un cliente puede reprogramar una entrega fallida
+    "fallida": {"reprogramada"},
+    "entregada": set(),
+}
+
+
+class InvalidTransition(Exception):
+    def __init__(self, current, target):
+        self.current = current
+        self.target = target
+        super().__init__(f"No se puede pasar de '{current}' a '{target}'")
+
+
+def can_transition(current, target):
+    return target in TRANSITIONS.get(current, ())
+
+
+def apply_transition(delivery, status=None, expected_version=None, **changes):
+    """
+    Pasa ``delivery`` a ``status`` (o lo deja en su estado si es None) y
+    escribe ``changes`` (``rider_id``, ``scheduled_date``, ``notes``...) en el
+    mismo UPDATE condicionado al estado y la versión con que se cargó, o a
+    ``expected_version`` (la que vio el usuario en el formulario). Los
+    archivos se guardan y se escriben después, una vez ganada la fila.
+
+    Devuelve True si se aplicó. Devuelve False si hubo conflicto; entonces
+    ``delivery`` queda recargada con lo que hay en la base de datos. Lanza
+    ``InvalidTransition`` si ``TRANSITIONS`` no permite el cambio de estado.
+    """
+    current = delivery.status
+    version = delivery.version if expected_version is None else expected_version
+    target = status or current
+    if status is not None and not can_transition(current, status):
+        raise InvalidTransition(current, status)
+
+    values = {"status": target, "updated_at": timezone.now()}
+    update_fields = {"status", "updated_at", "version"}
+    file_fields = []
+    for name, value in changes.items():
+        field = Delivery._meta.get_field(name)
+        setattr(delivery, field.attname, value if field.is_relation else field.to_python(value))
+        update_fields.add(field.name)
+        if isinstance(field, models.FileField):
+            # Su pre_save escribe el archivo en el storage: se deja para después del UPDATE
+            file_fields.append(field)
+        else:
+            values[field.attname] = field.pre_save(delivery, False)
+
+    using = router.db_for_write(Delivery, instance=delivery)
+    with transaction.atomic(using=using):
+        pre_save.send(
+            sender=Delivery,
+            instance=delivery,
+            raw=False,
+            using=using,
+            update_fields=frozenset(update_fields),
+        )
+        rows = Delivery.objects.using(using).filter(pk=delivery.pk)
+        updated = rows.filter(status=current, version=version).update(version=F("version") + 1, **values)
+        if not updated:
+            delivery.refresh_from_db()
+            return False
+        if file_fields:
+            # La fila ya es nuestra (bloqueada hasta el commit); si el storage falla se deshace todo
+            rows.update(**{field.attname: field.pre_save(delivery, False) for field in file_fields})
+        delivery.status = target
+        delivery.updated_at = values["updated_at"]
+        delivery.version = version + 1
+        post_save.send(
+            sender=Delivery,
+            instance=delivery,
+            created=False,
+            update_fields=frozenset(update_fields),
+            raw=False,
+            using=using,
+        )
+        delivery._snapshot()
+    return True
@@ -10,6 +10,7 @@ urlpatterns = [
     path("delivery/<int:order_id>/", views.delivery_detail, name="delivery_detail"),
     path("panel/", views.manager_panel, name="panel"),
     path("notifications/", views.notifications, name="notifications"),
+    path("notifications/stream/", views.notification_stream, name="notification_stream"),
     path("report/", views.download_report, name="download_report"),
     path("failure-statistics/", views.failure_statistics, name="failure_statistics"),
 ]
@@ -1,56 +1,97 @@
+import asyncio
+import json
+import uuid
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from django.db.models import Count, Q
 from django.contrib import messages
 from catalog.models import Product
+from catalog.pagination import cursor_querystring
+from accounts.decorators import manager_required
+from accounts.middleware import MANAGER, RIDER
+from cart.services import load_cart
 from .models import Order, OrderItem, Delivery, DeliveryEvent, DeliveryComment, DeliveryNotification, DeliveryFailureReason
+from .events import hub, notification_event
 from .notification_service import DeliveryNotificationService
+from .stock import OutOfStock, reserve_stock
+from .transitions import InvalidTransition, apply_transition, can_transition
+
+
+def _resume_order(request, order):
+    """Respuesta de un checkout repetido: continuar con el pedido ya creado."""
+    if order.paid:
+        return redirect("orders:summary", order_id=order.id)
+    request.session["last_order_id"] = order.id
+    return redirect("payments:simulate")
 
 
 @login_required
 @transaction.atomic
 def checkout(request):
-    cart = request.session.get("cart", {})
+    # Una consulta para todas las líneas; productos desaparecidos se quitan del carrito
+    items, total, removed = load_cart(request)
     if request.method == "POST":
+        # Clave generada al mostrar el formulario; sin ella el envío no es idempotente
+        idempotency_key = request.POST.get("idempotency_key", "").strip()[:64] or uuid.uuid4().hex
+        existing = Order.objects.filter(user=request.user, idempotency_key=idempotency_key).first()
+        if existing:
+            return _resume_order(request, existing)
+
+    if request.method == "POST" and not removed:
         full_name = request.POST.get("full_name")
         email = request.POST.get("email")
         address = request.POST.get("address")
         city = request.POST.get("city")
         postal_code = request.POST.get("postal_code")
 
-        order = Order.objects.create(
-            user=request.user,
-            full_name=full_name,
-            email=email,
-            address=address,
-            city=city,
-            postal_code=postal_code,
-        )
+        lines = [(item["product"], item["quantity"]) for item in items]
 
-        total = 0
-        for pid, item in cart.items():
-            product = get_object_or_404(Product, id=pid)
-            qty = int(item.get("quantity", 1))
-            OrderItem.objects.create(order=order, product=product, price=product.price, quantity=qty)
-            total += product.price * qty
-        order.total_amount = total
-        order.save()
+        try:
+            # Pedido, líneas y reserva de stock en el mismo savepoint: sin stock no queda pedido a medias.
+            # El total ya viene calculado: un INSERT del pedido y uno para todas sus líneas.
+            with transaction.atomic():
+                order = Order.objects.create(
+                    user=request.user,
+                    full_name=full_name,
+                    email=email,
+                    address=address,
+                    city=city,
+                    postal_code=postal_code,
+                    total_amount=total,
+                    idempotency_key=idempotency_key,
+                )
+                OrderItem.objects.bulk_create(
+                    OrderItem(order=order, product=product, price=product.price, quantity=qty)
+                    for product, qty in lines
+                )
+                reserve_stock(order, lines)
+        except IntegrityError:
+            # Envío concurrente con la misma clave: el otro request creó el pedido
+            return _resume_order(request, Order.objects.get(user=request.user, idempotency_key=idempotency_key))
+        except OutOfStock as exc:
+            messages.error(
+                request,
+                f"No hay stock suficiente de {exc.product.name}: quedan {Product.objects.get(pk=exc.product.pk).stock} unidades.",
+            )
+            return redirect("cart:detail")
 
         # Redirigir a simulación de pago
         request.session["last_order_id"] = order.id
         return redirect("payments:simulate")
 
-    # GET: mostrar resumen previo
-    items = []
-    total = 0
-    for pid, item in cart.items():
-        product = get_object_or_404(Product, id=pid)
-        qty = int(item.get("quantity", 1))
-        line_total = product.price * qty
-        total += line_total
-        items.append({"product": product, "quantity": qty, "line_total": line_total})
-    return render(request, "orders/checkout.html", {"items": items, "total": total})
+    # GET (o carrito recién corregido): mostrar resumen previo
+    return render(
+        request,
+        "orders/checkout.html",
+        {"items": items, "total": total, "idempotency_key": uuid.uuid4().hex},
+    )
 
 
 @login_required
@@ -64,11 +105,11 @@ def my_orders(request):
     user = request.user
     if user.is_superuser:
         return redirect("orders:panel")
-    elif hasattr(user, "profile") and user.profile.role == "repartidor":
+    elif request.role == RIDER:
         # Mostrar entregas asignadas al rider
         deliveries = Delivery.objects.select_related("order").filter(rider=user).order_by("-created_at")
         return render(request, "orders/rider_orders.html", {"deliveries": deliveries})
-    elif hasattr(user, "profile") and user.profile.role == "manager":
+    elif request.role == MANAGER:
         return redirect("orders:panel")
     else:
         orders = Order.objects.filter(user=user).order_by("-created_at")
@@ -83,17 +124,26 @@ def my_orders(request):
         return render(request, "orders/my_orders.html", {"orders": orders, "next_delivery": next_delivery})
 
 
+def _transition_or_report(request, delivery, status, **changes):
+    """Aplica la transición; si no procede o hubo conflicto lo explica al usuario y devuelve False."""
+    version = request.POST.get("version", "")
+    try:
+        if apply_transition(delivery, status, int(version) if version.isdigit() else None, **changes):
+            return True
+    except InvalidTransition:
+        messages.error(request, f"No se puede pasar un pedido en estado '{delivery.get_status_display()}' a '{dict(Delivery.STATUS_CHOICES)[status]}'.")
+        return False
+    messages.error(request, f"Otra persona modificó esta entrega mientras tanto (ahora está '{delivery.get_status_display()}'). Revisa los datos y vuelve a intentarlo.")
+    return False
+
+
 @login_required
 def delivery_detail(request, order_id: int):
     order = get_object_or_404(Order, id=order_id)
     delivery, _ = Delivery.objects.get_or_create(order=order)
     # Cliente solo su orden; superuser/manager cualquier orden; rider si está asignado
     # Determine role
-    user_role = None
-    if request.user.is_superuser:
-        user_role = "manager"
-    elif hasattr(request.user, "profile"):
-        user_role = request.user.profile.role
+    user_role = MANAGER if request.user.is_superuser else request.role
 
     if user_role == "manager":
         pass
@@ -134,16 +184,18 @@ def delivery_detail(request, order_id: int):
                 window_changed = new_scheduled_window != old_window
                 rider_changed = rider_id and int(rider_id) != old_rider.id if old_rider else bool(rider_id)
                 
+                changes = {}
                 if new_scheduled_date:
-                    delivery.scheduled_date = new_scheduled_date
+                    changes["scheduled_date"] = new_scheduled_date
                 if new_scheduled_window:
-                    delivery.scheduled_window = new_scheduled_window
-                
+                    changes["scheduled_window"] = new_scheduled_window
                 if rider_id:
-                    delivery.rider_id = int(rider_id)
-                    delivery.status = "asignada"
+                    changes["rider_id"] = int(rider_id)
                 
-                delivery.save()
+                # Marcar para evitar notificación duplicada desde señales
+                delivery._notification_sent = True
+                if not _transition_or_report(request, delivery, "asignada" if rider_id else None, **changes):
+                    return redirect("orders:delivery_detail", order_id=order.id)
                 DeliveryEvent.objects.create(
                     delivery=delivery,
                     user=request.user,
@@ -153,9 +205,6 @@ def delivery_detail(request, order_id: int):
                 )
                 
                 # Notificar a coordinadores sobre cambios
-                # Marcar para evitar notificación duplicada desde señales
-                delivery._notification_sent = True
-                
                 if rider_changed:
                     DeliveryNotificationService.notify_coordinators_rider_assigned(
                         delivery, old_rider=old_rider, changed_by=request.user
@@ -187,12 +236,18 @@ def delivery_detail(request, order_id: int):
                         messages.error(request, "Debe seleccionar una razón del fallo para marcar la entrega como fallida.")
                         return redirect("orders:delivery_detail", order_id=order.id)
                 
-                delivery.status = action
-                delivery.notes = request.POST.get("notes", "")
+                changes = {"notes": request.POST.get("notes", "")}
                 photo_file = request.FILES.get("photo")
                 if photo_file:
-                    delivery.photo = photo_file
-                delivery.save()
+                    changes["photo"] = photo_file
+                if action == "fallida":
+                    # Campo legacy, se mantiene por compatibilidad
+                    changes["failure_reason"] = failure_reason_code
+                else:
+                    # Marcar para evitar notificación duplicada desde señales
+                    delivery._notification_sent = True
+                if not _transition_or_report(request, delivery, action, **changes):
+                    return redirect("orders:delivery_detail", order_id=order.id)
                 
                 DeliveryEvent.objects.create(
                     delivery=delivery,
@@ -206,7 +261,6 @@ def delivery_detail(request, order_id: int):
                 # Si el pedido se marca como fallido, guardar la razón
                 if action == "fallida":
                     from .models import DeliveryFailureReason
-                    failure_reason_code = request.POST.get("failure_reason", "").strip()
                     failure_details = request.POST.get("failure_details", "").strip()
                     
                     # Calcular el número de intento (contar cuántas veces ha fallado antes)
@@ -221,10 +275,6 @@ def delivery_detail(request, order_id: int):
                         attempt_number=attempt_number
                     )
                     
-                    # Actualizar el campo legacy para compatibilidad
-                    delivery.failure_reason = failure_reason_code
-                    delivery.save()
-                    
                     # Construir mensaje para notificaciones
                     failure_reason_display = dict(DeliveryFailureReason.FAILURE_REASONS).get(failure_reason_code, failure_reason_code)
                     failure_message = f"{failure_reason_display}"
@@ -237,9 +287,6 @@ def delivery_detail(request, order_id: int):
                     )
                     messages.success(request, f"Entrega marcada como fallida (Intento #{attempt_number}). El cliente ha sido notificado automáticamente.")
                 else:
-                    # Marcar para evitar notificación duplicada desde señales
-                    delivery._notification_sent = True
-                    
                     # Notificar a coordinadores sobre cambio de estado
                     if before != delivery.status:
                         DeliveryNotificationService.notify_coordinators_status_changed(
@@ -276,7 +323,7 @@ def delivery_detail(request, order_id: int):
             # El cliente puede reprogramar su entrega si está en estado válido
             if action == "reschedule":
                 # Solo permitir reprogramar si el estado lo permite (incluyendo fallidas)
-                if delivery.status in ['pendiente', 'asignada', 'reprogramada', 'fallida']:
+                if can_transition(delivery.status, "reprogramada"):
                     scheduled_date = request.POST.get("scheduled_date")
                     scheduled_window = request.POST.get("scheduled_window")
                     
@@ -290,19 +337,23 @@ def delivery_detail(request, order_id: int):
                             if date_obj < today:
                                 messages.error(request, "No puedes seleccionar una fecha pasada.")
                             else:
+                                before = delivery.status
                                 old_date = delivery.scheduled_date
                                 old_window = delivery.scheduled_window
                                 
-                                delivery.scheduled_date = date_obj
-                                delivery.scheduled_window = scheduled_window if scheduled_window else None
-                                delivery.status = "reprogramada"
-                                delivery.save()
+                                # Marcar para evitar notificación duplicada desde señales
+                                delivery._notification_sent = True
+                                if not _transition_or_report(
+                                    request, delivery, "reprogramada",
+                                    scheduled_date=date_obj, scheduled_window=scheduled_window or "",
+                                ):
+                                    return redirect("orders:delivery_detail", order_id=order.id)
                                 
                                 # Crear evento
                                 DeliveryEvent.objects.create(
                                     delivery=delivery,
                                     user=request.user,
-                                    status_before=delivery.status,
+                                    status_before=before,
                                     status_after="reprogramada",
                                     notes=f"Cliente reprogramó de {old_date} {old_window or ''} a {date_obj} {scheduled_window or ''}"
                                 )
@@ -321,9 +372,6 @@ def delivery_detail(request, order_id: int):
                                         message=notification_message
                                     )
                                 
-                                # Marcar para evitar notificación duplicada desde señales
-                                delivery._notification_sent = True
-                                
                                 # Notificar a coordinadores sobre la reprogramación
                                 DeliveryNotificationService.notify_coordinators_rescheduled(
                                     delivery, old_date=old_date, old_window=old_window, changed_by=request.user
@@ -366,12 +414,8 @@ def delivery_detail(request, order_id: int):
     return render(request, "orders/delivery_client.html", context)
 
 
-@login_required
+@manager_required
 def manager_panel(request):
-    user = request.user
-    if not user.is_superuser and (not hasattr(user, "profile") or user.profile.role != "manager"):
-        return redirect("orders:my_orders")
-
     status = request.GET.get("status", "")
     q = request.GET.get("q", "")
 
@@ -412,37 +456,96 @@ def manager_panel(request):
 
 @login_required
 def notifications(request):
-    """Vista para mostrar las notificaciones del usuario"""
-    notifications = DeliveryNotificationService.get_user_notifications(request.user, limit=20)
+    """Vista para mostrar las notificaciones del usuario (paginadas por cursor)"""
+    cursor = request.GET.get("cursor", "")
     
-    # Marcar notificaciones como leídas si se especifica
+    # Marcar como leídas: una, las seleccionadas o todas (un solo UPDATE)
     if request.method == "POST":
-        notification_id = request.POST.get("notification_id")
-        if notification_id:
-            try:
-                notification = DeliveryNotification.objects.get(
-                    id=notification_id, 
-                    recipient=request.user
-                )
-                DeliveryNotificationService.mark_as_read(notification)
-                messages.success(request, "Notificación marcada como leída.")
-            except DeliveryNotification.DoesNotExist:
+        action = request.POST.get("action")
+        if action == "all":
+            marked = DeliveryNotificationService.mark_read(request.user)
+        elif action == "selected":
+            ids = [value for value in request.POST.getlist("notification_ids") if value.isdigit()]
+            marked = DeliveryNotificationService.mark_read(request.user, ids) if ids else 0
+        else:
+            notification_id = request.POST.get("notification_id", "")
+            marked = DeliveryNotificationService.mark_read(request.user, [notification_id]) if notification_id.isdigit() else 0
+            if not marked:
                 messages.error(request, "Notificación no encontrada.")
+        if marked == 1:
+            messages.success(request, "Notificación marcada como leída.")
+        elif marked:
+            messages.success(request, f"{marked} notificaciones marcadas como leídas.")
         
-        return redirect("orders:notifications")
+        url = reverse("orders:notifications")
+        return redirect(f"{url}?{urlencode({'cursor': cursor})}" if cursor else url)
     
+    page = DeliveryNotificationService.get_notifications_page(request.user, cursor)
     return render(request, "orders/notifications.html", {
-        "notifications": notifications
+        "notifications": page.object_list,
+        "page": page,
+        "cursor": cursor,
+        "next_query": cursor_querystring({}, page.next_cursor) if page.has_next else "",
+        "previous_query": cursor_querystring({}, page.previous_cursor) if page.has_previous else "",
     })
 
 
-@login_required
+# Comentario periódico para que proxies y navegador no cierren la conexión ociosa
+STREAM_HEARTBEAT_SECONDS = 25
+
+
+def _sse(event):
+    return f"id: {event['id']}\nevent: notification\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+def _missed_events(user, last_event_id):
+    return [
+        notification_event(notification)
+        for notification in DeliveryNotificationService.get_notifications_after(user, last_event_id)
+    ]
+
+
+async def _notification_events(user, last_event_id):
+    # Suscribirse antes de reenviar lo perdido: lo que llegue entretanto queda en la cola
+    subscription = hub.subscribe(user.id)
+    _, queue = subscription
+    try:
+        yield "retry: 5000\n\n"
+        if last_event_id:
+            for event in await sync_to_async(_missed_events)(user, last_event_id):
+                yield _sse(event)
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), STREAM_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+            else:
+                yield _sse(event)
+    finally:
+        hub.unsubscribe(user.id, subscription)
+
+
+async def notification_stream(request):
+    """Notificaciones nuevas en vivo (Server-Sent Events); requiere servir con ASGI"""
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponse(status=401)
+    if not isinstance(request, ASGIRequest):
+        # Bajo WSGI la conexión ocuparía un hilo entero: 204 le dice a EventSource que no reintente
+        return HttpResponse(status=204)
+    last_event_id = request.headers.get("Last-Event-ID", "")
+    response = StreamingHttpResponse(
+        _notification_events(user, int(last_event_id) if last_event_id.isdigit() else 0),
+        content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@manager_required
 def download_report(request):
     """Genera y descarga reportes de entregas en Excel o PDF"""
-    user = request.user
-    if not user.is_superuser and (not hasattr(user, "profile") or user.profile.role != "manager"):
-        return redirect("orders:my_orders")
-    
     format_type = request.GET.get("format", "excel")  # excel o pdf
     status = request.GET.get("status", "")
     date_from = request.GET.get("date_from", "")
@@ -623,13 +726,9 @@ def generate_pdf_report(deliveries):
     return response
 
 
-@login_required
+@manager_required
 def failure_statistics(request):
     """Dashboard con estadísticas de causas de fallo en entregas"""
-    user = request.user
-    if not user.is_superuser and (not hasattr(user, "profile") or user.profile.role != "manager"):
-        return redirect("orders:my_orders")
-    
     from django.db.models import Count, Q
     from datetime import datetime, timedelta
     
@@ -687,10 +786,22 @@ def failure_statistics(request):
         count=Count("id")
     ).order_by("-count")[:10]  # Top 10 repartidores
     
-    # Entregas con múltiples fallos
-    deliveries_with_multiple_failures = Delivery.objects.annotate(
-        failure_count=Count("failure_reasons")
-    ).filter(failure_count__gt=1).order_by("-failure_count")[:10]
+    # Entregas con múltiples fallos (de siempre, no solo del rango filtrado).
+    # El GROUP BY se resuelve en SQL recorriendo solo el índice de la FK
+    # delivery_id, que lo cubre; las entregas se cargan en una consulta
+    repeated = (
+        DeliveryFailureReason.objects.values("delivery_id")
+        .annotate(failure_count=Count("id"))
+        .filter(failure_count__gt=1)
+        .order_by("-failure_count", "delivery_id")[:10]
+    )
+    repeated = [(row["delivery_id"], row["failure_count"]) for row in repeated]
+    deliveries_by_id = Delivery.objects.select_related("order").in_bulk([delivery_id for delivery_id, _ in repeated])
+    deliveries_with_multiple_failures = []
+    for delivery_id, failure_count in repeated:
+        delivery = deliveries_by_id[delivery_id]
+        delivery.failure_count = failure_count
+        deliveries_with_multiple_failures.append(delivery)
     
     # Estadísticas por mes (últimos 6 meses) - simplificado
     from django.utils import timezone
@@ -1,8 +1,10 @@
 from django.shortcuts import render, redirect
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count, Q
+from django.db import transaction
 from orders.models import Order, Delivery
-from django.contrib.auth.models import User
+from orders.outbox import enqueue
+from orders.stock import OutOfStock, confirm_order_reservations, release_order_reservations
 
 
 @login_required
@@ -24,28 +26,33 @@ def payment_success(request):
     if not order_id:
         return redirect("catalog:product_list")
     order = Order.objects.get(id=order_id, user=request.user)
-    order.paid = True
-    order.save()
-    # Crear Delivery si no existe
-    delivery, _ = Delivery.objects.get_or_create(order=order)
-    # Auto-asignación: rider con menos entregas activas (no entregada)
-    riders = (
-        User.objects.filter(profile__role="repartidor")
-        .annotate(active_count=Count("deliveries", filter=~Q(deliveries__status="entregada")))
-        .order_by("active_count", "id")
-    )
-    if riders.exists():
-        delivery.rider = riders.first()
-        delivery.status = "asignada"
-        delivery.save()
+    if not order.paid:
+        try:
+            with transaction.atomic():
+                # Si la reserva caducó antes del pago se vuelve a tomar el stock
+                confirm_order_reservations(order)
+                order.paid = True
+                order.save()
+                Delivery.objects.get_or_create(order=order)
+                # Asignación de repartidor y avisos: fuera de la petición (run_worker, o
+                # tras el commit si OUTBOX_INLINE)
+                enqueue("order.paid", order_id=order.id)
+        except OutOfStock as exc:
+            messages.error(request, f"Tu reserva caducó y ya no queda stock de {exc.product.name}.")
+            return redirect("payments:failed")
     # Vaciar carrito
-    request.session["cart"] = {}
-    request.session.modified = True
+    request.cart.clear()
     return redirect("orders:summary", order_id=order.id)
 
 
 @login_required
 def payment_failed(request):
+    order_id = request.session.get("last_order_id")
+    if order_id:
+        order = Order.objects.filter(id=order_id, user=request.user, paid=False).first()
+        if order:
+            # Liberar ya el stock retenido; si se reintenta el pago se vuelve a reservar
+            release_order_reservations(order)
     return render(request, "payments/failed.html", {})
 from django.shortcuts import render
 
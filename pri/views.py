@@ -2,18 +2,17 @@ from django.shortcuts import render, redirect
 from django.http import HttpResponse, Http404
 from django.conf import settings
 from pathlib import Path
+from accounts.middleware import CUSTOMER, MANAGER, RIDER
 
 
 def pri_home(request):
     # Si el usuario tiene rol, lo dirigimos a la vista mock correspondiente
-    if request.user.is_authenticated and hasattr(request.user, "profile"):
-        role = request.user.profile.role
-        if role == "cliente":
-            return redirect("pri:mock_cliente")
-        if role == "repartidor":
-            return redirect("pri:mock_repartidor")
-        if role == "manager":
-            return redirect("pri:mock_dashboard")
+    if request.role == CUSTOMER:
+        return redirect("pri:mock_cliente")
+    if request.role == RIDER:
+        return redirect("pri:mock_repartidor")
+    if request.role == MANAGER:
+        return redirect("pri:mock_dashboard")
     # Fallback a la página puente
     return render(request, "pri/home.html")
 